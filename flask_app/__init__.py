@@ -1,14 +1,12 @@
 import os
-from flask import Flask, flash, render_template, redirect, request, session
-from flask_app import model
+from flask import Flask, abort, flash, jsonify, render_template, redirect, request, session, url_for
+from flask_app import model, assets, autocomplete, health, logs, popularity, ratelimit, snapshot, stats
 import datetime
 from flask_wtf import CSRFProtect, FlaskForm
-from wtforms import BooleanField, StringField, SelectField, PasswordField, DateField, TimeField, IntegerField, EmailField, validators, FileField
+from wtforms import BooleanField, StringField, SelectField, SelectMultipleField, PasswordField, DateField, TimeField, IntegerField, EmailField, validators, FileField
 from flask_session import Session
 from functools import wraps
 from flask_talisman import Talisman
-import pyotp
-from flask_qrcode import QRcode
 from werkzeug.utils import secure_filename
 
 app = Flask(__name__)
@@ -21,17 +19,59 @@ Talisman(app,
     force_https=False,  # Désactive la redirection HTTPS forcée
     content_security_policy={
         'default-src' : '\'none\'',
-        'style-src': [ 'https://cdn.jsdelivr.net/npm/bootstrap@5.2.0/dist/css/bootstrap.min.css' ],
+        'style-src': [ '\'self\'', 'https://cdn.jsdelivr.net/npm/bootstrap@5.2.0/dist/css/bootstrap.min.css' ],
         'img-src' : ['\'self\'', 'data:'],
         'script-src' : '\'none\''
     })
 CSRFProtect(app)
 Session(app)
-QRcode(app)
 
 UPLOAD_FOLDER = os.path.join(os.path.dirname(__file__), 'static')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-
+# Corps de requête refusé (413) avant lecture au-delà de la taille maximale d'une image
+app.config['MAX_CONTENT_LENGTH'] = model.UPLOAD_MAX_BYTES + 64 * 1024
+# Fichiers statiques à empreinte (flask assets build), servis avec un cache longue durée
+app.config['STATIC_ACCEL_REDIRECT'] = os.getenv('STATIC_ACCEL_REDIRECT')
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE') == '1'
+# Pas de rôle en base : les administrateurs sont désignés par e-mail (liste séparée par des virgules)
+app.config['ADMIN_EMAILS'] = {email.strip().lower() for email in os.getenv('ADMIN_EMAILS', '').split(',')
+                              if email.strip()}
+assets.init_app(app)
+# Instantané mmap du catalogue (flask snapshot build), lu si CATALOG_SNAPSHOT_PATH est défini
+app.cli.add_command(snapshot.snapshot_cli)
+# Journaux JSON écrits par un thread dédié (LOG_ACCESS_SAMPLE_RATE pour échantillonner les accès)
+logs.init_app(app)
+# Tentatives de connexion limitées par IP et par e-mail (LOGIN_RATE_LIMIT_IP, LOGIN_RATE_LIMIT_EMAIL)
+limiter = ratelimit.init_app(app)
+# /healthz, /readyz et /metrics sont servis avant Flask (ni session, ni CSRF, ni Talisman)
+# Consultations comptées en mémoire et écrites par lots (VIEW_FLUSH_INTERVAL)
+app.wsgi_app = health.HealthCheckMiddleware(app.wsgi_app,
+                                            metrics=[limiter.metrics, popularity.counter.metrics,
+                                                     app.extensions['logs']['handler'].metrics])
+
+
+# Budget de temps (secondes) des requêtes SQL des pages du catalogue et de la recherche
+CATALOG_TIME_BUDGET = float(os.getenv('CATALOG_TIME_BUDGET', '3'))
+SEARCH_TIME_BUDGET = float(os.getenv('SEARCH_TIME_BUDGET', '1.5'))
+
+
+@app.before_request
+def start_catalog_listener():
+  # Instantané des listes tenu à jour par LISTEN/NOTIFY (un thread par worker) ; le thread
+  # construit aussi l'index des suggestions, sinon un thread dédié s'en charge
+  if not os.getenv('DATABASE_URL'):
+    return
+  if os.getenv('CATALOG_FEED', '1') == '1':
+    model.start_catalog_listener()
+  else:
+    autocomplete.start_build()
+
+
+@app.template_global('qrcode')
+def qrcode(data, **kwargs):
+  """QR code en data URI ; flask_qrcode (et Pillow) ne sont chargés qu'au premier appel"""
+  from flask_qrcode import QRcode
+  return QRcode.qrcode(data, static_dir=app.static_folder, **kwargs)
 
 
 @app.context_processor
@@ -47,37 +87,136 @@ def login_required(func):
   return wrapper
 
 
+@app.template_global('is_admin')
+def is_admin():
+  """Utilisateur connecté dont l'e-mail figure dans ADMIN_EMAILS"""
+  user = session.get('user')
+  return user is not None and user['email'].lower() in app.config['ADMIN_EMAILS']
+
+
+def admin_required(func):
+  @wraps(func)
+  def wrapper(*args, **kwargs):
+    if not 'user' in session:
+      return redirect('/login')
+    if not is_admin():
+      abort(403)
+    return func(*args, **kwargs)
+  return wrapper
+
+
+def database_timeout(exception):
+  """Budget de temps épuisé : page dégradée plutôt qu'un worker bloqué"""
+  app.logger.warning('Budget de temps dépassé sur %s : %s', request.path, exception.__class__.__name__)
+  return render_template('unavailable.html'), 503, {'Retry-After': '5'}
+
+for timeout_error in model.TIMEOUT_ERRORS:
+  app.register_error_handler(timeout_error, database_timeout)
+
+
+@app.errorhandler(413)
+def request_too_large(exception):
+  flash(f'Image trop volumineuse (maximum {model.UPLOAD_MAX_BYTES // 1024} Ko)')
+  return redirect(request.path)
+
+
 @app.route('/', methods=['GET'])
+@model.time_budget(CATALOG_TIME_BUDGET)
 def home():
-    connection = model.connect()
-    lists_of_books = model.get_lists(connection)
-    for book in lists_of_books:
-      print(book)
+    lists_of_books = model.get_lists()
     return render_template('home.html',lists_of_books=lists_of_books)
 
 @app.route('/show_books/<int:id_list_books>', methods=['GET'])
+@model.time_budget(CATALOG_TIME_BUDGET)
 def show_books(id_list_books):
   try :  
-    connection = model.connect()
-    
-    books = model.get_books_in_list(connection, id_list_books)
+    # La connexion n'est ouverte que si l'instantané ne suffit pas
+    books = model.get_books_in_list(None, id_list_books)
+    popularity.record_view('book_lists', id_list_books)
    
     return render_template('books.html', books=books)
+  except model.TIMEOUT_ERRORS:
+    raise
   except Exception as e:
     flash('Liste est vide !')
     return redirect('/')
 
 @app.route('/show_book/<int:id_book>', methods=['GET'])
+@model.time_budget(CATALOG_TIME_BUDGET)
 def show_book(id_book):
-    connection = model.connect()
-    book = model.get_book(connection, id_book)
-    return render_template('book.html', book=book)
+    book = model.get_book(None, id_book)
+    popularity.record_view('books', id_book)
+    try:
+      # Instantané mmap si possible, sinon une connexion ouverte et fermée par le modèle
+      similar_books = model.get_similar_books(None, id_book)
+    except Exception as exception:
+      app.logger.exception(exception)
+      similar_books = []
+    return render_template('book.html', book=book, similar_books=similar_books)
+
+@app.route('/browse', methods=['GET'])
+@model.time_budget(CATALOG_TIME_BUDGET)
+def browse():
+    filters = {
+      'author': request.args.get('author') or None,
+      'genre': request.args.get('genre') or None,
+      'decade': request.args.get('decade', type=int)
+    }
+    filters = {facet: value for facet, value in filters.items() if value is not None}
+    search = request.args.get('q', '').strip() or None
+    # Pagination par clé : identifiant du dernier (after) ou du premier (before) livre affiché
+    after = request.args.get('after', type=int)
+    before = request.args.get('before', type=int)
+    order = request.args.get('order') if request.args.get('order') in model.BROWSE_ORDERS else None
+    with model.connect() as connection:
+      books, has_previous, has_next = model.browse_books(connection, filters, search, after, before,
+                                                         order=order or 'title')
+      if not books and (after is not None or before is not None):
+        # Livre de référence supprimé entre-temps : retour à la première page
+        return redirect(url_for('browse', q=search, order=order, **filters))
+      facets = model.get_facet_counts(connection, filters, search)
+    return render_template('browse.html', books=books, facets=facets, filters=filters, search=search,
+                           order=order, has_previous=has_previous, has_next=has_next)
+
+@app.route('/autocomplete', methods=['GET'])
+@model.time_budget(CATALOG_TIME_BUDGET)
+def autocomplete_books():
+    query = request.args.get('q', '')[:100]
+    limit = min(max(request.args.get('limit', 8, type=int), 1), 20)
+    index = autocomplete.get_index()
+    # Index en construction : suggestions vides plutôt qu'une requête bloquée
+    suggestions = [] if index is None else index.search(query, limit)
+    for suggestion in suggestions:
+      if suggestion['type'] == 'author':
+        suggestion['url'] = url_for('browse', author=suggestion['label'])
+      else:
+        suggestion['url'] = url_for('show_book', id_book=suggestion['book_id'])
+    response = jsonify(query=query, suggestions=suggestions)
+    if index is None:
+      response.cache_control.no_store = True
+      return response
+    response.cache_control.public = True
+    response.cache_control.max_age = 60
+    return response
+
+@app.route('/browse/author/<path:author>', methods=['GET'])
+def browse_author(author):
+    return redirect(url_for('browse', author=author))
+
+@app.route('/browse/genre/<path:genre>', methods=['GET'])
+def browse_genre(genre):
+    return redirect(url_for('browse', genre=genre))
+
+@app.route('/browse/decade/<int:decade>', methods=['GET'])
+def browse_decade(decade):
+    return redirect(url_for('browse', decade=decade))
 
 @app.route('/delete_book/<int:id_book>', methods=['POST'])
 @login_required
 def delete_book(id_book):
     connection = model.connect()
     reponse = model.delete_book(connection, id_book)
+    autocomplete.book_deleted(id_book)
     flash(reponse)
     return redirect('/')
 
@@ -104,6 +243,7 @@ class BookForm(FlaskForm):
     title = StringField('Titre', validators=[validators.DataRequired()])
     author = StringField('Auteur', validators=[validators.DataRequired()])
     genre = SelectField('Catégorie', coerce=int, validators=[validators.DataRequired()])  
+    other_lists = SelectMultipleField('Autres listes', coerce=int, validators=[validators.Optional()])
     isbn = IntegerField('ISBN', validators=[validators.DataRequired()])
     publication_date = StringField('Date de publication', validators=[validators.DataRequired()])
     description = StringField('Description', validators=[validators.DataRequired()])
@@ -111,6 +251,7 @@ class BookForm(FlaskForm):
 
 
 @app.route('/login', methods=['GET', 'POST'])
+@ratelimit.limit_attempts(email=ratelimit.form_email)
 def login():
   form = LoginForm()
   if form.validate_on_submit():
@@ -151,13 +292,15 @@ def change_password():
     try:
       connection = model.connect()
       email = session['user']['email']
-      model.change_password(connection, email, form.old_password.data, form.new_password.data)
       totp_secret = session['totp_secret'] if form.totp_enabled.data else None
-      model.update_totp_secret(connection, session['user']['id'], totp_secret)
+      with model.unit_of_work(connection):
+        model.change_password(connection, email, form.old_password.data, form.new_password.data)
+        model.update_totp_secret(connection, session['user']['id'], totp_secret)
       flash('Mot de passe modifié !')
       return redirect('/')
     except Exception as exception:
       app.log_exception(exception)
+  import pyotp
   totp_secret = pyotp.random_base32()
   session['totp_secret'] = totp_secret
   totp_uri = pyotp.totp.TOTP(totp_secret).provisioning_uri(
@@ -194,6 +337,7 @@ class TotpForm(FlaskForm):
 
 
 @app.route('/totp', methods=['GET', 'POST'])
+@ratelimit.limit_attempts(email=ratelimit.session_email)
 def totp():
   if 'totp_user' not in session:
     return redirect('/')
@@ -204,6 +348,7 @@ def totp():
   form = TotpForm()
   if form.validate_on_submit():
     try:
+      import pyotp
       totp_secret = model.totp_secret(connection, user)
       totp_code = form.totp.data
       if pyotp.TOTP(totp_secret).verify(totp_code):
@@ -215,6 +360,7 @@ def totp():
 
 
 @app.route('/signin', methods=['GET', 'POST'])
+@ratelimit.limit_attempts(email=ratelimit.form_email)
 def signin():
   form = signinForm()
   if form.validate_on_submit():
@@ -227,6 +373,25 @@ def signin():
       app.log_exception(exception)
   return render_template('sign_in.html', form=form)
 
+class PasswordResetForm(FlaskForm):
+  password = PasswordField('password', validators=[validators.DataRequired(),
+                                                   validators.EqualTo('confirm')])
+  confirm = PasswordField('confirm', validators=[validators.DataRequired()])
+
+@app.route('/reset_password/<token>', methods=['GET', 'POST'])
+@ratelimit.limit_attempts()
+def reset_password(token):
+  form = PasswordResetForm()
+  if form.validate_on_submit():
+    try:
+      connection = model.connect()
+      model.reset_password(connection, token, form.password.data)
+      flash('Mot de passe défini, vous pouvez vous connecter !')
+      return redirect('/login')
+    except Exception as exception:
+      app.log_exception(exception)
+  return render_template('reset_password.html', form=form)
+
 @app.route('/list/create', methods=['GET', 'POST'])
 @login_required
 def list_create():
@@ -237,16 +402,13 @@ def list_create():
             image_file = request.files.get('image')
             image_url = None
             if image_file and model.allowed_file(image_file.filename) :
-                if not model.is_valid_image(image_file):
+                try:
+                    # Extension donnée par le format réel de l'image
+                    filename = model.save_upload(image_file, app.config['UPLOAD_FOLDER'],
+                                                 secure_filename(form.name.data))
+                except Exception as exception:
+                    flash(str(exception))
                     return render_template('list_edit.html', form=form)
-                list_name = secure_filename(form.name.data)
-                filename = f"{list_name}.png"
-
-                if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                    os.makedirs(app.config['UPLOAD_FOLDER'])
-
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                image_file.save(image_path)
 
                 image_url = f'/static/{filename}'
             else:
@@ -273,6 +435,7 @@ def book_create():
 
     lists = model.get_lists(connection)
     form.genre.choices = [(lst['id'], lst['list_name']) for lst in lists]  
+    form.other_lists.choices = form.genre.choices
 
     if form.validate_on_submit():
         try:
@@ -280,16 +443,12 @@ def book_create():
             image_file = request.files.get('image')
             image_url = None
             if image_file and model.allowed_file(image_file.filename) :
-                if not model.is_valid_image(image_file):
-                    return render_template('list_edit.html', form=form)
-                book_name = secure_filename(str(form.isbn.data))
-                filename = f"{book_name}.png"
-
-                if not os.path.exists(app.config['UPLOAD_FOLDER']):
-                    os.makedirs(app.config['UPLOAD_FOLDER'])
-
-                image_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                image_file.save(image_path)
+                try:
+                    filename = model.save_upload(image_file, app.config['UPLOAD_FOLDER'],
+                                                 secure_filename(str(form.isbn.data)))
+                except Exception as exception:
+                    flash(str(exception))
+                    return render_template('book_edit.html', form=form)
 
                 image_url = f'/static/{filename}'
             else:
@@ -306,13 +465,13 @@ def book_create():
                 'image_url': image_url
             }
           
-            book_id = model.insert_book(connection, book)
-
-            book_list_relation = {
-                'book_id': book_id,
-                'list_id': form.genre.data
-            }
-            model.insert_book_list_relation(connection, book_list_relation)
+            list_ids = [form.genre.data] + [list_id for list_id in form.other_lists.data
+                                            if list_id != form.genre.data]
+            # Livre et appartenances aux listes : une seule transaction, un seul commit
+            with model.unit_of_work(connection):
+                book_id = model.insert_book(connection, book)
+                model.insert_book_list_relations(connection, book_id, list_ids)
+            autocomplete.book_written(book_id, book['title'], book['author'])
 
             return redirect('/')
         
@@ -323,13 +482,24 @@ def book_create():
     return render_template('book_edit.html', form=form)
 
 
+@app.route('/admin/stats', methods=['GET'])
+@admin_required
+@model.time_budget(CATALOG_TIME_BUDGET)
+def admin_stats():
+    # Calcul NumPy en cache jusqu'au prochain changement du catalogue
+    return render_template('stats.html', stats=stats.get_stats())
+
+
 @app.route('/book/search', methods=['POST'])
+@model.time_budget(SEARCH_TIME_BUDGET)
 def book_search():
     form = BookSearchForm()  
     if form.validate_on_submit():
         try:
             connection = model.connect()
             books=model.searchBook(connection, form.nameBook.data)
+        except model.TIMEOUT_ERRORS:
+            raise
         except Exception as exception:
             app.logger.exception(exception)
             flash("Le livre n'a pas été trouvé !")
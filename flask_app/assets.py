@@ -0,0 +1,180 @@
+"""Fichiers statiques : empreinte, précompression et service avec cache longue durée"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+import click
+from flask import abort, current_app, request, send_file
+from flask.cli import AppGroup
+from werkzeug.security import safe_join
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+COMPRESSIBLE_EXTENSIONS = {'css', 'js', 'mjs', 'svg', 'json', 'txt', 'html', 'map', 'ico'}
+# Ordre de préférence des encodages précompressés
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+DEFAULT_MAX_AGE = 300
+
+assets_cli = AppGroup('assets', help='Gestion des fichiers statiques')
+
+
+def fingerprint(path):
+  """Empreinte courte (sha256) du contenu d'un fichier"""
+  digest = hashlib.sha256()
+  with open(path, 'rb') as file:
+    for chunk in iter(lambda: file.read(65536), b''):
+      digest.update(chunk)
+  return digest.hexdigest()[:12]
+
+
+def fingerprinted_name(relative_path, digest):
+  """'css/app.css' -> 'css/app.<empreinte>.css'"""
+  root, extension = os.path.splitext(relative_path)
+  return f'{root}.{digest}{extension}'
+
+
+def precompress(path):
+  """Écrire les variantes .gz (et .br si brotli est installé) quand elles sont plus petites"""
+  extension = path.rsplit('.', 1)[-1].lower()
+  if extension not in COMPRESSIBLE_EXTENSIONS:
+    return []
+  with open(path, 'rb') as file:
+    data = file.read()
+  variants = [('.gz', gzip.compress(data, compresslevel=9, mtime=0))]
+  if brotli is not None:
+    variants.append(('.br', brotli.compress(data, quality=11)))
+  written = []
+  for suffix, compressed in variants:
+    if len(compressed) < len(data):
+      with open(path + suffix, 'wb') as file:
+        file.write(compressed)
+      written.append(path + suffix)
+  return written
+
+
+def build(static_folder, build_folder):
+  """Copier les fichiers statiques sous un nom à empreinte et écrire le manifeste"""
+  manifest = {}
+  build_folder = os.path.abspath(build_folder)
+  for directory, subdirectories, filenames in os.walk(static_folder):
+    subdirectories[:] = [name for name in subdirectories
+                         if not name.startswith('.')
+                         and os.path.abspath(os.path.join(directory, name)) != build_folder]
+    for filename in filenames:
+      if filename.startswith('.'):
+        continue
+      source = os.path.join(directory, filename)
+      relative_path = os.path.relpath(source, static_folder).replace(os.sep, '/')
+      hashed = fingerprinted_name(relative_path, fingerprint(source))
+      target = os.path.join(build_folder, hashed)
+      os.makedirs(os.path.dirname(target), exist_ok=True)
+      shutil.copy2(source, target)
+      precompress(target)
+      manifest[relative_path] = hashed
+  os.makedirs(build_folder, exist_ok=True)
+  temporary_path = os.path.join(build_folder, MANIFEST_NAME + '.tmp')
+  with open(temporary_path, 'w') as file:
+    json.dump(manifest, file, indent=1, sort_keys=True)
+  os.replace(temporary_path, os.path.join(build_folder, MANIFEST_NAME))
+  return manifest
+
+
+def load_manifest(build_folder):
+  """Lire le manifeste produit par build() (vide s'il n'a pas été construit)"""
+  try:
+    with open(os.path.join(build_folder, MANIFEST_NAME)) as file:
+      return json.load(file)
+  except FileNotFoundError:
+    return {}
+
+
+def init_app(app):
+  """Remplacer la vue /static et activer la réécriture des URL dans les templates"""
+  app.config.setdefault('ASSETS_BUILD_FOLDER', os.path.join(app.root_path, 'static_build'))
+  # Préfixe d'une location interne du serveur web frontal (ex: '/_internal/'),
+  # qui doit pointer vers app.root_path
+  app.config.setdefault('STATIC_ACCEL_REDIRECT', None)
+  manifest = load_manifest(app.config['ASSETS_BUILD_FOLDER'])
+  app.extensions['assets'] = {'manifest': manifest, 'hashed': set(manifest.values())}
+  app.view_functions['static'] = serve_static
+  app.url_defaults(_fingerprint_url_defaults)
+  app.add_template_filter(asset_url, 'asset_url')
+  app.cli.add_command(assets_cli)
+
+
+def _fingerprint_url_defaults(endpoint, values):
+  if endpoint == 'static' and 'filename' in values:
+    manifest = current_app.extensions['assets']['manifest']
+    values['filename'] = manifest.get(values['filename'], values['filename'])
+
+
+def asset_url(url):
+  """Filtre Jinja : '/static/Livre.jpeg' -> '/static/Livre.<empreinte>.jpeg'"""
+  if not url:
+    return url
+  prefix = current_app.static_url_path + '/'
+  if not url.startswith(prefix):
+    return url
+  manifest = current_app.extensions['assets']['manifest']
+  relative_path = url[len(prefix):]
+  return prefix + manifest.get(relative_path, relative_path)
+
+
+def _negotiate_encoding(path):
+  for encoding, suffix in ENCODINGS:
+    if request.accept_encodings[encoding] > 0 and os.path.isfile(path + suffix):
+      return path + suffix, encoding
+  return path, None
+
+
+def serve_static(filename):
+  """Servir un fichier statique (à empreinte : cache immuable et variantes précompressées)"""
+  state = current_app.extensions['assets']
+  immutable = filename in state['hashed']
+  folder = current_app.config['ASSETS_BUILD_FOLDER'] if immutable else current_app.static_folder
+  path = safe_join(folder, filename)
+  if path is None or not os.path.isfile(path):
+    abort(404)
+
+  served_path, encoding = path, None
+  compressible = filename.rsplit('.', 1)[-1].lower() in COMPRESSIBLE_EXTENSIONS
+  if immutable and compressible:
+    served_path, encoding = _negotiate_encoding(path)
+  mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+  max_age = IMMUTABLE_MAX_AGE if immutable else DEFAULT_MAX_AGE
+
+  accel_prefix = current_app.config['STATIC_ACCEL_REDIRECT']
+  if accel_prefix:
+    response = current_app.response_class(mimetype=mimetype)
+    internal_path = os.path.relpath(served_path, current_app.root_path).replace(os.sep, '/')
+    response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + internal_path
+    response.cache_control.max_age = max_age
+  else:
+    # USE_X_SENDFILE est géré directement par send_file
+    response = send_file(served_path, mimetype=mimetype, max_age=max_age, conditional=True)
+
+  response.cache_control.public = True
+  if immutable:
+    response.cache_control.immutable = True
+  if encoding:
+    response.headers['Content-Encoding'] = encoding
+  if compressible:
+    response.vary.add('Accept-Encoding')
+  return response
+
+
+@assets_cli.command('build')
+def build_command():
+  """Construire les fichiers à empreinte et leurs variantes compressées"""
+  app = current_app
+  manifest = build(app.static_folder, app.config['ASSETS_BUILD_FOLDER'])
+  app.extensions['assets'] = {'manifest': manifest, 'hashed': set(manifest.values())}
+  click.echo(f"✓ {len(manifest)} fichiers statiques construits dans {app.config['ASSETS_BUILD_FOLDER']}")
@@ -0,0 +1,184 @@
+"""Suggestions de recherche (titres et auteurs) servies depuis un index en mémoire
+
+L'index est un tableau trié de clés normalisées (minuscules, sans accents) : pour chaque
+titre ou auteur, une clé par mot de départ (« le petit prince », « petit prince », « prince »),
+si bien qu'une saisie retrouve aussi un mot au milieu du titre. Une recherche est une
+dichotomie suivie d'un parcours borné des clés qui commencent par la saisie.
+
+L'index est construit hors des requêtes : par le thread d'écoute du catalogue à chaque
+(re)chargement (model.on_catalog_change), ou par un thread dédié sans flux du catalogue.
+Tant qu'il n'est pas prêt, les suggestions sont vides. Il est ensuite tenu à jour par les
+écritures du worker et par les notifications du catalogue.
+"""
+import bisect
+import logging
+import os
+import re
+import threading
+import time
+import unicodedata
+
+from flask_app import model
+
+WORD = re.compile(r'\w+')
+# Clés examinées au plus par recherche (borne le temps de réponse des saisies très courtes)
+MAX_SCAN = 256
+
+
+def fold(text):
+  """Minuscules sans accents : « Émile Zola » -> « emile zola »"""
+  decomposed = unicodedata.normalize('NFKD', text)
+  return ''.join(character for character in decomposed if not unicodedata.combining(character)).casefold()
+
+
+def _keys(text):
+  """(clé, rang du mot de départ) pour chaque mot du texte"""
+  words = WORD.findall(fold(text or ''))
+  return [(' '.join(words[position:]), position) for position in range(len(words))]
+
+
+class PrefixIndex:
+  """Tableau trié d'entrées (clé, rang du mot, type, libellé, id du livre)"""
+
+  def __init__(self, books=()):
+    self._lock = threading.Lock()
+    self._book_entries = {}
+    entries = []
+    for book_id, title, author in books:
+      book_entries = self._entries(book_id, title, author)
+      self._book_entries[book_id] = book_entries
+      entries.extend(book_entries)
+    entries.sort()
+    self._entries_sorted = entries
+
+  @staticmethod
+  def _entries(book_id, title, author):
+    entries = [(key, position, 'title', title, book_id) for key, position in _keys(title)]
+    entries += [(key, position, 'author', author, book_id) for key, position in _keys(author)]
+    return entries
+
+  def __len__(self):
+    return len(self._book_entries)
+
+  def add_book(self, book_id, title, author):
+    """Ajouter ou remplacer un livre"""
+    with self._lock:
+      self._remove(book_id)
+      book_entries = self._entries(book_id, title, author)
+      self._book_entries[book_id] = book_entries
+      for entry in book_entries:
+        bisect.insort(self._entries_sorted, entry)
+
+  def remove_book(self, book_id):
+    with self._lock:
+      self._remove(book_id)
+
+  def _remove(self, book_id):
+    for entry in self._book_entries.pop(book_id, ()):
+      index = bisect.bisect_left(self._entries_sorted, entry)
+      if index < len(self._entries_sorted) and self._entries_sorted[index] == entry:
+        del self._entries_sorted[index]
+
+  def search(self, query, limit=8):
+    """Suggestions [{'type', 'label', 'book_id'}] : début de titre ou d'auteur d'abord, puis les plus courts"""
+    prefix = ' '.join(WORD.findall(fold(query)))
+    if not prefix:
+      return []
+    with self._lock:
+      start = bisect.bisect_left(self._entries_sorted, (prefix,))
+      candidates = []
+      for entry in self._entries_sorted[start:start + MAX_SCAN]:
+        if not entry[0].startswith(prefix):
+          break
+        candidates.append(entry)
+    candidates.sort(key=lambda entry: (entry[1], len(entry[3]), entry[3], entry[4]))
+    suggestions, seen = [], set()
+    for key, position, kind, label, book_id in candidates:
+      # Un auteur n'est proposé qu'une fois, quel que soit son nombre de livres
+      identity = (kind, label) if kind == 'author' else (kind, book_id)
+      if identity in seen:
+        continue
+      seen.add(identity)
+      suggestions.append({'type': kind, 'label': label, 'book_id': book_id})
+      if len(suggestions) == limit:
+        break
+    return suggestions
+
+
+_index = {'index': None, 'thread': None, 'pid': None}
+_index_lock = threading.Lock()
+
+
+def load_index(connection):
+  with connection.cursor() as cursor:
+    cursor.execute('SELECT id, title, author FROM books')
+    return PrefixIndex(cursor.fetchall())
+
+
+def get_index():
+  """Index du worker, ou None tant qu'il n'est pas construit"""
+  return _index['index']
+
+
+def start_build():
+  """Construire l'index dans un thread (une fois par processus), sans flux du catalogue"""
+  if _index['pid'] == os.getpid():
+    return _index['thread']
+  with _index_lock:
+    if _index['pid'] == os.getpid():
+      return _index['thread']
+    thread = threading.Thread(target=_build, name='autocomplete-index', daemon=True)
+    _index.update(thread=thread, pid=os.getpid())
+    thread.start()
+  return thread
+
+
+def _build():
+  delay = 1
+  while True:
+    try:
+      with model.connect() as connection:
+        _index['index'] = load_index(connection)
+      return
+    except Exception:
+      logging.getLogger(__name__).warning('Échec de la construction de l\'index des suggestions',
+                                          exc_info=True)
+      time.sleep(delay)
+      delay = min(delay * 2, 30)
+
+
+def book_written(book_id, title, author):
+  """Répercuter une écriture faite par ce worker (sans attendre la notification)"""
+  index = _index['index']
+  if index is not None:
+    index.add_book(book_id, title, author)
+
+
+def book_deleted(book_id):
+  index = _index['index']
+  if index is not None:
+    index.remove_book(book_id)
+
+
+@model.on_catalog_change
+def apply_catalog_change(connection, change):
+  """Répercuter les notifications du catalogue (écritures des autres workers)"""
+  if change['op'] == 'RELOAD':
+    # Premier chargement, ou des changements ont pu être manqués : reconstruction complète,
+    # l'index précédent reste servi pendant ce temps
+    _index['index'] = load_index(connection)
+    return
+  index = _index['index']
+  if index is None:
+    return
+  if change['table'] == 'books':
+    if change['op'] == 'DELETE':
+      index.remove_book(change['id'])
+    else:
+      with connection.cursor() as cursor:
+        cursor.execute('SELECT id, title, author FROM books WHERE id = %s', (change['id'],))
+        row = cursor.fetchone()
+      if row is None:
+        index.remove_book(change['id'])
+      else:
+        index.add_book(*row)
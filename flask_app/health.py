@@ -0,0 +1,125 @@
+"""Sondes de vie (/healthz), de disponibilité (/readyz) et compteurs (/metrics)
+
+Elles sont servies par un middleware WSGI placé devant Flask : ni session, ni CSRF,
+ni Talisman, ni rendu de template ne sont exécutés pour une sonde.
+/metrics expose au format texte Prometheus les compteurs des fonctions passées dans `metrics`,
+seulement avec l'en-tête `Authorization: Bearer <METRICS_TOKEN>` (404 si METRICS_TOKEN n'est
+pas défini, 401 sans le bon jeton) : le middleware est placé devant toute authentification.
+"""
+import hmac
+import json
+import os
+import threading
+import time
+
+from werkzeug.wsgi import ClosingIterator
+
+from flask_app import model
+
+
+class HealthCheckMiddleware:
+  """Répondre aux sondes avant Flask et compter les requêtes en cours"""
+
+  def __init__(self, wsgi_app, capacity=None, ping_timeout=2.0, cache_seconds=1.0, metrics=(),
+               metrics_token=None):
+    self.wsgi_app = wsgi_app
+    # Fonctions renvoyant des lignes de métriques supplémentaires
+    self.metrics = list(metrics)
+    # Jeton exigé par /metrics (désactivé si absent)
+    self.metrics_token = metrics_token or os.getenv('METRICS_TOKEN') or None
+    # Nombre de requêtes simultanées qu'un worker peut servir
+    self.capacity = capacity or int(os.getenv('WORKER_CONCURRENCY', '8'))
+    self.ping_timeout = ping_timeout
+    self.cache_seconds = cache_seconds
+    self.require_warm_cache = os.getenv('READY_REQUIRE_WARM_CACHE') == '1'
+    self.in_flight = 0
+    self._lock = threading.Lock()
+    self._ping_connection = None
+    self._last_ping = (float('-inf'), None)
+
+  def __call__(self, environ, start_response):
+    path = environ.get('PATH_INFO', '')
+    if path == '/healthz':
+      return self._respond(start_response, '200 OK', b'ok\n', 'text/plain')
+    if path == '/readyz':
+      ready, report = self.readiness()
+      status = '200 OK' if ready else '503 Service Unavailable'
+      return self._respond(start_response, status, json.dumps(report).encode(), 'application/json')
+    if path == '/metrics':
+      if self.metrics_token is None:
+        return self._respond(start_response, '404 Not Found', b'not found\n', 'text/plain')
+      authorization = environ.get('HTTP_AUTHORIZATION', '')
+      if not hmac.compare_digest(authorization.encode(), f'Bearer {self.metrics_token}'.encode()):
+        return self._respond(start_response, '401 Unauthorized', b'unauthorized\n', 'text/plain')
+      lines = [f'worker_in_flight {self.in_flight}', f'worker_capacity {self.capacity}']
+      for metrics in self.metrics:
+        lines.extend(metrics())
+      body = ('\n'.join(lines) + '\n').encode()
+      return self._respond(start_response, '200 OK', body, 'text/plain; version=0.0.4')
+    with self._lock:
+      self.in_flight += 1
+    released = []
+
+    def release():
+      # Une seule décrémentation : au close() du corps ou si l'application échoue
+      with self._lock:
+        if not released:
+          released.append(True)
+          self.in_flight -= 1
+
+    try:
+      body = self.wsgi_app(environ, start_response)
+    except BaseException:
+      release()
+      raise
+    # La requête reste en cours jusqu'à ce que le serveur ait fini d'envoyer le corps
+    # (réponses en flux, fichiers) et appelé close(), comme l'exige la PEP 3333
+    return ClosingIterator(body, release)
+
+  @staticmethod
+  def _respond(start_response, status, body, content_type):
+    start_response(status, [('Content-Type', content_type),
+                            ('Content-Length', str(len(body))),
+                            ('Cache-Control', 'no-store')])
+    return [body]
+
+  def _ping_database(self):
+    """SELECT 1 sur une connexion dédiée, résultat mis en cache cache_seconds"""
+    checked_at, error = self._last_ping
+    if time.monotonic() - checked_at < self.cache_seconds:
+      return error
+    with self._lock:
+      connection = self._ping_connection
+      self._ping_connection = None
+    try:
+      if connection is None or connection.closed:
+        connection = model.connect(
+          autocommit=True, connect_timeout=max(1, round(self.ping_timeout)),
+          options=f'-c statement_timeout={int(self.ping_timeout * 1000)}')
+      connection.execute('SELECT 1')
+      error = None
+      with self._lock:
+        self._ping_connection = connection
+    except Exception as exception:
+      # Seule la classe de l'erreur est exposée (pas d'hôte ni de nom de base)
+      error = exception.__class__.__name__
+      if connection is not None:
+        connection.close()
+    self._last_ping = (time.monotonic(), error)
+    return error
+
+  def readiness(self):
+    """(prêt ?, rapport) : base joignable, worker non saturé, état de l'instantané"""
+    database_error = self._ping_database()
+    in_flight = self.in_flight
+    warm = model.catalog_lists() is not None
+    ready = (database_error is None and in_flight < self.capacity
+             and (warm or not self.require_warm_cache))
+    report = {
+      'ready': ready,
+      'database': 'ok' if database_error is None else database_error,
+      'in_flight': in_flight,
+      'capacity': self.capacity,
+      'catalog_snapshot': 'warm' if warm else 'cold'
+    }
+    return ready, report
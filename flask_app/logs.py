@@ -0,0 +1,186 @@
+"""Journalisation structurée (JSON) et asynchrone
+
+Les workers ne font que déposer les enregistrements dans une file bornée ; un thread
+d'écriture les sérialise et les écrit sur la sortie standard. Si la file est pleine,
+l'enregistrement est abandonné (et compté, voir /metrics) plutôt que de bloquer la requête.
+Le thread d'écriture est démarré par le premier enregistrement de chaque processus : un
+worker forké après l'import (gunicorn --preload) a son propre thread et sa propre file.
+"""
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+from flask.logging import default_handler
+
+# Champs ajoutés aux enregistrements et repris tels quels dans le JSON
+RECORD_FIELDS = ('request_id', 'route', 'method', 'status', 'duration_ms')
+# X-Request-ID reçu (proxy, client) repris seulement s'il a cette forme ; sinon un identifiant est généré
+REQUEST_ID_PATTERN = re.compile(r'[A-Za-z0-9._-]{1,64}')
+
+
+class JsonFormatter(logging.Formatter):
+  """Un objet JSON par ligne"""
+
+  def format(self, record):
+    entry = {
+      'ts': round(record.created, 3),
+      'level': record.levelname,
+      'logger': record.name,
+      'message': record.getMessage(),
+    }
+    for field in RECORD_FIELDS:
+      value = getattr(record, field, None)
+      if value is not None:
+        entry[field] = value
+    if record.exc_info and not record.exc_text:
+      record.exc_text = self.formatException(record.exc_info)
+    if record.exc_text:
+      entry['exception'] = record.exc_text
+    return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+  """Ajouter l'identifiant de requête et la route (exécuté dans le thread de la requête)"""
+
+  def filter(self, record):
+    if has_request_context():
+      if getattr(record, 'request_id', None) is None:
+        record.request_id = g.get('request_id')
+      if getattr(record, 'route', None) is None:
+        record.route = request.url_rule.rule if request.url_rule else request.path
+      if getattr(record, 'method', None) is None:
+        record.method = request.method
+    return True
+
+
+class SamplingFilter(logging.Filter):
+  """Ne garder qu'une fraction des enregistrements INFO/DEBUG (WARNING et plus : tous)"""
+
+  def __init__(self, rate):
+    super().__init__()
+    self.rate = rate
+
+  def filter(self, record):
+    return record.levelno >= logging.WARNING or random.random() < self.rate
+
+
+class DroppingQueueHandler(QueueHandler):
+  """QueueHandler qui abandonne l'enregistrement quand la file est pleine
+
+  listener : thread d'écriture, démarré au premier enregistrement du processus.
+  """
+
+  def __init__(self, log_queue, listener=None):
+    super().__init__(log_queue)
+    self.dropped = 0
+    self.listener = listener
+    self._exception_formatter = logging.Formatter()
+    self._lock = threading.Lock()
+    self._pid = None
+
+  def start_listener(self):
+    """Démarrer le thread d'écriture dans ce processus (une fois, puis de nouveau après un fork)"""
+    with self._lock:
+      if self.listener is None or self._pid == os.getpid():
+        return
+      if self._pid is not None:
+        # Après un fork, le thread du parent n'existe plus et sa file a pu être copiée verrouillée
+        self.queue = self.listener.queue = queue.Queue(maxsize=self.queue.maxsize)
+        self.listener._thread = None
+      self.listener.start()
+      self._pid = os.getpid()
+
+  def enqueue(self, record):
+    if self._pid != os.getpid():
+      self.start_listener()
+    try:
+      self.queue.put_nowait(record)
+    except queue.Full:
+      self.dropped += 1
+
+  def metrics(self):
+    """Lignes au format texte Prometheus"""
+    return [
+      f'log_queue_size {self.queue.qsize()}',
+      f'log_records_dropped_total {self.dropped}',
+    ]
+
+  def prepare(self, record):
+    # La trace est mise en texte ici : les objets traceback ne quittent pas le thread
+    record = copy.copy(record)
+    record.msg = record.getMessage()
+    record.args = None
+    if record.exc_info:
+      record.exc_text = self._exception_formatter.formatException(record.exc_info)
+    record.exc_info = None
+    return record
+
+
+def stop_listener(listener):
+  """Vider la file puis arrêter le thread d'écriture (sans effet s'il est arrêté ou n'a pas
+  été démarré dans ce processus)"""
+  if listener._thread is not None and listener._thread.is_alive():
+    listener.stop()
+
+
+def init_app(app, stream=None):
+  """Brancher app.logger, le journal d'accès et werkzeug sur la file de journalisation"""
+  log_queue = queue.Queue(maxsize=int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+  stream_handler = logging.StreamHandler(stream or sys.stdout)
+  stream_handler.setFormatter(JsonFormatter())
+  listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+  atexit.register(stop_listener, listener)
+
+  # Pas de thread démarré à l'import : il ne survivrait pas au fork des workers
+  queue_handler = DroppingQueueHandler(log_queue, listener)
+  queue_handler.addFilter(RequestContextFilter())
+
+  app.logger.removeHandler(default_handler)
+  access_logger = logging.getLogger(f'{app.name}.access')
+  # Le serveur de développement journalise déjà chaque requête : seul notre journal d'accès est gardé
+  werkzeug_logger = logging.getLogger('werkzeug')
+  for logger, level in ((app.logger, logging.INFO), (access_logger, logging.INFO),
+                        (werkzeug_logger, logging.WARNING)):
+    for handler in list(logger.handlers):
+      logger.removeHandler(handler)
+    logger.addHandler(queue_handler)
+    logger.setLevel(level)
+    logger.propagate = False
+  access_logger.addFilter(SamplingFilter(float(os.getenv('LOG_ACCESS_SAMPLE_RATE', '1.0'))))
+
+  @app.before_request
+  def start_request_log():
+    request_id = request.headers.get('X-Request-ID', '')
+    g.request_id = request_id if REQUEST_ID_PATTERN.fullmatch(request_id) else uuid.uuid4().hex
+    g.request_started = time.perf_counter()
+
+  @app.after_request
+  def add_request_id(response):
+    if 'request_started' in g:
+      response.headers['X-Request-ID'] = g.request_id
+      g.response_status = response.status_code
+    return response
+
+  @app.teardown_request
+  def write_access_log(exception):
+    # Exécuté après chaque requête, même en échec (exception propagée, after_request en erreur)
+    if 'request_started' in g:
+      duration_ms = round((time.perf_counter() - g.pop('request_started')) * 1000, 2)
+      status = g.get('response_status', 500) if exception is None else 500
+      level = logging.ERROR if exception is not None else logging.INFO
+      access_logger.log(level, '%s %s %s', request.method, request.path, status,
+                        extra={'status': status, 'duration_ms': duration_ms})
+
+  app.extensions['logs'] = {'listener': listener, 'handler': queue_handler}
+  return listener
@@ -1,7 +1,19 @@
+import contextvars
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import math
 import os
+import tempfile
+import threading
+import time
+import weakref
+from contextlib import contextmanager
 import psycopg
 from passlib.hash import scrypt
-from PIL import Image
+from flask_app import snapshot
 
 def dictionary_factory(cursor, row):
   """Factory pour créer des dictionnaires à partir des résultats PostgreSQL"""
@@ -12,18 +24,173 @@ def dictionary_factory(cursor, row):
   return dictionary
 
 
-def connect(database_url=None):
-  """Connexion à la base PostgreSQL"""
+# Échéance (time.monotonic()) du budget de temps en cours et annulations programmées associées
+_deadline = contextvars.ContextVar('deadline', default=None)
+_budget_cancellations = contextvars.ContextVar('budget_cancellations', default=None)
+# Erreurs levées quand le budget est dépassé (statement_timeout, lock_timeout ou annulation)
+TIMEOUT_ERRORS = (psycopg.errors.QueryCanceled, psycopg.errors.LockNotAvailable)
+
+
+@contextmanager
+def time_budget(seconds):
+  """Borner la durée des requêtes des connexions ouvertes dans le bloc (aussi décorateur)
+
+  Imbriqué, c'est le budget le plus court qui s'applique.
+  """
+  deadline = time.monotonic() + seconds
+  current = _deadline.get()
+  if current is not None:
+    deadline = min(deadline, current)
+  deadline_token = _deadline.set(deadline)
+  cancellations_token = _budget_cancellations.set([])
+  try:
+    yield
+  finally:
+    for cancellation in _budget_cancellations.get():
+      _watchdog.unschedule(cancellation)
+    _budget_cancellations.reset(cancellations_token)
+    _deadline.reset(deadline_token)
+
+
+def remaining_budget():
+  """Secondes restantes du budget en cours, ou None hors budget"""
+  deadline = _deadline.get()
+  return None if deadline is None else deadline - time.monotonic()
+
+
+def _cancel_query(connection_reference):
+  connection = connection_reference()
+  if connection is not None and not connection.closed:
+    connection.cancel()
+
+
+class _Watchdog:
+  """Annulation des requêtes à l'échéance de leur budget, par un seul thread par processus
+
+  Les échéances sont dans un tas (time.monotonic(), ordre d'arrivée, connexion) ; une échéance
+  retirée avant son terme est seulement marquée, puis écartée quand elle arrive en tête.
+  """
+
+  def __init__(self):
+    self._condition = threading.Condition()
+    self._heap = []
+    self._sequence = itertools.count()
+    self._pid = None
+
+  def schedule(self, deadline, connection):
+    """Annuler la requête en cours de connection à l'échéance ; retourne l'entrée du tas"""
+    entry = [deadline, next(self._sequence), weakref.ref(connection)]
+    with self._condition:
+      if self._pid != os.getpid():
+        # Après un fork, le thread du parent n'existe plus dans le worker
+        self._heap = []
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name='query-watchdog', daemon=True).start()
+      heapq.heappush(self._heap, entry)
+      if self._heap[0] is entry:
+        self._condition.notify()
+    return entry
+
+  def unschedule(self, entry):
+    with self._condition:
+      entry[2] = None
+
+  def pending(self):
+    with self._condition:
+      return sum(1 for entry in self._heap if entry[2] is not None)
+
+  def _run(self):
+    while True:
+      with self._condition:
+        while True:
+          while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+          if not self._heap:
+            self._condition.wait()
+            continue
+          delay = self._heap[0][0] - time.monotonic()
+          if delay <= 0:
+            connection_reference = heapq.heappop(self._heap)[2]
+            break
+          self._condition.wait(delay)
+      # Hors du verrou : l'annulation est un aller-retour réseau
+      _cancel_query(connection_reference)
+
+
+_watchdog = _Watchdog()
+
+
+def connect(database_url=None, **options):
+  """Connexion à la base PostgreSQL (options transmises à psycopg.connect)
+
+  Dans un budget de temps, statement_timeout et lock_timeout valent le temps restant et la
+  requête en cours est annulée côté client à l'échéance (plusieurs requêtes successives
+  ne peuvent donc pas dépasser le budget à elles toutes).
+  """
   if database_url is None:
     database_url = os.environ.get('DATABASE_URL')
     if not database_url:
       raise Exception("Variable d'environnement DATABASE_URL manquante")
   
-  connection = psycopg.connect(database_url)
+  remaining = remaining_budget()
+  if remaining is not None:
+    if remaining <= 0:
+      raise psycopg.errors.QueryCanceled('Budget de temps de la requête épuisé')
+    milliseconds = max(1, int(remaining * 1000))
+    options['options'] = ' '.join(filter(None, [
+      options.get('options'),
+      f'-c statement_timeout={milliseconds}',
+      f'-c lock_timeout={milliseconds}'
+    ]))
+    options.setdefault('connect_timeout', max(1, math.ceil(remaining)))
+  connection = psycopg.connect(database_url, **options)
   # PostgreSQL n'a pas besoin de PRAGMA foreign_keys, c'est activé par défaut
+  if remaining is not None:
+    _budget_cancellations.get().append(_watchdog.schedule(_deadline.get(), connection))
   return connection
 
 
+# Connexions ayant une unité de travail ouverte -> profondeur d'imbrication
+_units_of_work = weakref.WeakKeyDictionary()
+
+
+@contextmanager
+def unit_of_work(connection):
+  """Regrouper plusieurs écritures dans une seule transaction validée une seule fois
+
+  Imbriquée, l'unité de travail devient un point de sauvegarde (SAVEPOINT).
+  """
+  depth = _units_of_work.get(connection, 0)
+  savepoint = f'unit_of_work_{depth}'
+  _units_of_work[connection] = depth + 1
+  try:
+    if depth:
+      connection.execute(f'SAVEPOINT {savepoint}')
+    try:
+      yield connection
+    except BaseException:
+      if depth:
+        connection.execute(f'ROLLBACK TO SAVEPOINT {savepoint}')
+      else:
+        connection.rollback()
+      raise
+    if depth:
+      connection.execute(f'RELEASE SAVEPOINT {savepoint}')
+    else:
+      connection.commit()
+  finally:
+    if depth:
+      _units_of_work[connection] = depth
+    else:
+      del _units_of_work[connection]
+
+
+def _commit(connection):
+  """Valider, sauf à l'intérieur d'une unité de travail (validée à sa sortie)"""
+  if connection not in _units_of_work:
+    connection.commit()
+
+
 # Fonction read_build_script supprimée - utilisée seulement pour l'initialisation de la BDD
 # Le script est maintenant dans infra/db/build_postgres.sql
 
@@ -52,7 +219,7 @@ def insert_book(connection, book):
             'image_url': book['image_url']
         })
         result = cursor.fetchone()
-        connection.commit()
+        _commit(connection)
         return result[0] if result else None
 
 
@@ -61,24 +228,49 @@ def insert_book_list(connection, book_list):
     sql = '''INSERT INTO book_lists 
              (id, list_name, description, image_url) 
              VALUES 
-             (%(id)s, %(list_name)s, %(description)s, %(image_url)s)'''
+             (COALESCE(%(id)s, nextval(pg_get_serial_sequence('book_lists', 'id'))),
+              %(list_name)s, %(description)s, %(image_url)s)'''
     with connection.cursor() as cursor:
         cursor.execute(sql, book_list)
-        connection.commit()
+        _commit(connection)
 
 def insert_book_list_relation(connection, book_list_relation):
     """Insérer une relation livre-liste dans la base PostgreSQL"""
     sql = '''INSERT INTO book_list_relations 
              (book_id, list_id) 
              VALUES 
-             (%s, %s)'''
+             (%(book_id)s, %(list_id)s)
+             ON CONFLICT DO NOTHING'''
     with connection.cursor() as cursor:
         cursor.execute(sql, book_list_relation)
-        connection.commit()
+        _commit(connection)
+
+
+def insert_book_list_relations(connection, book_id, list_ids):
+    """Ranger un livre dans plusieurs listes en une seule requête"""
+    sql = '''INSERT INTO book_list_relations 
+             (book_id, list_id) 
+             SELECT %s, list_id FROM unnest(%s::INTEGER[]) AS list_id
+             ON CONFLICT DO NOTHING'''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (book_id, list(list_ids)))
+        _commit(connection)
 
 
 def get_book(connection, id):
-  """Récupérer un livre par son ID depuis PostgreSQL"""
+  """Récupérer un livre par son ID (instantané mmap si à jour, sinon PostgreSQL)"""
+  current = fresh_snapshot()
+  if current is not None:
+    book = current.get_book(id)
+    if book is not None:
+      return book
+  if connection is None:
+    with connect() as connection:
+      return _query_book(connection, id)
+  return _query_book(connection, id)
+
+def _query_book(connection, id):
+  """Lecture d'un livre par clé primaire"""
   sql = '''
           SELECT * FROM books
     WHERE id = %s; 
@@ -94,10 +286,67 @@ def get_book(connection, id):
       'image_url': book[7]
     }
 
-def get_lists(connection):
-    """Récupérer toutes les listes de livres depuis PostgreSQL"""
+def get_similar_books(connection, book_id, limit=6):
+    """Recommandations précalculées d'un livre (instantané mmap si à jour, sinon book_neighbours)
+
+    Sans connexion fournie, une connexion n'est ouverte (puis fermée) que si l'instantané ne
+    suffit pas.
+    """
+    current = fresh_snapshot()
+    if current is not None:
+        books = current.get_similar_books(book_id, limit)
+        if books is not None:
+            return books
+    if connection is None:
+        with connect() as connection:
+            return _query_similar_books(connection, book_id, limit)
+    return _query_similar_books(connection, book_id, limit)
+
+def _query_similar_books(connection, book_id, limit):
+    """Lecture par clé primaire de book_neighbours"""
     sql = '''
-        SELECT * FROM book_lists;
+        SELECT books.* FROM book_neighbours
+        INNER JOIN books ON books.id = book_neighbours.neighbour_id
+        WHERE book_neighbours.book_id = %s
+        ORDER BY book_neighbours.rank
+        LIMIT %s;
+    '''
+    with connection.cursor() as cursor:
+        cursor.execute(sql, (book_id, limit))
+        books = cursor.fetchall()
+        return [
+            {
+                'id': book[0], 
+                'title': book[1], 
+                'author': book[2], 
+                'genre': book[3],
+                'publication_date': book[4], 
+                'isbn': book[5], 
+                'description': book[6], 
+                'image_url': book[7]
+            } for book in books
+        ]
+
+def get_lists(connection=None):
+    """Récupérer toutes les listes de livres (instantané en mémoire, puis mmap, si disponible)"""
+    lists = catalog_lists()
+    if lists is None:
+        current = fresh_snapshot()
+        lists = None if current is None else current.get_lists()
+    if lists is not None:
+        if not lists:
+            raise Exception('Aucune liste trouvée')
+        return lists
+    if connection is None:
+        with connect() as connection:
+            return _query_lists(connection)
+    return _query_lists(connection)
+
+def _query_lists(connection):
+    """Lecture des listes, les plus consultées d'abord"""
+    sql = '''
+        SELECT * FROM book_lists
+        ORDER BY view_count DESC, id;
     '''
     with connection.cursor() as cursor:
         cursor.execute(sql)
@@ -117,14 +366,40 @@ def get_lists(connection):
         ]
 
 def get_books_in_list(connection, list_id):
-    """Récupérer les livres d'une liste depuis PostgreSQL"""
-    sql = '''
-        SELECT books.* FROM books
-        INNER JOIN book_list_relations ON books.id = book_list_relations.book_id
-        WHERE book_list_relations.list_id = %s;
-    '''
+    """Récupérer les livres d'une liste (instantané mmap si à jour, sinon PostgreSQL)"""
+    current = fresh_snapshot()
+    if current is not None:
+        books = current.get_books_in_list(list_id)
+        if books:
+            return books
+    if connection is None:
+        with connect() as connection:
+            return _query_books_in_list(connection, list_id)
+    return _query_books_in_list(connection, list_id)
+
+def _query_books_in_list(connection, list_id):
+    """Lecture des livres d'une liste (membres connus de l'instantané en mémoire, sinon jointure)"""
+    book_ids = catalog_book_ids(list_id)
+    if book_ids is not None:
+        # L'instantané donne les membres : simple lecture par clé primaire
+        if not book_ids:
+            raise Exception('Aucun livre trouvé pour cette liste.')
+        sql = '''
+            SELECT * FROM books
+            WHERE id = ANY(%s)
+            ORDER BY view_count DESC, id;
+        '''
+        parameters = (book_ids,)
+    else:
+        sql = '''
+            SELECT books.* FROM books
+            INNER JOIN book_list_relations ON books.id = book_list_relations.book_id
+            WHERE book_list_relations.list_id = %s
+            ORDER BY books.view_count DESC, books.id;
+        '''
+        parameters = (list_id,)
     with connection.cursor() as cursor:
-        cursor.execute(sql, (list_id,))
+        cursor.execute(sql, parameters)
         books = cursor.fetchall()
         
         if not books:
@@ -188,6 +463,10 @@ def check_password_strength(password):
                     un chiffre, une minuscule, une majuscule et un caractère spécial''')
 
 
+# Hash des comptes provisionnés sans mot de passe (jeton de réinitialisation) : ne valide rien
+LOCKED_PASSWORD = '!'
+
+
 def hash_password(password):
   check_password_strength(password)
   return scrypt.using(salt_size=16).hash(password)
@@ -205,7 +484,7 @@ def add_user(connection, name, email, password):
   '''
   with connection.cursor() as cursor:
     cursor.execute(sql, (name, email, password_hash))
-    connection.commit()
+    _commit(connection)
 
 
 def get_user(connection, email, password):
@@ -220,7 +499,7 @@ def get_user(connection, email, password):
     if not user:
       raise Exception('Utilisateur inconnu')
     password_hash = user[3]  # password_hash est à l'index 3
-    if not scrypt.verify(password, password_hash):
+    if password_hash == LOCKED_PASSWORD or not scrypt.verify(password, password_hash):
       raise Exception('Utilisateur inconnu')
     return {'id': user[0], 'email': user[2], 'name': user[1]}
 
@@ -236,7 +515,33 @@ def change_password(connection, email, old_password, new_password):
   '''
   with connection.cursor() as cursor:
     cursor.execute(sql, (password_hash, user['id']))
-    connection.commit()
+    _commit(connection)
+
+
+def reset_password(connection, token, new_password):
+  """Définir le mot de passe à partir d'un jeton de réinitialisation (usage unique)
+
+  Le jeton est vérifié (et verrouillé) avant le hachage : un jeton invalide ne coûte
+  aucun calcul scrypt.
+  """
+  token_hash = hashlib.sha256(token.encode()).hexdigest()
+  with unit_of_work(connection):
+    with connection.cursor() as cursor:
+      cursor.execute('''
+        SELECT user_id FROM password_reset_tokens
+        WHERE token_hash = %s AND expires_at > now()
+        FOR UPDATE
+      ''', (token_hash,))
+      row = cursor.fetchone()
+      if not row:
+        raise Exception('Lien de réinitialisation invalide ou expiré')
+      password_hash = hash_password(new_password)
+      cursor.execute('''
+        WITH consumed AS (
+          DELETE FROM password_reset_tokens WHERE token_hash = %s RETURNING user_id
+        )
+        UPDATE users SET password_hash = %s FROM consumed WHERE users.id = consumed.user_id
+      ''', (token_hash, password_hash))
 
 
 def update_totp_secret(connection, user_id, totp_secret):
@@ -248,7 +553,7 @@ def update_totp_secret(connection, user_id, totp_secret):
   '''
   with connection.cursor() as cursor:
     cursor.execute(sql, (totp_secret, user_id))
-    connection.commit()
+    _commit(connection)
 
 
 def totp_enabled(connection, user):
@@ -281,6 +586,7 @@ def searchBook(connection, nameBook):
   sql = '''
           SELECT * FROM books
     WHERE title ILIKE %s
+    ORDER BY view_count DESC, title
   '''
   with connection.cursor() as cursor:
     cursor.execute(sql, (f'%{nameBook}%',))
@@ -299,19 +605,223 @@ def searchBook(connection, nameBook):
             'image_url': book[7]
         } for book in books
     ]
+# Facettes de navigation : nom -> colonne ou expression indexée de books (migration 0003)
+FACETS = {'author': 'author', 'genre': 'genre', 'decade': 'book_decade(publication_date)'}
+BROWSE_PAGE_SIZE = 24
+# Ordres de la navigation : nom -> (colonnes de la clé, sens commun)
+# (index idx_books_title_id, idx_books_view_count_id)
+BROWSE_ORDERS = {'title': (('title', 'id'), 'ASC'), 'popular': (('view_count', 'id'), 'DESC')}
+
+
+def _facet_filters(filters, search):
+  """Clause WHERE et paramètres pour les facettes sélectionnées et la recherche"""
+  clauses = []
+  parameters = []
+  for facet, column in FACETS.items():
+    if filters.get(facet) not in (None, ''):
+      clauses.append(f'{column} = %s')
+      parameters.append(filters[facet])
+  if search:
+    clauses.append('title ILIKE %s')
+    parameters.append(f'%{search}%')
+  where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+  return where, parameters
+
+
+def browse_books(connection, filters, search=None, after=None, before=None, page_size=BROWSE_PAGE_SIZE,
+                 order='title'):
+  """Livres filtrés par facettes, paginés par clé ; renvoie (livres, page précédente ?, page suivante ?)
+
+  after (ou before) est l'identifiant du dernier (ou du premier) livre de la page affichée :
+  la page suivante (ou précédente) se lit dans l'index à partir de sa clé, sans OFFSET.
+  """
+  columns, direction = BROWSE_ORDERS[order]
+  key = ', '.join(columns)
+  where, parameters = _facet_filters(filters, search)
+  clauses = [where[len('WHERE '):]] if where else []
+  backward = before is not None
+  # Page précédente : parcours en sens inverse, puis remise dans l'ordre d'affichage
+  ascending = (direction == 'ASC') != backward
+  if after is not None or backward:
+    clauses.append(f'({key}) {">" if ascending else "<"} (SELECT {key} FROM books WHERE id = %s)')
+    parameters = parameters + [before if backward else after]
+  where = 'WHERE ' + ' AND '.join(clauses) if clauses else ''
+  order_by = ', '.join(f'{column} {"ASC" if ascending else "DESC"}' for column in columns)
+  sql = f'''
+    SELECT * FROM books
+    {where}
+    ORDER BY {order_by}
+    LIMIT %s
+  '''
+  with connection.cursor() as cursor:
+    # Une ligne de plus que la page suffit à savoir s'il existe une page au-delà
+    cursor.execute(sql, parameters + [page_size + 1])
+    books = cursor.fetchall()
+  more = len(books) > page_size
+  books = books[:page_size]
+  if backward:
+    books.reverse()
+    has_previous, has_next = more, True
+  else:
+    has_previous, has_next = after is not None, more
+  return [
+      {
+          'id': book[0],
+          'title': book[1],
+          'author': book[2],
+          'genre': book[3],
+          'publication_date': book[4],
+          'isbn': book[5],
+          'description': book[6],
+          'image_url': book[7]
+      } for book in books
+  ], has_previous, has_next
+
+
+def get_facet_counts(connection, filters, search=None, limit=20):
+  """Compteurs par facette : {'author': [(valeur, nombre)], 'genre': ..., 'decade': ...}"""
+  where, parameters = _facet_filters(filters, search)
+  selected = [facet for facet in FACETS if filters.get(facet) not in (None, '')]
+  if not parameters:
+    # Catalogue complet : agrégats précalculés de book_facets (index facet, book_count)
+    subqueries = ['''(SELECT facet, value, book_count FROM book_facets
+                      WHERE facet = %s ORDER BY book_count DESC, value LIMIT %s)'''] * len(FACETS)
+    parameters = []
+    for facet in FACETS:
+      parameters += [facet, limit]
+  elif len(selected) == 1 and not search:
+    # Une seule facette : compteurs croisés précalculés de book_facet_pairs (migration 0012)
+    selected_facet = selected[0]
+    value = str(filters[selected_facet])
+    subqueries, parameters = [], []
+    for facet in FACETS:
+      if facet == selected_facet:
+        subqueries.append('(SELECT facet, value, book_count FROM book_facets WHERE facet = %s AND value = %s)')
+        parameters += [facet, value]
+      else:
+        subqueries.append('''(SELECT other_facet, other_value, book_count FROM book_facet_pairs
+                              WHERE facet = %s AND value = %s AND other_facet = %s
+                              ORDER BY book_count DESC, other_value LIMIT %s)''')
+        parameters += [selected_facet, value, facet, limit]
+  else:
+    # Plusieurs facettes ou recherche : regroupement limité aux lignes sélectionnées par les
+    # index (intersection des facettes, index trigramme du titre)
+    subquery = f'''(SELECT %s, {{column}}::TEXT, COUNT(*) FROM books {where}
+                    AND {{column}} IS NOT NULL
+                    GROUP BY {{column}} ORDER BY COUNT(*) DESC, {{column}} LIMIT %s)'''
+    subqueries = [subquery.format(column=column) for column in FACETS.values()]
+    filter_parameters = parameters
+    parameters = []
+    for facet in FACETS:
+      parameters += [facet] + filter_parameters + [limit]
+  sql = '\nUNION ALL\n'.join(subqueries)
+  counts = {facet: [] for facet in FACETS}
+  with connection.cursor() as cursor:
+    cursor.execute(sql, parameters)
+    for facet, value, book_count in cursor.fetchall():
+      counts[facet].append((value, book_count))
+  counts['decade'].sort(key=lambda item: int(item[0]))
+  return counts
+
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def is_valid_image(file):
+# Limites des images téléversées : octets et pixels, vérifiés pendant la copie
+UPLOAD_MAX_BYTES = int(os.getenv('UPLOAD_MAX_BYTES', str(5 * 1024 * 1024)))
+UPLOAD_MAX_PIXELS = int(os.getenv('UPLOAD_MAX_PIXELS', str(25_000_000)))
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Au-delà, un JPEG dont l'en-tête ne donne pas encore les dimensions est refusé
+IMAGE_HEADER_LIMIT = 256 * 1024
+# Marqueurs JPEG Start Of Frame (ni DHT C4, ni JPG C8, ni DAC CC)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def sniff_image(header):
+    """(format, largeur, hauteur) lus dans l'en-tête, ou None s'il faut plus d'octets
+
+    Seuls les octets d'en-tête sont lus : aucune image n'est décodée.
+    """
+    if header.startswith(b'\x89PNG\r\n\x1a\n'):
+        if len(header) < 24:
+            return None
+        if header[12:16] != b'IHDR':
+            raise Exception('Image PNG invalide')
+        return 'png', int.from_bytes(header[16:20], 'big'), int.from_bytes(header[20:24], 'big')
+    if header[:6] in (b'GIF87a', b'GIF89a'):
+        if len(header) < 10:
+            return None
+        return 'gif', int.from_bytes(header[6:8], 'little'), int.from_bytes(header[8:10], 'little')
+    if header.startswith(b'\xff\xd8'):
+        position = 2
+        while True:
+            # Octets de remplissage 0xFF autorisés avant un marqueur
+            while header[position:position + 2] == b'\xff\xff':
+                position += 1
+            if position + 4 > len(header):
+                return None
+            if header[position] != 0xFF:
+                raise Exception('Image JPEG invalide')
+            marker = header[position + 1]
+            if marker in JPEG_SOF_MARKERS:
+                if position + 9 > len(header):
+                    return None
+                return ('jpeg', int.from_bytes(header[position + 7:position + 9], 'big'),
+                        int.from_bytes(header[position + 5:position + 7], 'big'))
+            if marker in (0xD9, 0xDA):
+                # Fin d'image ou données compressées avant le Start Of Frame
+                raise Exception('Image JPEG invalide')
+            if marker == 0x01 or 0xD0 <= marker <= 0xD7:
+                position += 2
+            else:
+                position += 2 + int.from_bytes(header[position + 2:position + 4], 'big')
+    raise Exception("Format d'image non pris en charge (PNG, JPEG ou GIF)")
+
+
+def save_upload(file, directory, name, max_bytes=UPLOAD_MAX_BYTES, max_pixels=UPLOAD_MAX_PIXELS):
+    """Enregistrer une image téléversée sous directory/name.<format réel> ; retourne le nom du fichier
+
+    Le flux est copié par blocs dans un fichier temporaire du dossier cible : la taille est
+    contrôlée au fil de la copie, le format et les dimensions dès les premiers blocs, puis
+    le fichier est publié par un seul os.replace().
+    """
+    os.makedirs(directory, exist_ok=True)
+    descriptor, temporary_path = tempfile.mkstemp(dir=directory, prefix='.upload-')
     try:
-        img = Image.open(file)
-        img.verify()  
-        file.seek(0)  
-        return True
-    except (IOError, SyntaxError) as e:
-        return False
+        with os.fdopen(descriptor, 'wb') as output:
+            header, info, size = b'', None, 0
+            while True:
+                chunk = file.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise Exception(f'Image trop volumineuse (maximum {max_bytes // 1024} Ko)')
+                if info is None:
+                    header += chunk
+                    info = sniff_image(header)
+                    if info is None and len(header) > IMAGE_HEADER_LIMIT:
+                        raise Exception("En-tête d'image trop long")
+                    if info is not None:
+                        _, width, height = info
+                        if not width or not height:
+                            raise Exception('Image invalide')
+                        # Refus avant toute décompression (bombe de décompression)
+                        if width * height > max_pixels:
+                            raise Exception(f'Image trop grande ({width}×{height} pixels)')
+                output.write(chunk)
+            if info is None:
+                raise Exception('Image invalide')
+            output.flush()
+            os.fsync(output.fileno())
+        filename = f'{name}.{info[0]}'
+        os.replace(temporary_path, os.path.join(directory, filename))
+        return filename
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
 
 def delete_book(connection, id_book):
   """Supprimer un livre et ses relations dans PostgreSQL"""
@@ -330,14 +840,231 @@ def delete_book(connection, id_book):
           cursor.execute(sql, (id_book,))
           
           if cursor.rowcount > 0:
-              connection.commit()
+              _commit(connection)
               return "Le livre a été supprimé."
           else:
               return "Le livre n'a pas été supprimé!"
   except Exception as e:
+      if connection in _units_of_work:
+          raise
       connection.rollback()
       return "Le livre n'a pas été supprimé!"
   
  
 
 
+# Instantané du catalogue maintenu par LISTEN/NOTIFY (voir infra/db/build_postgres.sql)
+CATALOG_CHANNEL = 'catalog_changes'
+# db_version : dernière valeur connue de catalog_version en base (migration 0011)
+_catalog = {'ready': False, 'lists': {}, 'members': {}, 'list_views': {}, 'version': 0, 'db_version': 0}
+_catalog_lock = threading.Lock()
+_catalog_listener = {'thread': None, 'pid': None}
+# Fonctions appelées après chaque changement du catalogue (index dérivés, voir on_catalog_change)
+_catalog_callbacks = []
+
+
+def on_catalog_change(callback):
+  """Appeler callback(connection, change) après chaque notification appliquée
+
+  change vaut {'table': None, 'op': 'RELOAD'} quand l'instantané est (re)chargé : des
+  changements ont pu être manqués. Utilisable comme décorateur.
+  """
+  _catalog_callbacks.append(callback)
+  return callback
+
+
+def _notify_catalog_callbacks(connection, change):
+  for callback in _catalog_callbacks:
+    try:
+      callback(connection, change)
+    except Exception:
+      # Un index dérivé en échec ne doit pas interrompre l'écoute des changements
+      logging.getLogger(__name__).exception('Échec de %r sur %r', callback, change)
+
+
+def load_catalog_snapshot(connection):
+  """Charger les listes, l'index liste -> livres, les consultations des listes et la version
+
+  La version est lue en premier : tout changement qu'elle ne couvre pas sera notifié.
+  """
+  with connection.cursor() as cursor:
+    cursor.execute('SELECT version FROM catalog_version')
+    db_version = cursor.fetchone()[0]
+    cursor.execute('SELECT id, list_name, description, image_url, view_count FROM book_lists ORDER BY id')
+    rows = cursor.fetchall()
+    lists = {
+      row[0]: {'id': row[0], 'list_name': row[1], 'description': row[2], 'image_url': row[3]}
+      for row in rows
+    }
+    list_views = {row[0]: row[4] for row in rows}
+    cursor.execute('SELECT list_id, book_id FROM book_list_relations')
+    members = {}
+    for list_id, book_id in cursor.fetchall():
+      members.setdefault(list_id, set()).add(book_id)
+  return lists, members, list_views, db_version
+
+
+def apply_catalog_change(connection, payload):
+  """Appliquer une notification à l'instantané (connection sert à relire une liste)"""
+  change = json.loads(payload)
+  table, operation = change['table'], change['op']
+  if table == 'book_lists' and operation != 'DELETE':
+    with connection.cursor() as cursor:
+      cursor.execute('SELECT id, list_name, description, image_url, view_count FROM book_lists WHERE id = %s',
+                     (change['id'],))
+      row = cursor.fetchone()
+  with _catalog_lock:
+    if table == 'book_lists':
+      if operation == 'DELETE' or row is None:
+        _catalog['lists'].pop(change['id'], None)
+        _catalog['members'].pop(change['id'], None)
+        _catalog['list_views'].pop(change['id'], None)
+      else:
+        _catalog['lists'][row[0]] = {
+          'id': row[0], 'list_name': row[1], 'description': row[2], 'image_url': row[3]
+        }
+        _catalog['list_views'][row[0]] = row[4]
+    elif table == 'book_list_relations':
+      members = _catalog['members'].setdefault(change['list_id'], set())
+      if operation == 'DELETE':
+        members.discard(change['book_id'])
+      else:
+        members.add(change['book_id'])
+    elif table == 'books' and operation == 'DELETE':
+      for members in _catalog['members'].values():
+        members.discard(change['id'])
+    _catalog['version'] += 1
+    _catalog['db_version'] = max(_catalog['db_version'], change.get('version', 0))
+  _notify_catalog_callbacks(connection, change)
+  return change
+
+
+def _listen_catalog_changes(database_url):
+  delay = 1
+  while True:
+    try:
+      # notifies() bloque sa connexion : les relectures passent par une seconde connexion.
+      # Les deux sont fermées en sortie de bloc, y compris sur erreur avant la reconnexion.
+      with connect(database_url) as connection, connect(database_url) as query_connection:
+        connection.autocommit = True
+        query_connection.autocommit = True
+        # LISTEN avant le chargement : aucun changement ne peut être manqué
+        connection.execute(f'LISTEN {CATALOG_CHANNEL}')
+        lists, members, list_views, db_version = load_catalog_snapshot(query_connection)
+        with _catalog_lock:
+          _catalog.update(lists=lists, members=members, list_views=list_views, db_version=db_version,
+                          ready=True)
+          _catalog['version'] += 1
+        _notify_catalog_callbacks(query_connection, {'table': None, 'op': 'RELOAD'})
+        delay = 1
+        for notify in connection.notifies():
+          apply_catalog_change(query_connection, notify.payload)
+    except Exception:
+      with _catalog_lock:
+        _catalog['ready'] = False
+      time.sleep(delay)
+      delay = min(delay * 2, 30)
+
+
+def start_catalog_listener(database_url=None):
+  """Démarrer (une fois par processus) le thread abonné aux changements du catalogue"""
+  thread = _catalog_listener['thread']
+  if thread is not None and thread.is_alive() and _catalog_listener['pid'] == os.getpid():
+    return thread
+  with _catalog_lock:
+    thread = _catalog_listener['thread']
+    if thread is not None and thread.is_alive() and _catalog_listener['pid'] == os.getpid():
+      return thread
+    # Après un fork, le thread du parent n'existe plus dans le worker
+    _catalog['ready'] = False
+    thread = threading.Thread(target=_listen_catalog_changes, args=(database_url,),
+                              name='catalog-listener', daemon=True)
+    thread.start()
+    _catalog_listener.update(thread=thread, pid=os.getpid())
+  return thread
+
+
+def catalog_lists():
+  """Listes depuis l'instantané, les plus consultées d'abord, ou None s'il n'est pas à jour"""
+  with _catalog_lock:
+    if not _catalog['ready']:
+      return None
+    list_views = _catalog['list_views']
+    lists = sorted(_catalog['lists'].values(),
+                   key=lambda book_list: (-list_views.get(book_list['id'], 0), book_list['id']))
+    return [dict(book_list) for book_list in lists]
+
+
+def catalog_version():
+  """Version de l'instantané (incrémentée à chaque changement), ou None s'il n'est pas à jour"""
+  with _catalog_lock:
+    return _catalog['version'] if _catalog['ready'] else None
+
+
+def update_list_view_counts(view_counts):
+  """Reporter les totaux {list_id: view_count} écrits par le vidage des compteurs
+
+  Les vidages ne sont pas notifiés (voir la migration 0009) : l'ordre des listes suit les
+  consultations de ce worker et celles relues au chargement de l'instantané.
+  """
+  with _catalog_lock:
+    for list_id, view_count in view_counts.items():
+      if list_id in _catalog['lists']:
+        _catalog['list_views'][list_id] = view_count
+
+
+def catalog_book_ids(list_id):
+  """Identifiants des livres d'une liste depuis l'instantané, ou None"""
+  with _catalog_lock:
+    if not _catalog['ready']:
+      return None
+    return sorted(_catalog['members'].get(list_id, ()))
+
+
+# Version du catalogue lue directement en base tant que le thread LISTEN n'est pas prêt
+_version_check = {'version': None, 'checked_at': float('-inf')}
+
+
+def _database_catalog_version():
+  """Version de catalog_version en base (relue au plus toutes les CATALOG_VERSION_CHECK_INTERVAL
+  secondes), ou None si elle n'a pas pu être lue"""
+  interval = float(os.getenv('CATALOG_VERSION_CHECK_INTERVAL', '5'))
+  if time.monotonic() - _version_check['checked_at'] < interval:
+    return _version_check['version']
+  try:
+    with connect() as connection:
+      with connection.cursor() as cursor:
+        cursor.execute('SELECT version FROM catalog_version')
+        version = cursor.fetchone()[0]
+  except Exception:
+    version = None
+  _version_check.update(version=version, checked_at=time.monotonic())
+  return version
+
+
+def fresh_snapshot():
+  """Instantané mmap (CATALOG_SNAPSHOT_PATH) s'il est assez récent, sinon None
+
+  Il est écarté dès que la version du catalogue en base, lue au chargement de l'instantané
+  en mémoire puis suivie par les notifications, dépasse celle enregistrée à sa construction.
+  Tant que l'instantané en mémoire n'est pas chargé (worker neuf, reconnexion du thread
+  LISTEN), la version est relue en base ; l'instantané n'est pas servi si elle est illisible.
+  """
+  try:
+    current = snapshot.current()
+  except Exception:
+    return None
+  if current is None:
+    return None
+  max_age = float(os.getenv('CATALOG_SNAPSHOT_MAX_AGE', '3600'))
+  if time.time() - current.created_at > max_age:
+    return None
+  with _catalog_lock:
+    ready, db_version = _catalog['ready'], _catalog['db_version']
+  if not ready:
+    db_version = _database_catalog_version()
+    if db_version is None:
+      return None
+  if db_version > current.db_version:
+    return None
+  return current
@@ -0,0 +1,130 @@
+"""Compteurs de consultations des livres et des listes, écrits en différé
+
+Une consultation n'écrit rien en base : elle incrémente un compteur en mémoire du worker.
+Un thread vide les compteurs toutes les VIEW_FLUSH_INTERVAL secondes, en une requête par
+table (UPDATE ... FROM unnest), et une dernière fois à l'arrêt du processus. Les colonnes
+view_count sont ignorées par les triggers du catalogue (migration 0009) : un vidage ne
+déclenche ni notification, ni recalcul des facettes.
+"""
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from flask_app import model
+
+TABLES = ('books', 'book_lists')
+FLUSH_SQL = '''
+  UPDATE {table} SET view_count = {table}.view_count + views.count
+  FROM unnest(%s::INTEGER[], %s::BIGINT[]) AS views(id, count)
+  WHERE {table}.id = views.id
+  RETURNING {table}.id, {table}.view_count
+'''
+# Durée maximale d'un vidage (statement_timeout et lock_timeout, voir model.time_budget)
+FLUSH_TIME_BUDGET = 10
+
+
+class ViewCounter:
+  """Compteurs {table: Counter(id)} d'un worker, vidés périodiquement par un thread"""
+
+  def __init__(self, interval=30.0):
+    self.interval = interval
+    self._lock = threading.Lock()
+    self._counts = {table: collections.Counter() for table in TABLES}
+    self._pid = None
+    self._thread = None
+    self.counters = collections.Counter()
+
+  def record(self, table, id):
+    """Compter une consultation (aucun accès à la base)"""
+    if self._pid != os.getpid():
+      self._start()
+    with self._lock:
+      self._counts[table][id] += 1
+
+  def _start(self):
+    with self._lock:
+      if self._pid == os.getpid():
+        return
+      # Après un fork, les compteurs hérités appartiennent au parent, qui les videra
+      self._counts = {table: collections.Counter() for table in TABLES}
+      self._thread = threading.Thread(target=self._run, name='view-counter', daemon=True)
+      self._pid = os.getpid()
+      self._thread.start()
+
+  def _run(self):
+    while True:
+      time.sleep(self.interval)
+      try:
+        self.flush()
+      except Exception:
+        logging.getLogger(__name__).warning('Échec du vidage des compteurs de consultations',
+                                            exc_info=True)
+
+  def pending(self):
+    with self._lock:
+      return sum(sum(counts.values()) for counts in self._counts.values())
+
+  def flush(self, connection=None):
+    """Écrire les compteurs accumulés ; retourne {table: {id: total}}
+
+    En cas d'échec, les compteurs sont remis en attente pour le vidage suivant.
+    """
+    with self._lock:
+      pending = self._counts
+      self._counts = {table: collections.Counter() for table in TABLES}
+    if not any(pending.values()):
+      return {}
+    totals = {}
+    owned = connection is None
+    try:
+      with model.time_budget(FLUSH_TIME_BUDGET):
+        if owned:
+          connection = model.connect()
+        try:
+          with model.unit_of_work(connection):
+            with connection.cursor() as cursor:
+              for table, counts in pending.items():
+                if counts:
+                  ids = sorted(counts)
+                  cursor.execute(FLUSH_SQL.format(table=table), (ids, [counts[id] for id in ids]))
+                  totals[table] = dict(cursor.fetchall())
+        finally:
+          if owned:
+            connection.close()
+    except Exception:
+      with self._lock:
+        for table, counts in pending.items():
+          self._counts[table].update(counts)
+      self.counters['flush_errors'] += 1
+      raise
+    self.counters['flushed'] += sum(sum(counts.values()) for counts in pending.values())
+    model.update_list_view_counts(totals.get('book_lists', {}))
+    return totals
+
+  def flush_at_exit(self):
+    """Dernier vidage à l'arrêt du worker (rien si le processus n'a rien compté)"""
+    if self._pid != os.getpid():
+      return
+    try:
+      self.flush()
+    except Exception:
+      logging.getLogger(__name__).warning('Consultations perdues à l\'arrêt du worker', exc_info=True)
+
+  def metrics(self):
+    """Lignes au format texte Prometheus"""
+    return [
+      f'view_counts_pending {self.pending()}',
+      f'view_counts_flushed_total {self.counters["flushed"]}',
+      f'view_counts_flush_errors_total {self.counters["flush_errors"]}',
+    ]
+
+
+counter = ViewCounter(float(os.getenv('VIEW_FLUSH_INTERVAL', '30')))
+atexit.register(counter.flush_at_exit)
+
+
+def record_view(table, id):
+  counter.record(table, id)
@@ -0,0 +1,186 @@
+"""Limitation des tentatives de connexion par seau à jetons (token bucket)
+
+Chaque adresse IP et chaque e-mail dispose d'un seau de `capacity` jetons rechargé
+de `capacity` jetons par `period` secondes ; une tentative consomme un jeton. Le
+contrôle a lieu avant tout hachage ou accès à la base. Les seaux sont gardés en
+mémoire, ou dans la table rate_limit_buckets (RATE_LIMIT_STORE=postgres) pour être
+partagés entre conteneurs.
+
+Derrière un serveur frontal (nginx), l'adresse du client est lue dans X-Forwarded-For
+pour TRUSTED_PROXY_HOPS mandataires de confiance ; sinon tous les clients partageraient
+l'adresse du mandataire, et donc le même seau.
+"""
+import collections
+import functools
+import math
+import os
+import threading
+import time
+
+from flask import current_app, render_template, request, session
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+from flask_app import model
+
+
+def parse_rule(rule):
+  """'20/60' -> (capacité 20, recharge 20/60 jeton par seconde)"""
+  capacity, period = rule.split('/')
+  return int(capacity), int(capacity) / float(period)
+
+
+class MemoryStore:
+  """Seaux en mémoire du processus (les moins récemment utilisés sont oubliés)"""
+
+  def __init__(self, max_keys=100000):
+    self.max_keys = max_keys
+    self._buckets = collections.OrderedDict()
+    self._lock = threading.Lock()
+
+  def take(self, key, capacity, rate):
+    """Consommer un jeton : (autorisé ?, jetons restants)"""
+    now = time.monotonic()
+    with self._lock:
+      tokens, updated_at = self._buckets.pop(key, (capacity, now))
+      tokens = min(capacity, tokens + (now - updated_at) * rate)
+      allowed = tokens >= 1
+      if allowed:
+        tokens -= 1
+      self._buckets[key] = (tokens, now)
+      if len(self._buckets) > self.max_keys:
+        self._buckets.popitem(last=False)
+    return allowed, tokens
+
+
+class PostgresStore:
+  """Seaux partagés dans la table rate_limit_buckets (une requête par tentative)"""
+
+  # Dans SET, les colonnes désignent l'ancienne ligne : allowed et tokens partent du même état
+  TAKE_SQL = '''
+    INSERT INTO rate_limit_buckets AS bucket (key, tokens, allowed, updated_at)
+    VALUES (%(key)s, %(capacity)s - 1, TRUE, now())
+    ON CONFLICT (key) DO UPDATE SET
+      allowed = LEAST(%(capacity)s, bucket.tokens + EXTRACT(EPOCH FROM now() - bucket.updated_at) * %(rate)s) >= 1,
+      tokens = LEAST(%(capacity)s, bucket.tokens + EXTRACT(EPOCH FROM now() - bucket.updated_at) * %(rate)s)
+               - CASE WHEN LEAST(%(capacity)s, bucket.tokens
+                                 + EXTRACT(EPOCH FROM now() - bucket.updated_at) * %(rate)s) >= 1
+                      THEN 1 ELSE 0 END,
+      updated_at = now()
+    RETURNING allowed, tokens
+  '''
+  # Les seaux inactifs depuis plus longtemps sont pleins : inutile de les garder
+  PURGE_AFTER = 3600
+
+  def __init__(self, database_url=None):
+    self.database_url = database_url
+    self._connection = None
+    self._lock = threading.Lock()
+    self._purged_at = float('-inf')
+
+  def take(self, key, capacity, rate):
+    with self._lock:
+      if self._connection is None or self._connection.closed:
+        self._connection = model.connect(self.database_url, autocommit=True, connect_timeout=2)
+      try:
+        row = self._connection.execute(
+          self.TAKE_SQL, {'key': key, 'capacity': capacity, 'rate': rate}).fetchone()
+        if time.monotonic() - self._purged_at > self.PURGE_AFTER:
+          self._purged_at = time.monotonic()
+          self._connection.execute(
+            'DELETE FROM rate_limit_buckets WHERE updated_at < now() - make_interval(secs => %s)',
+            (self.PURGE_AFTER,))
+      except Exception:
+        self._connection.close()
+        raise
+    return row[0], row[1]
+
+
+class RateLimiter:
+  """Règles par portée ('ip', 'email') et compteurs exportés sur /metrics"""
+
+  def __init__(self, store=None, rules=None):
+    self.store = store or MemoryStore()
+    self.rules = rules or {'ip': (20, 20 / 60), 'email': (5, 5 / 300)}
+    # Repli en mémoire si le stockage partagé est indisponible (pas de blocage des utilisateurs)
+    self._fallback = MemoryStore()
+    self.counters = collections.Counter()
+
+  def take(self, scope, key):
+    """Consommer un jeton de `scope` pour `key` : 0 si autorisé, sinon secondes à attendre"""
+    capacity, rate = self.rules[scope]
+    bucket = f'{scope}:{key}'
+    try:
+      allowed, tokens = self.store.take(bucket, capacity, rate)
+    except Exception as exception:
+      self.counters['store_errors'] += 1
+      current_app.logger.warning('Limiteur indisponible (%s), repli en mémoire',
+                                 exception.__class__.__name__)
+      allowed, tokens = self._fallback.take(bucket, capacity, rate)
+    self.counters[('allowed' if allowed else 'rejected', scope)] += 1
+    return 0 if allowed else max(1, math.ceil((1 - tokens) / rate))
+
+  def check(self, ip, email=None):
+    """Contrôler l'IP puis l'e-mail : 0 si la tentative est autorisée, sinon Retry-After"""
+    retry_after = self.take('ip', ip)
+    if not retry_after and email:
+      retry_after = self.take('email', email.strip().lower())
+    return retry_after
+
+  def metrics(self):
+    """Lignes au format texte Prometheus"""
+    lines = []
+    for outcome in ('allowed', 'rejected'):
+      for scope in self.rules:
+        lines.append(f'login_rate_limit_{outcome}_total{{scope="{scope}"}} '
+                     f'{self.counters[(outcome, scope)]}')
+    lines.append(f'login_rate_limit_store_errors_total {self.counters["store_errors"]}')
+    return lines
+
+
+def limit_attempts(email=None):
+  """Refuser (429) les POST au-delà des limites, avant l'exécution de la vue
+
+  email : fonction renvoyant l'e-mail visé par la tentative (ou None).
+  """
+  def decorator(view):
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+      if request.method == 'POST':
+        limiter = current_app.extensions['ratelimit']
+        retry_after = limiter.check(request.remote_addr or 'unknown', email() if email else None)
+        if retry_after:
+          response = current_app.make_response(
+            (render_template('too_many_requests.html', retry_after=retry_after), 429))
+          response.headers['Retry-After'] = str(retry_after)
+          return response
+      return view(*args, **kwargs)
+    return wrapper
+  return decorator
+
+
+def form_email():
+  return request.form.get('email')
+
+
+def session_email():
+  return session.get('totp_user', {}).get('email')
+
+
+def init_app(app):
+  """Créer le limiteur (LOGIN_RATE_LIMIT_IP, LOGIN_RATE_LIMIT_EMAIL, RATE_LIMIT_STORE)
+
+  TRUSTED_PROXY_HOPS (0 par défaut) : nombre de mandataires devant l'application dont
+  X-Forwarded-For est cru pour request.remote_addr. À 0, l'en-tête est ignoré (un client
+  direct pourrait sinon changer d'adresse à chaque tentative).
+  """
+  proxy_hops = int(os.getenv('TRUSTED_PROXY_HOPS', '0'))
+  if proxy_hops:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxy_hops)
+  rules = {
+    'ip': parse_rule(os.getenv('LOGIN_RATE_LIMIT_IP', '20/60')),
+    'email': parse_rule(os.getenv('LOGIN_RATE_LIMIT_EMAIL', '5/300')),
+  }
+  store = PostgresStore() if os.getenv('RATE_LIMIT_STORE') == 'postgres' else MemoryStore()
+  limiter = RateLimiter(store, rules)
+  app.extensions['ratelimit'] = limiter
+  return limiter
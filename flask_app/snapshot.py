@@ -0,0 +1,266 @@
+"""Instantané binaire en lecture seule du catalogue, partagé entre workers par mmap
+
+Format (petit-boutiste) :
+  en-tête    : magic, version, date de création, version du catalogue en base (migration 0011),
+               nombre de livres, de listes, d'appartenances, de recommandations
+  livres     : enregistrements de taille fixe triés par id (id + 7 références de chaînes
+               + plage de recommandations)
+  listes     : enregistrements de taille fixe triés par id (id + 3 chaînes + plage d'appartenances
+               + nombre de consultations)
+  membres    : indices (uint32) dans la table des livres, regroupés par liste, les livres les
+               plus consultés d'abord
+  voisins    : indices (uint32) dans la table des livres, regroupés par livre, dans l'ordre de
+               book_neighbours.rank (recommandations de build_recommendations.py)
+  tas        : chaînes UTF-8 ; une référence est (décalage, longueur), longueur NULL_LENGTH = NULL
+
+Un nouvel instantané est publié par os.replace() : les workers le détectent au prochain
+stat() et basculent dessus, l'ancien mapping est libéré quand plus rien ne le référence.
+"""
+import datetime
+import mmap
+import os
+import struct
+import threading
+import time
+
+import click
+from flask.cli import AppGroup
+
+MAGIC = b'LIBSNAP1'
+VERSION = 4
+HEADER = struct.Struct('<8sIdQIIII')
+BOOK_FIELDS = ('title', 'author', 'genre', 'publication_date', 'isbn', 'description', 'image_url')
+BOOK_RECORD = struct.Struct('<i' + 'II' * len(BOOK_FIELDS) + 'II')
+LIST_FIELDS = ('list_name', 'description', 'image_url')
+LIST_RECORD = struct.Struct('<i' + 'II' * len(LIST_FIELDS) + 'IIQ')
+MEMBER = struct.Struct('<I')
+NULL_LENGTH = 0xFFFFFFFF
+# Intervalle minimal entre deux stat() du fichier publié
+CHECK_INTERVAL = 1.0
+
+snapshot_cli = AppGroup('snapshot', help="Instantané binaire du catalogue")
+
+
+class _Heap:
+  def __init__(self):
+    self.chunks = []
+    self.size = 0
+
+  def add(self, value):
+    if value is None:
+      return 0, NULL_LENGTH
+    data = str(value).encode('utf-8')
+    offset = self.size
+    self.chunks.append(data)
+    self.size += len(data)
+    return offset, len(data)
+
+
+def write_snapshot(path, books, lists, relations, created_at=None, db_version=0, neighbours=()):
+  """Écrire l'instantané dans un fichier temporaire puis le publier atomiquement
+
+  books : tuples (id, title, author, genre, publication_date, isbn, description, image_url, view_count)
+  lists : tuples (id, list_name, description, image_url, view_count)
+  relations : couples (list_id, book_id)
+  db_version : valeur de catalog_version lue dans la même transaction que les données
+  neighbours : tuples (book_id, rank, neighbour_id)
+  """
+  books = sorted(books, key=lambda book: book[0])
+  lists = sorted(lists, key=lambda book_list: book_list[0])
+  book_index = {book[0]: index for index, book in enumerate(books)}
+  members = {}
+  for list_id, book_id in relations:
+    if book_id in book_index:
+      members.setdefault(list_id, set()).add(book_index[book_id])
+  similar = {}
+  for book_id, _, neighbour_id in sorted(neighbours):
+    if book_id in book_index and neighbour_id in book_index:
+      similar.setdefault(book_id, []).append(book_index[neighbour_id])
+
+  heap = _Heap()
+  book_records = []
+  neighbour_records = []
+  for book in books:
+    references = []
+    for value in book[1:1 + len(BOOK_FIELDS)]:
+      references.extend(heap.add(value))
+    indexes = similar.get(book[0], ())
+    references.extend((len(neighbour_records), len(indexes)))
+    neighbour_records.extend(MEMBER.pack(index) for index in indexes)
+    book_records.append(BOOK_RECORD.pack(book[0], *references))
+
+  list_records = []
+  member_records = []
+  for book_list in lists:
+    references = []
+    for value in book_list[1:1 + len(LIST_FIELDS)]:
+      references.extend(heap.add(value))
+    # Les livres étant triés par id, l'indice départage les ex aequo
+    indexes = sorted(members.get(book_list[0], ()), key=lambda index: (-books[index][-1], index))
+    references.extend((len(member_records), len(indexes), book_list[-1]))
+    member_records.extend(MEMBER.pack(index) for index in indexes)
+    list_records.append(LIST_RECORD.pack(book_list[0], *references))
+
+  header = HEADER.pack(MAGIC, VERSION, created_at or time.time(), db_version,
+                       len(book_records), len(list_records), len(member_records), len(neighbour_records))
+  temporary_path = f'{path}.{os.getpid()}.tmp'
+  with open(temporary_path, 'wb') as file:
+    file.write(header)
+    file.write(b''.join(book_records))
+    file.write(b''.join(list_records))
+    file.write(b''.join(member_records))
+    file.write(b''.join(neighbour_records))
+    file.write(b''.join(heap.chunks))
+    file.flush()
+    os.fsync(file.fileno())
+  os.replace(temporary_path, path)
+
+
+def build_snapshot(connection, path):
+  """Exporter books, book_lists, l'index des appartenances et les recommandations (lecture cohérente)
+
+  book_neighbours n'incrémente pas catalog_version : reconstruire l'instantané après
+  build_recommendations.py pour publier les nouvelles recommandations.
+  """
+  created_at = time.time()
+  with connection.cursor() as cursor:
+    # Doit être la première instruction de la transaction
+    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+    cursor.execute('SELECT version FROM catalog_version')
+    db_version = cursor.fetchone()[0]
+    cursor.execute('''SELECT id, title, author, genre, publication_date, isbn, description, image_url,
+                             view_count
+                      FROM books''')
+    books = cursor.fetchall()
+    cursor.execute('SELECT id, list_name, description, image_url, view_count FROM book_lists')
+    lists = cursor.fetchall()
+    cursor.execute('SELECT list_id, book_id FROM book_list_relations')
+    relations = cursor.fetchall()
+    cursor.execute('SELECT book_id, rank, neighbour_id FROM book_neighbours')
+    neighbours = cursor.fetchall()
+  connection.rollback()
+  write_snapshot(path, books, lists, relations, created_at, db_version, neighbours)
+  return len(books), len(lists), len(relations)
+
+
+class CatalogSnapshot:
+  """Lecture directe dans le fichier mappé (aucune copie du catalogue en mémoire)"""
+
+  def __init__(self, path):
+    with open(path, 'rb') as file:
+      self._buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    (magic, version, self.created_at, self.db_version, self.book_count, self.list_count,
+     member_count, neighbour_count) = HEADER.unpack_from(self._buffer, 0)
+    if magic != MAGIC or version != VERSION:
+      raise Exception('Instantané du catalogue invalide')
+    self._books_offset = HEADER.size
+    self._lists_offset = self._books_offset + self.book_count * BOOK_RECORD.size
+    self._members_offset = self._lists_offset + self.list_count * LIST_RECORD.size
+    self._neighbours_offset = self._members_offset + member_count * MEMBER.size
+    self._heap_offset = self._neighbours_offset + neighbour_count * MEMBER.size
+
+  def _string(self, offset, length):
+    if length == NULL_LENGTH:
+      return None
+    start = self._heap_offset + offset
+    return self._buffer[start:start + length].decode('utf-8')
+
+  def _find(self, record, table_offset, count, id):
+    low, high = 0, count
+    while low < high:
+      middle = (low + high) // 2
+      middle_id = struct.unpack_from('<i', self._buffer, table_offset + middle * record.size)[0]
+      if middle_id < id:
+        low = middle + 1
+      else:
+        high = middle
+    if low < count and struct.unpack_from('<i', self._buffer, table_offset + low * record.size)[0] == id:
+      return low
+    return None
+
+  def _book(self, index):
+    values = BOOK_RECORD.unpack_from(self._buffer, self._books_offset + index * BOOK_RECORD.size)
+    book = {'id': values[0]}
+    for position, field in enumerate(BOOK_FIELDS):
+      book[field] = self._string(values[1 + 2 * position], values[2 + 2 * position])
+    if book['publication_date'] is not None:
+      book['publication_date'] = datetime.date.fromisoformat(book['publication_date'])
+    return book
+
+  def _list(self, index):
+    values = LIST_RECORD.unpack_from(self._buffer, self._lists_offset + index * LIST_RECORD.size)
+    book_list = {'id': values[0]}
+    for position, field in enumerate(LIST_FIELDS):
+      book_list[field] = self._string(values[1 + 2 * position], values[2 + 2 * position])
+    return book_list, values[-3], values[-2], values[-1]
+
+  def get_book(self, id):
+    """Livre par identifiant (recherche dichotomique), ou None"""
+    index = self._find(BOOK_RECORD, self._books_offset, self.book_count, id)
+    return None if index is None else self._book(index)
+
+  def get_similar_books(self, id, limit=None):
+    """Recommandations d'un livre (ordre de book_neighbours.rank), ou None si le livre est inconnu"""
+    index = self._find(BOOK_RECORD, self._books_offset, self.book_count, id)
+    if index is None:
+      return None
+    start, count = BOOK_RECORD.unpack_from(self._buffer, self._books_offset + index * BOOK_RECORD.size)[-2:]
+    if limit is not None:
+      count = min(count, limit)
+    offset = self._neighbours_offset + start * MEMBER.size
+    return [self._book(MEMBER.unpack_from(self._buffer, offset + position * MEMBER.size)[0])
+            for position in range(count)]
+
+  def get_lists(self):
+    """Listes, les plus consultées d'abord"""
+    lists = [self._list(index) for index in range(self.list_count)]
+    lists.sort(key=lambda entry: (-entry[3], entry[0]['id']))
+    return [book_list for book_list, _, _, _ in lists]
+
+  def get_books_in_list(self, list_id):
+    """Livres d'une liste, ou None si la liste est inconnue"""
+    index = self._find(LIST_RECORD, self._lists_offset, self.list_count, list_id)
+    if index is None:
+      return None
+    _, start, count, _ = self._list(index)
+    offset = self._members_offset + start * MEMBER.size
+    return [self._book(MEMBER.unpack_from(self._buffer, offset + position * MEMBER.size)[0])
+            for position in range(count)]
+
+
+_current = {'snapshot': None, 'signature': None, 'checked_at': float('-inf')}
+_current_lock = threading.Lock()
+
+
+def current(path=None):
+  """Instantané publié (rechargé s'il a été remplacé), ou None"""
+  path = path or os.getenv('CATALOG_SNAPSHOT_PATH')
+  if not path:
+    return None
+  now = time.monotonic()
+  if now - _current['checked_at'] < CHECK_INTERVAL:
+    return _current['snapshot']
+  with _current_lock:
+    _current['checked_at'] = now
+    try:
+      stat = os.stat(path)
+    except FileNotFoundError:
+      _current.update(snapshot=None, signature=None)
+      return None
+    signature = (path, stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if signature != _current['signature']:
+      # L'ancien mapping reste valide pour les lectures en cours
+      _current.update(snapshot=CatalogSnapshot(path), signature=signature)
+    return _current['snapshot']
+
+
+@snapshot_cli.command('build')
+@click.argument('path', required=False)
+def build_command(path):
+  """Construire et publier l'instantané (CATALOG_SNAPSHOT_PATH par défaut)"""
+  from flask_app import model
+  path = path or os.getenv('CATALOG_SNAPSHOT_PATH')
+  if not path:
+    raise click.UsageError("Chemin manquant (argument ou CATALOG_SNAPSHOT_PATH)")
+  books, lists, relations = build_snapshot(model.connect(), path)
+  click.echo(f"✓ Instantané publié dans {path} : {books} livres, {lists} listes, {relations} relations")
@@ -0,0 +1,85 @@
+"""Rapport du temps de démarrage d'un worker (python -X importtime)
+
+Usage : python -m flask_app.startup [--budget-ms 800] [--top 15] [--runs 3]
+Le code de sortie vaut 1 si le démarrage dépasse le budget.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+DEFAULT_BUDGET_MS = int(os.getenv('BOOT_TIME_BUDGET_MS', '800'))
+
+BOOT_SCRIPT = '''
+import time
+start = time.perf_counter()
+import flask_app
+print((time.perf_counter() - start) * 1000)
+'''
+
+
+def parse_importtime(output):
+  """Analyser la sortie de -X importtime en [(module, self_us, cumulé_us, profondeur)]"""
+  imports = []
+  for line in output.splitlines():
+    if not line.startswith('import time:') or 'self [us]' in line:
+      continue
+    self_part, cumulative_part, name_part = line[len('import time:'):].split('|')
+    depth = (len(name_part) - len(name_part.lstrip(' ')) - 1) // 2
+    imports.append((name_part.strip(), int(self_part), int(cumulative_part), depth))
+  return imports
+
+
+def heaviest_imports(imports, package='flask_app', top=15):
+  """Imports directs de `package`, triés par coût cumulé"""
+  # -X importtime écrit les enfants avant leur parent
+  children = []
+  for entry in imports:
+    if entry[3] == 0:
+      if entry[0] == package:
+        return sorted(children, key=lambda child: child[2], reverse=True)[:top]
+      children = []
+    elif entry[3] == 1:
+      children.append(entry)
+  return []
+
+
+def measure(runs=3, env=None):
+  """Lancer des interpréteurs neufs et mesurer l'import de l'application"""
+  root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+  env = dict(os.environ if env is None else env)
+  env['PYTHONPATH'] = os.pathsep.join(filter(None, [root, env.get('PYTHONPATH')]))
+  durations = []
+  importtime_output = ''
+  for _ in range(runs):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPT],
+                            capture_output=True, text=True, env=env, cwd=root, check=True)
+    durations.append(float(result.stdout.strip().splitlines()[-1]))
+    importtime_output = result.stderr
+  return durations, parse_importtime(importtime_output)
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+  parser.add_argument('--top', type=int, default=15)
+  parser.add_argument('--runs', type=int, default=3)
+  arguments = parser.parse_args(argv)
+
+  durations, imports = measure(arguments.runs)
+  boot_ms = statistics.median(durations)
+  print("Imports les plus coûteux (cumulé, dernier essai) :")
+  for name, self_us, cumulative_us, depth in heaviest_imports(imports, top=arguments.top):
+    print(f"  {cumulative_us / 1000:8.1f} ms  {name}")
+  print(f"\nDémarrage de flask_app : {boot_ms:.1f} ms (médiane sur {len(durations)} essais)"
+        f" - budget {arguments.budget_ms:.0f} ms")
+  if boot_ms > arguments.budget_ms:
+    print("❌ Budget de démarrage dépassé")
+    return 1
+  print("✓ Budget de démarrage respecté")
+  return 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,139 @@
+"""Statistiques du catalogue pour les administrateurs, calculées avec NumPy
+
+Les colonnes utiles de books sont lues une seule fois par un COPY binaire dont chaque ligne a
+une taille fixe (valeurs NULL remplacées en SQL, auteur réduit à un code) : le flux est vu
+directement comme un tableau structuré (np.frombuffer), puis agrégé sans boucle Python.
+Le résultat est gardé en cache tant que le catalogue ne change pas (version de l'instantané
+LISTEN/NOTIFY), ou STATS_CACHE_TTL secondes quand les notifications ne sont pas disponibles.
+"""
+import os
+import threading
+import time
+
+from flask_app import model
+
+# Chaque ligne du COPY : nombre de champs (int16) puis (longueur int32, valeur) par champ
+BOOKS_COPY = '''
+  COPY (
+    SELECT id,
+           COALESCE(book_decade(publication_date), -1)::INTEGER,
+           (DENSE_RANK() OVER (ORDER BY author) - 1)::INTEGER,
+           COALESCE(image_url, '') = '',
+           COALESCE(description, '') = ''
+    FROM books
+  ) TO STDOUT (FORMAT BINARY)
+'''
+BOOKS_FIELDS = (('id', 'i4'), ('decade', 'i4'), ('author', 'i4'),
+                ('missing_cover', '?'), ('missing_description', '?'))
+RELATIONS_COPY = 'COPY (SELECT list_id, book_id FROM book_list_relations) TO STDOUT (FORMAT BINARY)'
+RELATIONS_FIELDS = (('list_id', 'i4'), ('book_id', 'i4'))
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\x00'
+# Signature, drapeaux (int32), longueur de l'extension d'en-tête (int32)
+COPY_HEADER_SIZE = len(COPY_SIGNATURE) + 8
+TOP_AUTHORS = 20
+
+_cache = {'stats': None, 'version': None, 'computed_at': float('-inf')}
+_cache_lock = threading.Lock()
+
+
+def _row_dtype(fields):
+  """Type structuré gros-boutiste d'une ligne du COPY binaire"""
+  import numpy as np
+  layout = [('field_count', '>i2')]
+  for name, kind in fields:
+    layout += [(f'{name}_length', '>i4'), (name, '>' + kind if kind != '?' else '?')]
+  return np.dtype(layout)
+
+
+def parse_binary_copy(data, fields):
+  """Tableau structuré des lignes d'un COPY ... (FORMAT BINARY) sans NULL ni champ variable"""
+  import numpy as np
+  dtype = _row_dtype(fields)
+  if not data.startswith(COPY_SIGNATURE) or int.from_bytes(data[15:19], 'big') != 0:
+    raise Exception('Flux COPY binaire invalide')
+  # La fin du flux est marquée par un nombre de champs égal à -1
+  body = len(data) - COPY_HEADER_SIZE - 2
+  if body % dtype.itemsize or data[-2:] != b'\xff\xff':
+    raise Exception('Flux COPY binaire invalide')
+  rows = np.frombuffer(data, dtype=dtype, count=body // dtype.itemsize, offset=COPY_HEADER_SIZE)
+  if (rows['field_count'] != len(fields)).any():
+    raise Exception('Flux COPY binaire invalide')
+  for name, _ in fields:
+    if (rows[f'{name}_length'] != dtype[name].itemsize).any():
+      raise Exception(f'Valeur NULL ou de taille inattendue dans la colonne {name}')
+  return rows
+
+
+def _copy(cursor, sql):
+  data = bytearray()
+  with cursor.copy(sql) as copy:
+    for chunk in copy:
+      data += chunk
+  return bytes(data)
+
+
+def load_arrays(connection):
+  """(livres, appartenances, auteurs triés, listes) lus dans une même transaction"""
+  with connection.cursor() as cursor:
+    cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+    books = parse_binary_copy(_copy(cursor, BOOKS_COPY), BOOKS_FIELDS)
+    relations = parse_binary_copy(_copy(cursor, RELATIONS_COPY), RELATIONS_FIELDS)
+    # Même ordre que DENSE_RANK() : le code d'un auteur est son rang dans cette liste
+    cursor.execute('SELECT DISTINCT author FROM books ORDER BY author')
+    authors = [row[0] for row in cursor.fetchall()]
+    cursor.execute('SELECT id, list_name FROM book_lists ORDER BY id')
+    lists = cursor.fetchall()
+  connection.rollback()
+  return books, relations, authors, lists
+
+
+def compute_stats(books, relations, authors, lists):
+  """Agrégats du catalogue (titres par liste, par décennie, par auteur, fiches incomplètes)"""
+  import numpy as np
+  total = len(books)
+  decades = books['decade']
+  dated = decades[decades >= 0]
+  decade_values, decade_counts = np.unique(dated, return_counts=True)
+
+  author_counts = np.bincount(books['author'], minlength=len(authors))
+  # Tri stable : à égalité, ordre alphabétique (ordre des codes)
+  top = np.argsort(-author_counts, kind='stable')[:TOP_AUTHORS]
+
+  # Compteurs indexés directement par identifiant de liste
+  list_counts = np.bincount(relations['list_id'],
+                            minlength=max((list_id for list_id, _ in lists), default=-1) + 1)
+  unlisted = int(np.count_nonzero(~np.isin(books['id'], relations['book_id'])))
+
+  return {
+    'total': total,
+    'by_list': [(name, int(list_counts[list_id])) for list_id, name in lists],
+    'unlisted': unlisted,
+    'by_decade': [(int(decade), int(count)) for decade, count in zip(decade_values, decade_counts)],
+    'undated': total - len(dated),
+    'authors': len(authors),
+    'by_author': [(authors[code], int(author_counts[code])) for code in top if author_counts[code]],
+    'missing_covers': int(np.count_nonzero(books['missing_cover'])),
+    'missing_descriptions': int(np.count_nonzero(books['missing_description'])),
+  }
+
+
+def get_stats(connection=None):
+  """Statistiques en cache, recalculées après un changement du catalogue"""
+  version = model.catalog_version()
+  ttl = float(os.getenv('STATS_CACHE_TTL', '300'))
+  with _cache_lock:
+    stats = _cache['stats']
+    if stats is not None:
+      if version is not None and version == _cache['version']:
+        return stats
+      if version is None and time.monotonic() - _cache['computed_at'] < ttl:
+        return stats
+  if connection is None:
+    with model.connect() as connection:
+      arrays = load_arrays(connection)
+  else:
+    arrays = load_arrays(connection)
+  stats = compute_stats(*arrays)
+  with _cache_lock:
+    _cache.update(stats=stats, version=version, computed_at=time.monotonic())
+  return stats
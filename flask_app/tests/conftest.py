@@ -0,0 +1,148 @@
+"""Fixtures des tests d'intégration sur un vrai PostgreSQL
+
+Un serveur est démarré une fois par session (ou TEST_POSTGRES_URL est utilisé), une base
+modèle y est construite par migrate.py puis remplie avec infra/db/data.py ; chaque test
+travaille sur un clone obtenu par CREATE DATABASE ... TEMPLATE, supprimé à la fin du test.
+Sans serveur disponible, les tests marqués `integration` sont ignorés.
+"""
+import itertools
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+
+import psycopg
+import pytest
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'))
+sys.path.append(ROOT)
+sys.path.append(os.path.join(ROOT, 'infra', 'db'))
+
+TEMPLATE_DATABASE = f'library_template_{os.getpid()}'
+_clone_numbers = itertools.count()
+
+
+def pytest_configure(config):
+    config.addinivalue_line(
+        'markers', 'integration: test exécuté sur un vrai PostgreSQL (TEST_POSTGRES_URL, ou initdb/pg_ctl)')
+
+
+class CountingCursor(psycopg.Cursor):
+    """Curseur qui consigne chaque requête dans connection.queries"""
+
+    def execute(self, query, params=None, **kwargs):
+        self.connection.queries.append(query)
+        return super().execute(query, params, **kwargs)
+
+    def executemany(self, query, params_seq, **kwargs):
+        self.connection.queries.append(query)
+        return super().executemany(query, params_seq, **kwargs)
+
+
+def _database_url(server_url, database):
+    """Même serveur, autre base"""
+    return psycopg.conninfo.make_conninfo(server_url, dbname=database)
+
+
+def _start_local_server(directory):
+    """initdb + pg_ctl dans un dossier temporaire (socket Unix privée, durabilité désactivée)"""
+    bin_dir = os.getenv('PG_BIN', '')
+    initdb = shutil.which(os.path.join(bin_dir, 'initdb') if bin_dir else 'initdb')
+    pg_ctl = shutil.which(os.path.join(bin_dir, 'pg_ctl') if bin_dir else 'pg_ctl')
+    # initdb refuse de s'exécuter en root
+    if not initdb or not pg_ctl or (hasattr(os, 'geteuid') and os.geteuid() == 0):
+        return None, None
+    data_dir = os.path.join(directory, 'data')
+    subprocess.run([initdb, '-D', data_dir, '-U', 'postgres', '-A', 'trust', '-E', 'UTF8',
+                    '--locale=C', '--no-sync'], check=True, capture_output=True)
+    options = (f"-c listen_addresses='' -k {directory} "
+               "-c fsync=off -c synchronous_commit=off -c full_page_writes=off")
+    subprocess.run([pg_ctl, '-D', data_dir, '-o', options, '-l', os.path.join(directory, 'log'),
+                    '-w', 'start'], check=True, capture_output=True)
+    stop_command = [pg_ctl, '-D', data_dir, '-m', 'immediate', 'stop']
+    return f'postgresql://postgres@/postgres?host={directory}', stop_command
+
+
+@pytest.fixture(scope='session')
+def postgres_server():
+    """URL d'administration d'un serveur PostgreSQL de test"""
+    server_url = os.getenv('TEST_POSTGRES_URL')
+    if server_url:
+        yield server_url
+        return
+    directory = tempfile.mkdtemp(prefix='library-pg-')
+    try:
+        server_url, stop_command = _start_local_server(directory)
+        if server_url is None:
+            pytest.skip('PostgreSQL indisponible (définir TEST_POSTGRES_URL ou installer initdb/pg_ctl)')
+        yield server_url
+        subprocess.run(stop_command, capture_output=True)
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def available_migrations(extensions_available):
+    """Migrations applicables sur ce serveur
+
+    Ex. pg_trgm absent d'un serveur minimal : seule la migration qui en dépend est ignorée.
+    """
+    import migrate
+
+    migrations = []
+    for version, name, path in migrate.list_migrations():
+        with open(path, encoding='utf-8') as file:
+            extensions = re.findall(r'CREATE\s+EXTENSION\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)',
+                                    file.read(), re.IGNORECASE)
+        if all(extension in extensions_available for extension in extensions):
+            migrations.append((version, name, path))
+    return migrations
+
+
+@pytest.fixture(scope='session')
+def template_database(postgres_server):
+    """Base modèle : schéma migré et données d'exemple, construite une fois par session"""
+    import migrate
+    import seed_postgres
+
+    with psycopg.connect(postgres_server, autocommit=True) as admin:
+        admin.execute(f'DROP DATABASE IF EXISTS {TEMPLATE_DATABASE}')
+        admin.execute(f'CREATE DATABASE {TEMPLATE_DATABASE}')
+        available = {row[0] for row in admin.execute('SELECT name FROM pg_available_extensions')}
+    template_url = _database_url(postgres_server, TEMPLATE_DATABASE)
+
+    with psycopg.connect(template_url, autocommit=True) as connection:
+        migrate.migrate(connection, available_migrations(available))
+    with psycopg.connect(template_url) as connection:
+        with connection.cursor() as cursor:
+            seed_postgres.seed_books(cursor)
+            seed_postgres.seed_book_lists(cursor)
+            seed_postgres.seed_relations(cursor)
+            seed_postgres.seed_admin_user(cursor, 'admin', 'admin@example.com', 'AAAbbccd@"9klk')
+    yield TEMPLATE_DATABASE
+
+    with psycopg.connect(postgres_server, autocommit=True) as admin:
+        admin.execute(f'DROP DATABASE IF EXISTS {TEMPLATE_DATABASE} WITH (FORCE)')
+
+
+@pytest.fixture
+def database_url(postgres_server, template_database, monkeypatch):
+    """Clone de la base modèle propre au test (DATABASE_URL pointe dessus)"""
+    database = f'{template_database}_{next(_clone_numbers)}'
+    with psycopg.connect(postgres_server, autocommit=True) as admin:
+        admin.execute(f'CREATE DATABASE {database} TEMPLATE {template_database}')
+    url = _database_url(postgres_server, database)
+    monkeypatch.setenv('DATABASE_URL', url)
+    yield url
+    with psycopg.connect(postgres_server, autocommit=True) as admin:
+        admin.execute(f'DROP DATABASE IF EXISTS {database} WITH (FORCE)')
+
+
+@pytest.fixture
+def db_connection(database_url):
+    """Connexion au clone dont les requêtes sont consignées dans connection.queries"""
+    connection = psycopg.connect(database_url, cursor_factory=CountingCursor)
+    connection.queries = []
+    yield connection
+    connection.close()
@@ -0,0 +1,76 @@
+import pytest
+import sys
+import os
+from flask import Flask
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import assets
+
+
+class TestAssets:
+    """Tests pour les fichiers statiques à empreinte"""
+
+    @pytest.fixture
+    def app(self, tmp_path):
+        """Application minimale avec un dossier statique temporaire"""
+        static_folder = tmp_path / 'static'
+        static_folder.mkdir()
+        (static_folder / 'app.css').write_text('body { margin: 0; }\n' * 200)
+        (static_folder / 'Livre.jpeg').write_bytes(b'\xff\xd8\xff' + os.urandom(512))
+        app = Flask(__name__, static_folder=str(static_folder))
+        app.config['ASSETS_BUILD_FOLDER'] = str(tmp_path / 'static_build')
+        assets.build(app.static_folder, app.config['ASSETS_BUILD_FOLDER'])
+        assets.init_app(app)
+        return app
+
+    def test_build_manifest(self, app):
+        """Test du manifeste et des variantes précompressées"""
+        manifest = app.extensions['assets']['manifest']
+        build_folder = app.config['ASSETS_BUILD_FOLDER']
+
+        assert manifest['app.css'].startswith('app.') and manifest['app.css'].endswith('.css')
+        assert os.path.isfile(os.path.join(build_folder, manifest['app.css'] + '.gz'))
+        # Les images ne sont pas recompressées
+        assert not os.path.exists(os.path.join(build_folder, manifest['Livre.jpeg'] + '.gz'))
+
+    def test_asset_url(self, app):
+        """Test de la réécriture des URL dans les templates"""
+        manifest = app.extensions['assets']['manifest']
+        with app.test_request_context():
+            assert assets.asset_url('/static/Livre.jpeg') == '/static/' + manifest['Livre.jpeg']
+            assert assets.asset_url('/static/inconnu.png') == '/static/inconnu.png'
+            assert assets.asset_url('https://example.com/a.png') == 'https://example.com/a.png'
+
+    def test_serve_fingerprinted_gzip(self, app):
+        """Test du service d'un fichier à empreinte précompressé"""
+        hashed = app.extensions['assets']['manifest']['app.css']
+        response = app.test_client().get('/static/' + hashed, headers={'Accept-Encoding': 'gzip'})
+
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'immutable' in response.headers['Cache-Control']
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert response.mimetype == 'text/css'
+
+    def test_serve_unfingerprinted(self, app):
+        """Test du service d'un fichier sans empreinte (cache court)"""
+        response = app.test_client().get('/static/Livre.jpeg')
+
+        assert response.status_code == 200
+        assert response.cache_control.max_age == assets.DEFAULT_MAX_AGE
+        assert not response.cache_control.immutable
+
+    def test_accel_redirect(self, app):
+        """Test du délestage vers le serveur web frontal"""
+        app.config['STATIC_ACCEL_REDIRECT'] = '/_internal/'
+        hashed = app.extensions['assets']['manifest']['Livre.jpeg']
+        response = app.test_client().get('/static/' + hashed)
+
+        assert response.headers['X-Accel-Redirect'].startswith('/_internal/')
+        assert response.headers['X-Accel-Redirect'].endswith(hashed)
+        assert response.data == b''
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
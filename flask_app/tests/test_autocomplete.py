@@ -0,0 +1,112 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import autocomplete
+
+
+BOOKS = [
+    (1, 'Le Petit Prince', 'Antoine de Saint-Exupéry'),
+    (2, 'Les Misérables', 'Victor Hugo'),
+    (3, 'Notre-Dame de Paris', 'Victor Hugo'),
+    (4, "L'Étranger", 'Albert Camus'),
+]
+
+
+class TestAutocomplete:
+    """Tests pour l'index des suggestions de recherche"""
+
+    @pytest.fixture
+    def index(self):
+        return autocomplete.PrefixIndex(BOOKS)
+
+    def test_fold(self):
+        """Test de la normalisation : minuscules, sans accents"""
+        assert autocomplete.fold('Émile ZOLA') == 'emile zola'
+
+    def test_title_prefix(self, index):
+        """Test d'un début de titre, quels que soient la casse et les accents"""
+        assert index.search('les mise') == [{'type': 'title', 'label': 'Les Misérables', 'book_id': 2}]
+        assert index.search('ETRAN')[0]['book_id'] == 4
+
+    def test_word_inside_title(self, index):
+        """Test d'un mot au milieu du titre"""
+        assert [suggestion['book_id'] for suggestion in index.search('prince')] == [1]
+
+    def test_author_suggested_once(self, index):
+        """Test d'un auteur proposé une seule fois pour plusieurs livres"""
+        assert index.search('hugo') == [{'type': 'author', 'label': 'Victor Hugo', 'book_id': 2}]
+
+    def test_ranking_and_limit(self, index):
+        """Test du classement (début de libellé d'abord) et de la limite"""
+        suggestions = index.search('l')
+
+        assert suggestions[0]['label'] == "L'Étranger"
+        assert len(index.search('l', limit=2)) == 2
+
+    def test_empty_query(self, index):
+        """Test d'une saisie vide ou sans lettres"""
+        assert index.search('') == []
+        assert index.search(' - ') == []
+
+    def test_add_and_remove(self, index):
+        """Test de l'ajout, du remplacement et de la suppression d'un livre"""
+        index.add_book(5, 'Germinal', 'Émile Zola')
+        index.add_book(5, 'Nana', 'Émile Zola')
+
+        assert index.search('germ') == []
+        assert index.search('nana')[0]['book_id'] == 5
+        index.remove_book(5)
+        assert index.search('zola') == []
+        assert len(index) == 4
+
+    def test_catalog_change(self, index):
+        """Test des notifications : ligne relue pour une écriture, index reconstruit après un rechargement"""
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value.fetchone.return_value = (
+            2, 'Les Misérables (édition illustrée)', 'Victor Hugo')
+
+        with patch.dict(autocomplete._index, {'index': index}):
+            autocomplete.apply_catalog_change(connection, {'table': 'books', 'op': 'UPDATE', 'id': 2})
+            assert index.search('les mis')[0]['label'] == 'Les Misérables (édition illustrée)'
+            autocomplete.apply_catalog_change(connection, {'table': 'books', 'op': 'DELETE', 'id': 1})
+            assert index.search('petit') == []
+            connection.cursor.return_value.__enter__.return_value.fetchall.return_value = BOOKS
+            autocomplete.apply_catalog_change(connection, {'table': None, 'op': 'RELOAD'})
+            assert autocomplete.get_index() is not index
+            assert autocomplete.get_index().search('petit')[0]['book_id'] == 1
+
+    def test_first_load_builds_index(self):
+        """Test : le premier chargement de l'instantané construit l'index, absent jusque-là"""
+        connection = MagicMock()
+        connection.cursor.return_value.__enter__.return_value.fetchall.return_value = BOOKS
+
+        with patch.dict(autocomplete._index, {'index': None}):
+            autocomplete.apply_catalog_change(connection, {'table': 'books', 'op': 'DELETE', 'id': 1})
+            assert autocomplete.get_index() is None
+            autocomplete.apply_catalog_change(connection, {'table': None, 'op': 'RELOAD'})
+            assert len(autocomplete.get_index()) == 4
+
+    def test_background_build(self):
+        """Test du thread de construction (une fois par processus, nouvel essai après un échec)"""
+        connection = MagicMock()
+        connection.__enter__.return_value = connection
+        connection.cursor.return_value.__enter__.return_value.fetchall.return_value = BOOKS
+
+        with patch.dict(autocomplete._index, {'index': None, 'thread': None, 'pid': None}), \
+                patch('flask_app.model.connect', side_effect=[Exception('Connexion refusée'), connection]), \
+                patch('flask_app.autocomplete.time.sleep') as mock_sleep:
+            thread = autocomplete.start_build()
+            thread.join(5)
+
+            assert autocomplete.start_build() is thread
+            assert len(autocomplete.get_index()) == 4
+            mock_sleep.assert_called_once_with(1)
+            connection.__exit__.assert_called_once()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,135 @@
+import pytest
+import sys
+import os
+import json
+from unittest.mock import patch, MagicMock
+from werkzeug.test import Client
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import health
+
+
+def application(environ, start_response):
+    """Application WSGI minimale derrière le middleware"""
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [b'page']
+
+
+class TestHealth:
+    """Tests pour les sondes /healthz et /readyz"""
+
+    @pytest.fixture
+    def middleware(self):
+        return health.HealthCheckMiddleware(application, capacity=2)
+
+    def test_healthz_no_io(self, middleware):
+        """Test de la sonde de vie (aucune connexion)"""
+        with patch('flask_app.model.connect') as mock_connect:
+            response = Client(middleware).get('/healthz')
+
+            assert response.status_code == 200
+            assert response.data == b'ok\n'
+            mock_connect.assert_not_called()
+
+    def test_readyz_ok(self, middleware):
+        """Test de la sonde de disponibilité (base joignable, connexion réutilisée)"""
+        mock_conn = MagicMock(closed=False)
+        with patch('flask_app.model.connect', return_value=mock_conn) as mock_connect:
+            client = Client(middleware)
+            response = client.get('/readyz')
+            middleware._last_ping = (float('-inf'), None)
+            client.get('/readyz')
+
+            report = json.loads(response.data)
+            assert response.status_code == 200
+            assert report['database'] == 'ok'
+            mock_connect.assert_called_once()
+            assert mock_conn.execute.call_count == 2
+
+    def test_readyz_database_down(self, middleware):
+        """Test de la sonde de disponibilité (base injoignable)"""
+        with patch('flask_app.model.connect', side_effect=OSError('connection refused')):
+            response = Client(middleware).get('/readyz')
+
+            assert response.status_code == 503
+            assert json.loads(response.data)['database'] == 'OSError'
+
+    def test_readyz_saturated(self, middleware):
+        """Test de la sonde de disponibilité (worker saturé)"""
+        middleware.in_flight = 2
+        with patch('flask_app.model.connect', return_value=MagicMock(closed=False)):
+            response = Client(middleware).get('/readyz')
+
+            assert response.status_code == 503
+            assert json.loads(response.data)['in_flight'] == 2
+
+    def test_other_paths_forwarded(self, middleware):
+        """Test du passage des autres requêtes à l'application"""
+        response = Client(middleware).get('/')
+
+        assert response.data == b'page'
+        response.close()
+        assert middleware.in_flight == 0
+
+    def test_in_flight_until_body_closed(self):
+        """Test : la requête reste comptée tant que le corps n'est pas entièrement servi"""
+        seen = []
+
+        def streaming(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+
+            def generate():
+                seen.append(middleware.in_flight)
+                yield b'page'
+            return generate()
+
+        middleware = health.HealthCheckMiddleware(streaming, capacity=2)
+        body = middleware({'PATH_INFO': '/'}, lambda status, headers: None)
+
+        assert middleware.in_flight == 1
+        assert list(body) == [b'page']
+        assert seen == [1]
+        body.close()
+        body.close()
+        assert middleware.in_flight == 0
+
+    def test_in_flight_application_error(self):
+        """Test : une application qui échoue ne laisse pas de requête comptée"""
+        def failing(environ, start_response):
+            raise RuntimeError('panne')
+
+        middleware = health.HealthCheckMiddleware(failing, capacity=2)
+
+        with pytest.raises(RuntimeError):
+            middleware({'PATH_INFO': '/'}, lambda status, headers: None)
+        assert middleware.in_flight == 0
+
+    def test_metrics(self):
+        """Test de l'export des compteurs au format texte, avec le jeton"""
+        middleware = health.HealthCheckMiddleware(application, capacity=2, metrics_token='secret',
+                                                  metrics=[lambda: ['login_rate_limit_store_errors_total 0']])
+
+        response = Client(middleware).get('/metrics', headers={'Authorization': 'Bearer secret'})
+
+        assert response.status_code == 200
+        assert response.data.decode().splitlines() == [
+            'worker_in_flight 0', 'worker_capacity 2', 'login_rate_limit_store_errors_total 0']
+
+    def test_metrics_requires_token(self, monkeypatch):
+        """Test de /metrics refusé sans le bon jeton, et désactivé sans METRICS_TOKEN"""
+        monkeypatch.delenv('METRICS_TOKEN', raising=False)
+        client = Client(health.HealthCheckMiddleware(application, metrics_token='secret'))
+
+        assert client.get('/metrics').status_code == 401
+        assert client.get('/metrics', headers={'Authorization': 'Bearer autre'}).status_code == 401
+        assert Client(health.HealthCheckMiddleware(application)).get('/metrics').status_code == 404
+
+        monkeypatch.setenv('METRICS_TOKEN', 'env')
+        response = Client(health.HealthCheckMiddleware(application)).get(
+            '/metrics', headers={'Authorization': 'Bearer env'})
+        assert response.status_code == 200
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
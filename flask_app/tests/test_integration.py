@@ -0,0 +1,261 @@
+import pytest
+import sys
+import os
+import hashlib
+import datetime
+import json
+import psycopg
+from psycopg import conninfo
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import model, popularity, snapshot
+from conftest import available_migrations
+
+pytestmark = pytest.mark.integration
+
+
+class TestIntegration:
+    """Tests du modèle sur une vraie base (clone de la base modèle, voir conftest.py)"""
+
+    def test_get_book_single_query(self, db_connection):
+        """Test de la lecture d'un livre en une requête"""
+        book = model.get_book(db_connection, 1)
+
+        assert book['id'] == 1
+        assert isinstance(book['publication_date'], datetime.date)
+        assert len(db_connection.queries) == 1
+
+    def test_catalog_reads_single_query(self, db_connection):
+        """Test des lectures du catalogue : une requête chacune, sans instantané"""
+        lists = model.get_lists(db_connection)
+        books = model.get_books_in_list(db_connection, lists[0]['id'])
+        book_lists = model.get_lists_of_book(db_connection, books[0]['id'])
+
+        assert lists[0]['id'] in [book_list['id'] for book_list in book_lists]
+        assert len(db_connection.queries) == 3
+
+    def test_browse_and_facets(self, db_connection):
+        """Test de la navigation : une requête pour la page, une pour les compteurs"""
+        books, _, has_next = model.browse_books(db_connection, {}, page_size=2)
+        facets = model.get_facet_counts(db_connection, {})
+        genre, count = facets['genre'][0]
+        filtered, _, _ = model.browse_books(db_connection, {'genre': genre})
+
+        assert len(books) == 2 and has_next
+        assert len(filtered) == count
+        assert len(db_connection.queries) == 3
+
+    def test_browse_keyset_pages(self, db_connection):
+        """Test de la pagination par clé : pages suivantes et précédentes sans trou ni doublon"""
+        with db_connection.cursor() as cursor:
+            cursor.execute('UPDATE books SET view_count = id % 3')
+        db_connection.commit()
+
+        for order in model.BROWSE_ORDERS:
+            everything, _, _ = model.browse_books(db_connection, {}, page_size=1000, order=order)
+            pages, after, has_next = [], None, True
+            while has_next:
+                books, has_previous, has_next = model.browse_books(db_connection, {}, after=after,
+                                                                   page_size=3, order=order)
+                assert has_previous == (after is not None)
+                pages.append(books)
+                after = books[-1]['id']
+            assert [book for page in pages for book in page] == everything
+
+            previous, _, has_next = model.browse_books(db_connection, {}, before=pages[-1][0]['id'],
+                                                       page_size=3, order=order)
+            assert previous == pages[-2] and has_next
+
+    def test_facet_pairs_match_group_by(self, db_connection):
+        """Test des compteurs d'une facette sélectionnée, identiques à un GROUP BY après des écritures"""
+        model.delete_book(db_connection, 1)
+        with db_connection.cursor() as cursor:
+            cursor.execute("UPDATE books SET genre = 'Roman', publication_date = '1955-01-01' WHERE id = 2")
+            cursor.execute('SELECT author, genre, book_decade(publication_date) FROM books WHERE id IN (2, 3)')
+            selections = cursor.fetchall()
+        db_connection.commit()
+
+        for author, genre, decade in selections:
+            for filters in ({'author': author}, {'genre': genre}, {'decade': decade}):
+                precomputed = model.get_facet_counts(db_connection, filters, limit=100)
+                # Même filtre avec une recherche vide de sens : repli sur le GROUP BY
+                grouped = model.get_facet_counts(db_connection, filters, search='%', limit=100)
+                assert precomputed == grouped, filters
+
+    def test_facets_maintained_by_trigger(self, db_connection):
+        """Test de book_facets, identique à un GROUP BY sur books après une écriture"""
+        model.delete_book(db_connection, 1)
+
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT value, book_count FROM book_facets WHERE facet = 'author' ORDER BY value")
+            stored = cursor.fetchall()
+            cursor.execute("SELECT author, COUNT(*) FROM books GROUP BY author ORDER BY author")
+            assert stored == cursor.fetchall()
+
+    def test_catalog_version(self, database_url, db_connection, tmp_path):
+        """Test de la version du catalogue : notifiée, lue au chargement, enregistrée dans l'instantané"""
+        path = str(tmp_path / 'catalog.snap')
+        snapshot.build_snapshot(db_connection, path)
+        built = snapshot.CatalogSnapshot(path).db_version
+        with psycopg.connect(database_url, autocommit=True) as listener:
+            listener.execute(f'LISTEN {model.CATALOG_CHANNEL}')
+            with model.unit_of_work(db_connection):
+                with db_connection.cursor() as cursor:
+                    cursor.execute("UPDATE books SET title = title || ' (2e éd.)' WHERE id IN (1, 2)")
+            payloads = [json.loads(notify.payload) for notify in listener.notifies(timeout=5, stop_after=2)]
+
+        assert [payload['version'] for payload in payloads] == [built + 1, built + 1]
+        assert model.load_catalog_snapshot(db_connection)[3] == built + 1
+        # Vidage des compteurs de consultations : la version ne change pas
+        with db_connection.cursor() as cursor:
+            cursor.execute('UPDATE books SET view_count = view_count + 1')
+            cursor.execute('SELECT version FROM catalog_version')
+            assert cursor.fetchone()[0] == built + 1
+
+    def test_similar_books_from_snapshot(self, db_connection, tmp_path):
+        """Test des recommandations de l'instantané, identiques à la lecture de book_neighbours"""
+        with db_connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO book_neighbours (book_id, rank, neighbour_id, score)
+                VALUES (1, 2, 3, 0.5), (1, 1, 2, 0.9)
+            """)
+        db_connection.commit()
+        path = str(tmp_path / 'catalog.snap')
+        snapshot.build_snapshot(db_connection, path)
+
+        assert snapshot.CatalogSnapshot(path).get_similar_books(1) == model.get_similar_books(db_connection, 1)
+
+    def test_unit_of_work_rollback(self, db_connection):
+        """Test de l'annulation réelle de toutes les écritures d'une unité de travail"""
+        book = {'title': 'Titre', 'author': 'Auteur', 'genre': 'Roman', 'publication_date': '2000-01-01',
+                'isbn': '0000000000001', 'description': 'Description', 'image_url': None}
+        with pytest.raises(Exception):
+            with model.unit_of_work(db_connection):
+                book_id = model.insert_book(db_connection, book)
+                model.insert_book_list_relations(db_connection, book_id, [1, 999999])
+
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT COUNT(*) FROM books WHERE isbn = '0000000000001'")
+            assert cursor.fetchone()[0] == 0
+
+    def test_duplicate_relation_ignored(self, db_connection):
+        """Test de l'unicité (list_id, book_id) posée par la migration 0006"""
+        books = model.get_books_in_list(db_connection, 1)
+
+        model.insert_book_list_relations(db_connection, books[0]['id'], [1, 1])
+
+        assert len(model.get_books_in_list(db_connection, 1)) == len(books)
+
+    def test_reset_password(self, db_connection):
+        """Test du jeton de réinitialisation, consommé une seule fois"""
+        with db_connection.cursor() as cursor:
+            cursor.execute("""
+                INSERT INTO password_reset_tokens (token_hash, user_id, expires_at)
+                SELECT %s, id, now() + interval '1 hour' FROM users WHERE email = 'admin@example.com'
+            """, (hashlib.sha256(b'jeton').hexdigest(),))
+        db_connection.commit()
+
+        model.reset_password(db_connection, 'jeton', 'Nouveau@Mot2passe')
+
+        assert model.get_user(db_connection, 'admin@example.com', 'Nouveau@Mot2passe')['name'] == 'admin'
+        with pytest.raises(Exception, match='invalide ou expiré'):
+            model.reset_password(db_connection, 'jeton', 'Nouveau@Mot2passe')
+
+    def test_provision_users(self, db_connection):
+        """Test de la création en masse : lots, e-mails déjà pris, comptes verrouillés"""
+        import provision_users
+
+        users = [(2, 'ancien', 'admin@example.com', ''),
+                 (3, 'eleve1', 'eleve1@ecole.fr', 'Eleve@2024$Long'),
+                 (4, 'eleve2', 'eleve2@ecole.fr', ''),
+                 (5, 'eleve3', 'eleve3@ecole.fr', '')]
+
+        created, tokens, failures, (hashed, _) = provision_users.provision(
+            db_connection, users, workers=1, batch_size=2)
+
+        assert created == 3
+        assert hashed == 1
+        assert failures == [(2, 'admin@example.com', 'E-mail déjà utilisé')]
+        assert model.get_user(db_connection, 'eleve1@ecole.fr', 'Eleve@2024$Long')['name'] == 'eleve1'
+        token = dict(tokens)['eleve2@ecole.fr']
+        model.reset_password(db_connection, token, 'Nouveau@Mot2passe')
+        assert model.get_user(db_connection, 'eleve2@ecole.fr', 'Nouveau@Mot2passe')['name'] == 'eleve2'
+        with db_connection.cursor() as cursor:
+            cursor.execute("SELECT password_hash FROM users WHERE email = 'eleve3@ecole.fr'")
+            assert cursor.fetchone()[0] == model.LOCKED_PASSWORD
+
+    def test_view_counts_flush_silently(self, db_connection):
+        """Test du vidage des consultations : ni notification, ni updated_at modifié"""
+        counter = popularity.ViewCounter()
+        counter._pid = os.getpid()
+        with db_connection.cursor() as cursor:
+            cursor.execute('SELECT updated_at FROM books WHERE id = 1')
+            updated_at = cursor.fetchone()[0]
+        db_connection.execute(f'LISTEN {model.CATALOG_CHANNEL}')
+        db_connection.commit()
+        for _ in range(3):
+            counter.record('books', 1)
+
+        totals = counter.flush(db_connection)
+
+        assert totals == {'books': {1: 3}}
+        assert list(db_connection.notifies(timeout=0.2)) == []
+        with db_connection.cursor() as cursor:
+            cursor.execute('SELECT updated_at FROM books WHERE id = 1')
+            assert cursor.fetchone()[0] == updated_at
+
+    def test_stats_match_group_by(self, db_connection):
+        """Test des statistiques NumPy, identiques aux GROUP BY correspondants"""
+        pytest.importorskip('numpy')
+        from flask_app import stats
+
+        result = stats.compute_stats(*stats.load_arrays(db_connection))
+
+        with db_connection.cursor() as cursor:
+            cursor.execute("""SELECT book_decade(publication_date), COUNT(*) FROM books
+                              WHERE publication_date IS NOT NULL GROUP BY 1 ORDER BY 1""")
+            assert result['by_decade'] == cursor.fetchall()
+            cursor.execute("""SELECT list_name, COUNT(book_id) FROM book_lists
+                              LEFT JOIN book_list_relations ON list_id = book_lists.id
+                              GROUP BY book_lists.id ORDER BY book_lists.id""")
+            assert result['by_list'] == cursor.fetchall()
+            cursor.execute("SELECT author, COUNT(*) FROM books GROUP BY author ORDER BY 2 DESC, 1 LIMIT 20")
+            assert result['by_author'] == cursor.fetchall()
+
+    def test_upgrade_from_version_1(self, postgres_server):
+        """Test d'une base créée par build_postgres.sql seul : baseline puis toutes les migrations"""
+        import migrate
+
+        database = f'library_v1_{os.getpid()}'
+        with psycopg.connect(postgres_server, autocommit=True) as admin:
+            admin.execute(f'DROP DATABASE IF EXISTS {database}')
+            admin.execute(f'CREATE DATABASE {database}')
+            available = {row[0] for row in admin.execute('SELECT name FROM pg_available_extensions')}
+        try:
+            url = conninfo.make_conninfo(postgres_server, dbname=database)
+            with psycopg.connect(url, autocommit=True) as connection:
+                with open(migrate.BASE_SCHEMA, encoding='utf-8') as file:
+                    connection.execute(file.read())
+                connection.execute("""INSERT INTO books (title, author, genre, publication_date)
+                                      VALUES ('Titre', 'Auteur', 'Roman', '1942-06-01')""")
+
+                migrate.migrate(connection, available_migrations(available))
+
+                facets = connection.execute(
+                    'SELECT facet, value, book_count FROM book_facets ORDER BY facet').fetchall()
+                assert facets == [('author', 'Auteur', 1), ('decade', '1940', 1), ('genre', 'Roman', 1)]
+                connection.execute("UPDATE books SET view_count = 1")
+        finally:
+            with psycopg.connect(postgres_server, autocommit=True) as admin:
+                admin.execute(f'DROP DATABASE IF EXISTS {database} WITH (FORCE)')
+
+    def test_time_budget_cancels_query(self, database_url):
+        """Test de l'annulation d'une requête qui dépasse le budget"""
+        with pytest.raises(model.TIMEOUT_ERRORS):
+            with model.time_budget(0.2):
+                model.connect().execute('SELECT pg_sleep(5)')
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,165 @@
+import pytest
+import sys
+import os
+import io
+import json
+import logging
+import queue
+from flask import Flask
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import logs
+
+
+class TestLogs:
+    """Tests pour la journalisation structurée et asynchrone"""
+
+    @pytest.fixture
+    def app(self):
+        """Application minimale dont les journaux sont écrits dans un tampon"""
+        app = Flask('journal_test')
+        stream = io.StringIO()
+        listener = logs.init_app(app, stream=stream)
+
+        @app.route('/livre/<int:id_book>')
+        def livre(id_book):
+            return 'livre'
+
+        @app.route('/erreur')
+        def erreur():
+            try:
+                raise ValueError('boum')
+            except ValueError as exception:
+                app.logger.exception(exception)
+            return 'erreur'
+
+        @app.route('/panne')
+        def panne():
+            raise RuntimeError('panne')
+
+        yield app, stream
+        logs.stop_listener(listener)
+
+    def test_access_log(self, app):
+        """Test du journal d'accès JSON (route, durée, identifiant de requête)"""
+        app, stream = app
+        response = app.test_client().get('/livre/3', headers={'X-Request-ID': 'abc'})
+        logs.stop_listener(app.extensions['logs']['listener'])
+
+        entry = json.loads(stream.getvalue().splitlines()[-1])
+        assert response.headers['X-Request-ID'] == 'abc'
+        assert entry['request_id'] == 'abc'
+        assert entry['route'] == '/livre/<int:id_book>'
+        assert entry['status'] == 200
+        assert entry['duration_ms'] >= 0
+
+    @pytest.mark.parametrize('header', ['a' * 65, 'abc def', 'abc\u00e9', ''])
+    def test_invalid_request_id_replaced(self, app, header):
+        """Test : un X-Request-ID trop long ou hors alphabet est remplacé par un identifiant généré"""
+        app, stream = app
+        response = app.test_client().get('/livre/3', headers={'X-Request-ID': header})
+        logs.stop_listener(app.extensions['logs']['listener'])
+
+        entry = json.loads(stream.getvalue().splitlines()[-1])
+        assert response.headers['X-Request-ID'] != header
+        assert len(response.headers['X-Request-ID']) == 32
+        assert entry['request_id'] == response.headers['X-Request-ID']
+
+    def test_exception_log(self, app):
+        """Test de la trace d'exception transmise au thread d'écriture"""
+        app, stream = app
+        app.test_client().get('/erreur')
+        logs.stop_listener(app.extensions['logs']['listener'])
+
+        entry = json.loads(stream.getvalue().splitlines()[0])
+        assert entry['level'] == 'ERROR'
+        assert entry['route'] == '/erreur'
+        assert 'ValueError: boum' in entry['exception']
+
+    def test_access_log_failed_request(self, app):
+        """Test : une requête en échec a aussi son journal d'accès (statut 500, niveau ERROR)"""
+        app, stream = app
+        response = app.test_client().get('/panne')
+        logs.stop_listener(app.extensions['logs']['listener'])
+
+        entries = [json.loads(line) for line in stream.getvalue().splitlines()]
+        access = [entry for entry in entries if entry['logger'] == 'journal_test.access']
+        assert response.status_code == 500
+        assert len(access) == 1
+        assert access[0]['status'] == 500
+        assert access[0]['level'] == 'ERROR'
+        assert access[0]['route'] == '/panne'
+
+    def test_access_log_propagated_exception(self, app):
+        """Test : journal d'accès écrit même quand l'exception est propagée (after_request sauté)"""
+        app, stream = app
+        app.config['PROPAGATE_EXCEPTIONS'] = True
+        with pytest.raises(RuntimeError):
+            app.test_client().get('/panne')
+        logs.stop_listener(app.extensions['logs']['listener'])
+
+        entry = json.loads(stream.getvalue().splitlines()[-1])
+        assert entry['logger'] == 'journal_test.access'
+        assert entry['status'] == 500
+
+    def test_listener_started_by_first_record(self, app):
+        """Test : pas de thread à l'initialisation, démarré au premier enregistrement du processus"""
+        app, stream = app
+        listener = app.extensions['logs']['listener']
+
+        assert listener._thread is None
+        app.logger.info('premier')
+        assert listener._thread.is_alive()
+        logs.stop_listener(listener)
+
+        assert json.loads(stream.getvalue().splitlines()[0])['message'] == 'premier'
+
+    @pytest.mark.skipif(not hasattr(os, 'fork'), reason='fork indisponible')
+    def test_listener_restarted_after_fork(self, tmp_path):
+        """Test : un worker forké après l'import (gunicorn --preload) écrit ses journaux"""
+        app = Flask('journal_fork')
+        path = tmp_path / 'journal.log'
+        with open(path, 'w', encoding='utf-8') as stream:
+            listener = logs.init_app(app, stream=stream)
+            app.logger.info('parent')
+
+            pid = os.fork()
+            if pid == 0:
+                # Worker : le thread du parent n'existe plus ici
+                app.logger.info('worker')
+                logs.stop_listener(listener)
+                stream.flush()
+                os._exit(0)
+            os.waitpid(pid, 0)
+            logs.stop_listener(listener)
+
+        messages = [json.loads(line)['message'] for line in path.read_text(encoding='utf-8').splitlines()]
+        assert sorted(messages) == ['parent', 'worker']
+
+    def test_sampling_filter(self):
+        """Test de l'échantillonnage (les avertissements sont toujours gardés)"""
+        sampling = logs.SamplingFilter(0.0)
+        info = logging.LogRecord('test', logging.INFO, __file__, 1, 'info', None, None)
+        warning = logging.LogRecord('test', logging.WARNING, __file__, 1, 'warning', None, None)
+
+        assert not sampling.filter(info)
+        assert sampling.filter(warning)
+
+    def test_queue_full_drops(self):
+        """Test de l'abandon des enregistrements quand la file est pleine"""
+        handler = logs.DroppingQueueHandler(queue.Queue(maxsize=1))
+        record = logging.LogRecord('test', logging.INFO, __file__, 1, 'message %s', ('a',), None)
+
+        handler.handle(record)
+        handler.handle(record)
+
+        assert handler.queue.qsize() == 1
+        assert handler.dropped == 1
+        assert 'log_records_dropped_total 1' in handler.metrics()
+        assert 'log_queue_size 1' in handler.metrics()
+        assert handler.queue.get_nowait().msg == 'message a'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
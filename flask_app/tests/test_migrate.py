@@ -0,0 +1,51 @@
+import pytest
+import sys
+import os
+
+# Ajouter le chemin des scripts de la VM BDD
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../infra/db')))
+import migrate
+
+
+class TestMigrate:
+    """Tests pour les migrations versionnées du schéma"""
+
+    def test_list_migrations(self):
+        """Test de l'ordre des migrations (build_postgres.sql en version 1)"""
+        migrations = migrate.list_migrations()
+        versions = [version for version, _, _ in migrations]
+
+        assert migrations[0][2] == migrate.BASE_SCHEMA
+        assert versions == sorted(versions)
+        assert versions[:2] == [1, 2]
+
+    def test_split_statements(self):
+        """Test du découpage (chaînes, corps $$ et commentaires conservés)"""
+        sql = """
+            -- commentaire ; ignoré
+            INSERT INTO t VALUES ('a;b', 'l''apostrophe');
+            CREATE FUNCTION f() RETURNS trigger AS $$
+            BEGIN RETURN NULL; END;
+            $$ LANGUAGE plpgsql;
+            /* bloc ; */ SELECT 1
+        """
+
+        statements = migrate.split_statements(sql)
+
+        assert len(statements) == 3
+        assert statements[0] == "INSERT INTO t VALUES ('a;b', 'l''apostrophe')"
+        assert statements[1].endswith('$$ LANGUAGE plpgsql')
+        assert statements[2] == 'SELECT 1'
+
+    def test_no_transaction_directive(self):
+        """Test de la directive des migrations hors transaction"""
+        with open(os.path.join(migrate.MIGRATIONS_DIR, '0006_book_list_relations_unique.sql')) as file:
+            sql = file.read()
+
+        assert not migrate.is_transactional(sql)
+        assert migrate.is_transactional('CREATE INDEX i ON t(c);')
+        assert migrate.CONCURRENT_INDEX.search(sql).group(1) == 'idx_book_list_relations_list_book'
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -1,6 +1,10 @@
 import pytest
 import sys
 import os
+import hashlib
+import io
+import threading
+import time
 import psycopg
 from unittest.mock import patch, MagicMock
 
@@ -37,6 +41,49 @@ class TestModel:
             conn = model.connect(TEST_DATABASE_URL)
             mock_connect.assert_called_once_with(TEST_DATABASE_URL)
     
+    def test_connect_in_time_budget(self, mock_connection):
+        """Test des délais de session posés à la connexion dans un budget de temps"""
+        with patch('psycopg.connect', return_value=mock_connection[0]) as mock_connect:
+            with model.time_budget(2):
+                model.connect(TEST_DATABASE_URL)
+            model.connect(TEST_DATABASE_URL)
+
+            options = mock_connect.call_args_list[0][1]['options']
+            assert 'statement_timeout=' in options and 'lock_timeout=' in options
+            assert mock_connect.call_args_list[1] == ((TEST_DATABASE_URL,), {})
+            mock_connection[0].cancel.assert_not_called()
+            assert model._watchdog.pending() == 0
+
+    def test_watchdog_cancels_due_queries(self):
+        """Test du thread de surveillance : annulation à l'échéance, sauf si le budget est terminé"""
+        watchdogs = lambda: [thread.name for thread in threading.enumerate()].count('query-watchdog')
+        before = watchdogs()
+        watchdog = model._Watchdog()
+        due, finished, later = (MagicMock(closed=False) for _ in range(3))
+        now = time.monotonic()
+        watchdog.schedule(now + 60, later)
+        watchdog.schedule(now + 0.05, due)
+        watchdog.unschedule(watchdog.schedule(now + 0.01, finished))
+
+        deadline = time.monotonic() + 5
+        while not due.cancel.called and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        due.cancel.assert_called_once()
+        finished.cancel.assert_not_called()
+        later.cancel.assert_not_called()
+        assert watchdog.pending() == 1
+        # Un seul thread pour toutes les échéances
+        assert watchdogs() == before + 1
+
+    def test_connect_budget_exhausted(self):
+        """Test du refus de se connecter quand le budget est épuisé"""
+        with patch('psycopg.connect') as mock_connect:
+            with pytest.raises(psycopg.errors.QueryCanceled):
+                with model.time_budget(0):
+                    model.connect(TEST_DATABASE_URL)
+            mock_connect.assert_not_called()
+
     def test_connect_missing_env_var(self):
         """Test de la fonction connect sans variable d'environnement"""
         with patch.dict(os.environ, {}, clear=True):
@@ -48,7 +95,7 @@ class TestModel:
         mock_conn, mock_cursor = mock_connection
         
         # Mock du hashage du mot de passe
-        with patch('model.hash_password', return_value='hashed_password'):
+        with patch('flask_app.model.hash_password', return_value='hashed_password'):
             model.add_user(mock_conn, 'test_user', 'test@example.com', 'password123')
             
             # Vérifier que la requête SQL a été exécutée
@@ -63,7 +110,7 @@ class TestModel:
         mock_cursor.fetchone.return_value = (1, 'test_user', 'test@example.com', 'hashed_password')
         
         # Mock de la vérification du mot de passe
-        with patch('model.scrypt.verify', return_value=True):
+        with patch('flask_app.model.scrypt.verify', return_value=True):
             result = model.get_user(mock_conn, 'test@example.com', 'password123')
             
             assert result == {'id': 1, 'email': 'test@example.com', 'name': 'test_user'}
@@ -83,7 +130,7 @@ class TestModel:
         mock_cursor.fetchone.return_value = (1, 'test_user', 'test@example.com', 'hashed_password')
         
         # Mock de la vérification du mot de passe (échec)
-        with patch('model.scrypt.verify', return_value=False):
+        with patch('flask_app.model.scrypt.verify', return_value=False):
             with pytest.raises(Exception, match="Utilisateur inconnu"):
                 model.get_user(mock_conn, 'test@example.com', 'wrong_password')
     
@@ -168,7 +215,7 @@ class TestModel:
         valid_passwords = [
             'Password123!',
             'MyStr0ng#Pass',
-            'Test@2024$'
+            'Test@2024$Long'
         ]
         
         for password in valid_passwords:
@@ -194,8 +241,8 @@ class TestModel:
         """Test de hashage du mot de passe"""
         password = 'TestPassword123!'
         
-        with patch('model.check_password_strength'):
-            with patch('model.scrypt.using') as mock_scrypt:
+        with patch('flask_app.model.check_password_strength'):
+            with patch('flask_app.model.scrypt.using') as mock_scrypt:
                 mock_scrypt.return_value.hash.return_value = 'hashed_password'
                 
                 result = model.hash_password(password)
@@ -233,5 +280,364 @@ class TestModel:
         assert result == "Le livre n'a pas été supprimé!"
         mock_conn.rollback.assert_called_once()
 
+    @pytest.fixture
+    def catalog_snapshot(self):
+        """Instantané du catalogue prêt, restauré après le test"""
+        saved = dict(model._catalog)
+        model._catalog.update(
+            ready=True,
+            lists={1: {'id': 1, 'list_name': 'Philosophie', 'description': 'Description',
+                       'image_url': '/static/philosophie.jpeg'}},
+            members={1: {4, 2}})
+        yield model._catalog
+        model._catalog.clear()
+        model._catalog.update(saved)
+
+    def test_get_lists_from_snapshot(self, catalog_snapshot):
+        """Test des listes servies depuis l'instantané, sans connexion"""
+        with patch('psycopg.connect') as mock_connect:
+            result = model.get_lists()
+
+            assert result == [{'id': 1, 'list_name': 'Philosophie', 'description': 'Description',
+                               'image_url': '/static/philosophie.jpeg'}]
+            mock_connect.assert_not_called()
+
+    def test_get_books_in_list_from_snapshot(self, mock_connection, catalog_snapshot):
+        """Test des livres d'une liste lus par clé primaire grâce à l'instantané"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            (2, 'Les Misérables', 'Victor Hugo', 'Roman historique', '1862-01-01',
+             '9782070643028', 'Description', '/static/Livre.jpeg')
+        ]
+
+        model.get_books_in_list(mock_conn, 1)
+
+        call_args = mock_cursor.execute.call_args[0]
+        assert 'book_list_relations' not in call_args[0]
+        assert call_args[1] == ([2, 4],)
+
+    def test_apply_catalog_change(self, mock_connection, catalog_snapshot):
+        """Test de l'application des notifications à l'instantané"""
+        mock_conn, mock_cursor = mock_connection
+        version = catalog_snapshot['version']
+
+        model.apply_catalog_change(mock_conn, '{"table": "book_list_relations", "op": "INSERT", "book_id": 7, "list_id": 1, "version": 12}')
+        model.apply_catalog_change(mock_conn, '{"table": "books", "op": "DELETE", "id": 2, "version": 11}')
+        assert model.catalog_book_ids(1) == [4, 7]
+
+        model.apply_catalog_change(mock_conn, '{"table": "book_lists", "op": "DELETE", "id": 1}')
+        assert model.catalog_lists() == []
+        assert catalog_snapshot['version'] == version + 3
+        assert catalog_snapshot['db_version'] == 12
+        mock_cursor.execute.assert_not_called()
+
+    def test_catalog_listener_closes_connections(self, catalog_snapshot):
+        """Test de la fermeture des deux connexions de l'écoute quand le chargement échoue"""
+        connections = [MagicMock(), MagicMock()]
+        for connection in connections:
+            connection.__enter__.return_value = connection
+        connections[1].cursor.side_effect = Exception('Connexion perdue')
+
+        # Le premier sleep (attente avant reconnexion) interrompt la boucle
+        with patch('flask_app.model.connect', side_effect=connections), \
+             patch('flask_app.model.time.sleep', side_effect=StopIteration):
+            with pytest.raises(StopIteration):
+                model._listen_catalog_changes('postgresql://')
+
+        for connection in connections:
+            connection.__exit__.assert_called_once()
+        assert catalog_snapshot['ready'] is False
+
+    def test_catalog_lists_by_popularity(self, catalog_snapshot):
+        """Test des listes triées par consultations, totaux reportés après un vidage"""
+        catalog_snapshot['lists'] = {
+            list_id: {'id': list_id, 'list_name': name, 'description': None, 'image_url': None}
+            for list_id, name in ((1, 'Philosophie'), (2, 'Romans'), (3, 'Poésie'))
+        }
+        catalog_snapshot['list_views'] = {1: 5, 2: 5, 3: 1}
+
+        model.update_list_view_counts({3: 9, 42: 100})
+
+        assert [book_list['id'] for book_list in model.catalog_lists()] == [3, 1, 2]
+        assert 42 not in catalog_snapshot['list_views']
+
+    def test_catalog_snapshot_not_ready(self, mock_connection):
+        """Test du repli sur PostgreSQL quand l'instantané n'est pas prêt"""
+        assert model.catalog_lists() is None
+        assert model.catalog_book_ids(1) is None
+
+    def test_browse_books_next_page(self, mock_connection):
+        """Test de la pagination par clé : page suivante lue après le dernier livre affiché"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            (i, f'Titre {i}', 'Albert Camus', 'Roman', '1942-05-01', str(i), 'Description', '/static/Livre.jpeg')
+            for i in range(3)
+        ]
+
+        books, has_previous, has_next = model.browse_books(mock_conn, {'author': 'Albert Camus'}, after=7,
+                                                           page_size=2)
+
+        assert [book['id'] for book in books] == [0, 1]
+        assert has_previous and has_next
+        sql, parameters = mock_cursor.execute.call_args[0]
+        assert 'author = %s' in sql
+        assert '(title, id) > (SELECT title, id FROM books WHERE id = %s)' in sql
+        assert 'ORDER BY title ASC, id ASC' in sql
+        assert 'OFFSET' not in sql
+        assert parameters == ['Albert Camus', 7, 3]
+
+    def test_browse_books_previous_page(self, mock_connection):
+        """Test de la page précédente : parcours inverse de l'index, remis dans l'ordre d'affichage"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            (i, f'Titre {i}', 'Albert Camus', 'Roman', '1942-05-01', str(i), 'Description', '/static/Livre.jpeg')
+            for i in (5, 4)
+        ]
+
+        books, has_previous, has_next = model.browse_books(mock_conn, {}, before=6, page_size=2,
+                                                           order='popular')
+
+        assert [book['id'] for book in books] == [4, 5]
+        assert not has_previous and has_next
+        sql, parameters = mock_cursor.execute.call_args[0]
+        assert '(view_count, id) > (SELECT view_count, id FROM books WHERE id = %s)' in sql
+        assert 'ORDER BY view_count ASC, id ASC' in sql
+        assert parameters == [6, 3]
+
+    def test_browse_books_first_page(self, mock_connection):
+        """Test de la première page, sans clé de départ"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = []
+
+        assert model.browse_books(mock_conn, {}, order='popular') == ([], False, False)
+        sql, parameters = mock_cursor.execute.call_args[0]
+        assert 'WHERE' not in sql
+        assert 'ORDER BY view_count DESC, id DESC' in sql
+        assert parameters == [model.BROWSE_PAGE_SIZE + 1]
+
+    def test_facet_counts_precomputed(self, mock_connection):
+        """Test des compteurs lus dans les agrégats sans filtre"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            ('author', 'Albert Camus', 2), ('decade', '1950', 1), ('decade', '1940', 4)
+        ]
+
+        result = model.get_facet_counts(mock_conn, {})
+
+        assert result == {'author': [('Albert Camus', 2)], 'genre': [],
+                          'decade': [('1940', 4), ('1950', 1)]}
+        call_args = mock_cursor.execute.call_args[0]
+        assert 'FROM book_facets' in call_args[0]
+        assert 'GROUP BY' not in call_args[0]
+
+    def test_facet_counts_one_facet(self, mock_connection):
+        """Test des compteurs d'une facette sélectionnée, lus dans les agrégats croisés"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            ('author', 'Albert Camus', 2), ('genre', 'Roman', 2), ('decade', '1940', 2)
+        ]
+
+        result = model.get_facet_counts(mock_conn, {'author': 'Albert Camus'}, limit=5)
+
+        assert result['genre'] == [('Roman', 2)]
+        sql, parameters = mock_cursor.execute.call_args[0]
+        assert 'FROM book_facet_pairs' in sql
+        assert 'GROUP BY' not in sql
+        assert parameters == ['author', 'Albert Camus',
+                              'author', 'Albert Camus', 'genre', 5,
+                              'author', 'Albert Camus', 'decade', 5]
+
+    def test_facet_counts_filtered(self, mock_connection):
+        """Test des compteurs restreints aux livres filtrés (facette et recherche)"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = []
+
+        model.get_facet_counts(mock_conn, {'decade': 1940}, 'Peste', limit=5)
+
+        call_args = mock_cursor.execute.call_args[0]
+        assert 'book_facets' not in call_args[0]
+        assert call_args[1][:4] == ['author', 1940, '%Peste%', 5]
+
+    def test_unit_of_work_single_commit(self, mock_connection):
+        """Test d'une unité de travail : plusieurs écritures, un seul commit"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchone.return_value = (42,)
+        book = {'title': 'Titre', 'author': 'Auteur', 'genre': 'Roman', 'publication_date': '2000-01-01',
+                'isbn': '123', 'description': 'Description', 'image_url': None}
+
+        with model.unit_of_work(mock_conn):
+            book_id = model.insert_book(mock_conn, book)
+            model.insert_book_list_relations(mock_conn, book_id, [1, 2])
+
+        mock_conn.commit.assert_called_once()
+        assert mock_cursor.execute.call_args[0][1] == (42, [1, 2])
+
+    def test_unit_of_work_rollback(self, mock_connection):
+        """Test de l'annulation de toute l'unité de travail en cas d'erreur"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.execute.side_effect = [None, Exception("Database error")]
+
+        with pytest.raises(Exception, match="Database error"):
+            with model.unit_of_work(mock_conn):
+                model.insert_book_list(mock_conn, {'id': None, 'list_name': 'Liste',
+                                                   'description': 'Description', 'image_url': None})
+                model.insert_book_list_relations(mock_conn, 1, [1])
+
+        mock_conn.commit.assert_not_called()
+        mock_conn.rollback.assert_called_once()
+
+    def test_unit_of_work_nested_savepoint(self, mock_connection):
+        """Test d'une unité de travail imbriquée (point de sauvegarde)"""
+        mock_conn, mock_cursor = mock_connection
+
+        with model.unit_of_work(mock_conn):
+            with pytest.raises(ValueError):
+                with model.unit_of_work(mock_conn):
+                    raise ValueError()
+
+        statements = [call[0][0] for call in mock_conn.execute.call_args_list]
+        assert statements == ['SAVEPOINT unit_of_work_1', 'ROLLBACK TO SAVEPOINT unit_of_work_1']
+        mock_conn.rollback.assert_not_called()
+        mock_conn.commit.assert_called_once()
+
+    def test_get_similar_books(self, mock_connection):
+        """Test de la lecture des recommandations précalculées"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = [
+            (2, 'Les Misérables', 'Victor Hugo', 'Roman historique', '1862-01-01',
+             '9782070643028', 'Description', '/static/Livre.jpeg')
+        ]
+
+        result = model.get_similar_books(mock_conn, 1, limit=3)
+
+        assert [book['id'] for book in result] == [2]
+        call_args = mock_cursor.execute.call_args[0]
+        assert 'FROM book_neighbours' in call_args[0]
+        assert call_args[1] == (1, 3)
+
+    def test_get_similar_books_empty(self, mock_connection):
+        """Test d'un livre sans recommandation (pas d'exception)"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.return_value = []
+
+        assert model.get_similar_books(mock_conn, 1) == []
+
+    def test_get_similar_books_closes_connection(self, mock_connection):
+        """Test : sans instantané, une seule connexion ouverte puis fermée"""
+        mock_conn, mock_cursor = mock_connection
+        mock_conn.__enter__.return_value = mock_conn
+        mock_cursor.fetchall.return_value = []
+
+        with patch('flask_app.model.fresh_snapshot', return_value=None), \
+             patch('flask_app.model.connect', return_value=mock_conn) as mock_connect:
+            assert model.get_similar_books(None, 1) == []
+
+        mock_connect.assert_called_once()
+        mock_conn.__exit__.assert_called_once()
+
+    def test_catalog_reads_close_connection(self, mock_connection):
+        """Test : sans instantané, get_book, get_lists et get_books_in_list ferment leur connexion"""
+        mock_conn, mock_cursor = mock_connection
+        mock_conn.__enter__.return_value = mock_conn
+        mock_cursor.fetchone.return_value = None
+        mock_cursor.fetchall.return_value = []
+
+        with patch('flask_app.model.fresh_snapshot', return_value=None), \
+             patch('flask_app.model.catalog_lists', return_value=None), \
+             patch('flask_app.model.catalog_book_ids', return_value=None), \
+             patch('flask_app.model.connect', return_value=mock_conn) as mock_connect:
+            with pytest.raises(Exception, match='Livre inconnu'):
+                model.get_book(None, 999)
+            with pytest.raises(Exception, match='Aucune liste trouvée'):
+                model.get_lists()
+            with pytest.raises(Exception, match='Aucun livre trouvé'):
+                model.get_books_in_list(None, 1)
+
+        assert mock_connect.call_count == 3
+        assert mock_conn.__exit__.call_count == 3
+
+    def test_get_user_locked_password(self, mock_connection):
+        """Test d'un compte provisionné sans mot de passe (en attente de réinitialisation)"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchone.return_value = (1, 'eleve', 'eleve@ecole.fr', model.LOCKED_PASSWORD, None)
+
+        with pytest.raises(Exception, match='Utilisateur inconnu'):
+            model.get_user(mock_conn, 'eleve@ecole.fr', model.LOCKED_PASSWORD)
+
+    def test_reset_password(self, mock_connection):
+        """Test de la réinitialisation : jeton consommé et mot de passe remplacé"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchone.return_value = (7,)
+
+        model.reset_password(mock_conn, 'jeton', 'Nouveau@Mot2passe')
+
+        select_call, update_call = mock_cursor.execute.call_args_list
+        token_hash = hashlib.sha256(b'jeton').hexdigest()
+        assert 'FOR UPDATE' in select_call[0][0]
+        assert select_call[0][1] == (token_hash,)
+        assert update_call[0][1][0] == token_hash
+        mock_conn.commit.assert_called_once()
+
+    def test_reset_password_invalid_token(self, mock_connection):
+        """Test d'un jeton inconnu ou expiré"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchone.return_value = None
+
+        with patch('flask_app.model.hash_password') as mock_hash:
+            with pytest.raises(Exception, match='invalide ou expiré'):
+                model.reset_password(mock_conn, 'jeton', 'Nouveau@Mot2passe')
+
+        mock_hash.assert_not_called()
+        mock_conn.commit.assert_not_called()
+
+    def png_header(self, width, height):
+        return b'\x89PNG\r\n\x1a\n' + b'\x00\x00\x00\rIHDR' + width.to_bytes(4, 'big') + height.to_bytes(4, 'big')
+
+    def test_sniff_image(self):
+        """Test du format et des dimensions lus dans l'en-tête (PNG, GIF, JPEG après un segment APP)"""
+        jpeg = (b'\xff\xd8' + b'\xff\xe1\x00\x06Exif' + b'\xff\xff'
+                + b'\xff\xc0\x00\x11\x08' + (480).to_bytes(2, 'big') + (640).to_bytes(2, 'big'))
+
+        assert model.sniff_image(self.png_header(800, 600)) == ('png', 800, 600)
+        assert model.sniff_image(b'GIF89a' + (32).to_bytes(2, 'little') + (16).to_bytes(2, 'little')) == ('gif', 32, 16)
+        assert model.sniff_image(jpeg) == ('jpeg', 640, 480)
+        assert model.sniff_image(jpeg[:12]) is None
+        with pytest.raises(Exception, match='non pris en charge'):
+            model.sniff_image(b'<svg xmlns="http://www.w3.org/2000/svg"/>')
+
+    def test_sniff_image_real_jpeg(self):
+        """Test de l'en-tête d'un JPEG produit par Pillow"""
+        Image = pytest.importorskip('PIL.Image')
+        buffer = io.BytesIO()
+        Image.new('RGB', (123, 45)).save(buffer, 'JPEG')
+
+        assert model.sniff_image(buffer.getvalue()) == ('jpeg', 123, 45)
+
+    def test_save_upload(self, tmp_path):
+        """Test de l'image publiée sous l'extension de son format réel, sans fichier temporaire restant"""
+        data = self.png_header(10, 10) + b'\x00' * 200_000
+
+        filename = model.save_upload(io.BytesIO(data), str(tmp_path), 'couverture')
+
+        assert filename == 'couverture.png'
+        assert (tmp_path / filename).read_bytes() == data
+        assert os.listdir(tmp_path) == [filename]
+
+    def test_save_upload_limits(self, tmp_path):
+        """Test des refus : taille, dimensions (dès l'en-tête), contenu illisible"""
+        oversized = io.BytesIO(self.png_header(10, 10) + b'\x00' * 2000)
+        bomb = MagicMock()
+        bomb.read.side_effect = [self.png_header(100_000, 100_000)] + [b'\x00' * 1024] * 10
+
+        with pytest.raises(Exception, match='trop volumineuse'):
+            model.save_upload(oversized, str(tmp_path), 'a', max_bytes=1024)
+        with pytest.raises(Exception, match='trop grande'):
+            model.save_upload(bomb, str(tmp_path), 'b')
+        with pytest.raises(Exception, match='Image invalide'):
+            model.save_upload(io.BytesIO(self.png_header(10, 10)[:20]), str(tmp_path), 'c')
+
+        assert bomb.read.call_count == 1
+        assert os.listdir(tmp_path) == []
+
 if __name__ == '__main__':
     pytest.main([__file__])
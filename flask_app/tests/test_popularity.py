@@ -0,0 +1,89 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import popularity
+
+
+class TestPopularity:
+    """Tests pour les compteurs de consultations écrits en différé"""
+
+    @pytest.fixture
+    def counter(self):
+        """Compteur sans thread de vidage (vidages déclenchés par le test)"""
+        counter = popularity.ViewCounter(interval=3600)
+        counter._pid = os.getpid()
+        return counter
+
+    @pytest.fixture
+    def mock_connection(self):
+        mock_conn = MagicMock()
+        mock_cursor = MagicMock()
+        mock_conn.cursor.return_value.__enter__.return_value = mock_cursor
+        return mock_conn, mock_cursor
+
+    def test_record_without_database(self, counter):
+        """Test d'une consultation comptée en mémoire uniquement"""
+        with patch('psycopg.connect') as mock_connect:
+            counter.record('books', 2)
+            counter.record('books', 2)
+            counter.record('book_lists', 1)
+
+            assert counter.pending() == 3
+            mock_connect.assert_not_called()
+
+    def test_flush_batched(self, counter, mock_connection):
+        """Test du vidage : une requête par table, une seule transaction"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.fetchall.side_effect = [[(2, 12), (5, 1)], [(1, 40)]]
+        for id in (5, 2, 2):
+            counter.record('books', id)
+        counter.record('book_lists', 1)
+
+        with patch('flask_app.model.update_list_view_counts') as mock_update:
+            totals = counter.flush(mock_conn)
+
+        assert totals == {'books': {2: 12, 5: 1}, 'book_lists': {1: 40}}
+        assert mock_cursor.execute.call_count == 2
+        assert mock_cursor.execute.call_args_list[0][0][1] == ([2, 5], [2, 1])
+        mock_conn.commit.assert_called_once()
+        mock_update.assert_called_once_with({1: 40})
+        assert counter.pending() == 0
+        assert counter.counters['flushed'] == 4
+
+    def test_flush_nothing(self, counter, mock_connection):
+        """Test d'un vidage sans consultation : aucune requête"""
+        mock_conn, _ = mock_connection
+
+        assert counter.flush(mock_conn) == {}
+        mock_conn.cursor.assert_not_called()
+
+    def test_flush_failure_requeued(self, counter, mock_connection):
+        """Test des consultations remises en attente après un vidage en échec"""
+        mock_conn, mock_cursor = mock_connection
+        mock_cursor.execute.side_effect = Exception('Database error')
+        counter.record('books', 2)
+
+        with pytest.raises(Exception, match='Database error'):
+            counter.flush(mock_conn)
+
+        mock_conn.rollback.assert_called_once()
+        assert counter.pending() == 1
+        assert 'view_counts_flush_errors_total 1' in counter.metrics()
+
+    def test_counts_reset_after_fork(self, counter):
+        """Test des compteurs hérités du parent ignorés par le processus enfant"""
+        counter.record('books', 2)
+        counter._pid = -1
+
+        with patch('threading.Thread'):
+            counter.record('books', 3)
+
+        assert counter._counts['books'] == {3: 1}
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,160 @@
+import pytest
+import sys
+import os
+from unittest.mock import MagicMock, patch
+
+# Ajouter le chemin du projet et des scripts de la VM BDD
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../infra/db')))
+import provision_users
+import seed_postgres
+from flask_app import model
+
+PASSWORD = 'Test@2024$Long'
+
+
+class FakePool:
+    """Remplace le ProcessPoolExecutor : hachage dans le processus courant"""
+
+    def __init__(self, max_workers=None):
+        self.calls = []
+
+    def map(self, function, items, chunksize=1):
+        self.calls.append(list(items))
+        return map(function, self.calls[-1])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class TestProvisionUsers:
+    """Tests pour la création en masse de comptes"""
+
+    def write_csv(self, tmp_path, content):
+        path = tmp_path / 'users.csv'
+        path.write_text(content, encoding='utf-8')
+        return str(path)
+
+    def test_locked_password_shared_with_app(self):
+        """Test : le hash verrouillé est le même que celui refusé par l'application"""
+        assert provision_users.LOCKED_PASSWORD is seed_postgres.LOCKED_PASSWORD
+        assert seed_postgres.LOCKED_PASSWORD == model.LOCKED_PASSWORD
+
+    def test_read_users(self, tmp_path):
+        """Test de la lecture du CSV (espaces retirés, mot de passe facultatif)"""
+        path = self.write_csv(tmp_path, 'name,email,password\n'
+                                        f' alice , alice@ecole.fr ,{PASSWORD}\n'
+                                        'bob,bob@ecole.fr,\n')
+
+        users, failures = provision_users.read_users(path)
+
+        assert users == [(2, 'alice', 'alice@ecole.fr', PASSWORD), (3, 'bob', 'bob@ecole.fr', '')]
+        assert failures == []
+
+    def test_read_users_rejected_rows(self, tmp_path):
+        """Test des lignes refusées, avec leur numéro de ligne dans le fichier"""
+        path = self.write_csv(tmp_path, 'name,email,password\n'
+                                        ',vide@ecole.fr,\n'
+                                        f'{"x" * 33},long@ecole.fr,\n'
+                                        'carl,pas-un-email,\n'
+                                        'dora,dora@ecole.fr,faible\n'
+                                        'eve,eve@ecole.fr,\n'
+                                        'eve bis,eve@ecole.fr,\n')
+
+        users, failures = provision_users.read_users(path)
+
+        assert users == [(6, 'eve', 'eve@ecole.fr', '')]
+        assert [(line, email) for line, email, _ in failures] == [
+            (2, 'vide@ecole.fr'), (3, 'long@ecole.fr'), (4, 'pas-un-email'),
+            (5, 'dora@ecole.fr'), (7, 'eve@ecole.fr')]
+        assert 'Nom manquant' in failures[0][2]
+        assert 'E-mail invalide' in failures[2][2]
+        assert 'trop court' in failures[3][2]
+        assert 'en double' in failures[4][2]
+
+    def test_hash_passwords(self):
+        """Test : seuls les mots de passe fournis sont hachés, dans l'ordre d'origine"""
+        pool = FakePool()
+        with patch('provision_users.hash_password', side_effect=lambda password: 'hash:' + password):
+            hashes = provision_users.hash_passwords(pool, ['a', '', 'b', ''])
+
+        assert hashes == ['hash:a', model.LOCKED_PASSWORD, 'hash:b', model.LOCKED_PASSWORD]
+        assert pool.calls == [['a', 'b']]
+
+    def test_hash_passwords_real_scrypt(self):
+        """Test : le hash produit est vérifiable par l'application"""
+        hashes = provision_users.hash_passwords(FakePool(), [PASSWORD])
+
+        assert model.scrypt.verify(PASSWORD, hashes[0])
+
+    def test_provision_batches(self):
+        """Test du découpage en lots : une transaction et un INSERT par lot"""
+        users = [(line, f'u{line}', f'u{line}@ecole.fr', '') for line in range(2, 7)]
+        mock_conn = MagicMock()
+        inserted = []
+
+        def insert_users(cur, rows):
+            inserted.append([row[0] for row in rows])
+            return {row[2]: row[0] * 10 for row in rows}
+
+        with patch('provision_users.ProcessPoolExecutor', FakePool), \
+             patch('provision_users.existing_emails', return_value=set()), \
+             patch('provision_users.insert_users', side_effect=insert_users), \
+             patch('provision_users.issue_reset_tokens',
+                   side_effect=lambda cur, ids, ttl: {id: f'jeton{id}' for id in ids}):
+            created, tokens, failures, (hashed, _) = provision_users.provision(
+                mock_conn, users, batch_size=2)
+
+        assert inserted == [[2, 3], [4, 5], [6]]
+        assert mock_conn.commit.call_count == 3
+        assert created == 5
+        assert tokens == [(f'u{line}@ecole.fr', f'jeton{line * 10}') for line in range(2, 7)]
+        assert failures == []
+        assert hashed == 0
+
+    def test_provision_existing_and_conflicting_emails(self):
+        """Test : e-mails déjà pris écartés avant hachage, conflits ON CONFLICT signalés"""
+        users = [(2, 'ancien', 'ancien@ecole.fr', PASSWORD),
+                 (3, 'course', 'course@ecole.fr', ''),
+                 (4, 'nouveau', 'nouveau@ecole.fr', '')]
+        mock_conn = MagicMock()
+        issued = []
+
+        def issue_reset_tokens(cur, ids, ttl):
+            issued.append(ids)
+            return {id: 'jeton' for id in ids}
+
+        # course@ecole.fr est créé par un autre processus entre la vérification et l'INSERT
+        with patch('provision_users.ProcessPoolExecutor', FakePool), \
+             patch('provision_users.existing_emails', return_value={'ancien@ecole.fr'}), \
+             patch('provision_users.hash_password') as mock_hash, \
+             patch('provision_users.insert_users', return_value={'nouveau@ecole.fr': 9}) as mock_insert, \
+             patch('provision_users.issue_reset_tokens', side_effect=issue_reset_tokens):
+            created, tokens, failures, (hashed, _) = provision_users.provision(mock_conn, users)
+
+        mock_hash.assert_not_called()
+        assert [row[2] for row in mock_insert.call_args[0][1]] == ['course@ecole.fr', 'nouveau@ecole.fr']
+        assert created == 1
+        assert issued == [[9]]
+        assert tokens == [('nouveau@ecole.fr', 'jeton')]
+        assert failures == [(2, 'ancien@ecole.fr', 'E-mail déjà utilisé'),
+                            (3, 'course@ecole.fr', 'E-mail déjà utilisé')]
+        assert hashed == 0
+
+    def test_insert_users_on_conflict(self):
+        """Test : COPY dans la table temporaire puis INSERT ... ON CONFLICT DO NOTHING"""
+        mock_cur = MagicMock()
+        mock_cur.fetchall.return_value = [('nouveau@ecole.fr', 9)]
+        copy = mock_cur.copy.return_value.__enter__.return_value
+        rows = [(3, 'course', 'course@ecole.fr', '!'), (4, 'nouveau', 'nouveau@ecole.fr', '!')]
+
+        ids = provision_users.insert_users(mock_cur, rows)
+
+        assert ids == {'nouveau@ecole.fr': 9}
+        assert [call[0][0] for call in copy.write_row.call_args_list] == rows
+        insert_sql = mock_cur.execute.call_args_list[-1][0][0]
+        assert 'ON CONFLICT (email) DO NOTHING' in insert_sql
+        assert 'RETURNING email, id' in insert_sql
@@ -0,0 +1,122 @@
+import pytest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+from flask import Flask
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import ratelimit
+
+
+class TestRateLimit:
+    """Tests pour le limiteur de tentatives de connexion"""
+
+    @pytest.fixture
+    def app(self):
+        """Application minimale protégée par le limiteur (3 tentatives par IP, 2 par e-mail)"""
+        app = Flask(__name__)
+        limiter = ratelimit.RateLimiter(rules={'ip': (3, 3 / 60), 'email': (2, 2 / 60)})
+        app.extensions['ratelimit'] = limiter
+
+        @app.route('/login', methods=['GET', 'POST'])
+        @ratelimit.limit_attempts(email=ratelimit.form_email)
+        def login():
+            return 'page'
+
+        return app
+
+    def test_parse_rule(self):
+        """Test de la lecture d'une règle capacité/période"""
+        assert ratelimit.parse_rule('20/60') == (20, 20 / 60)
+
+    def test_memory_bucket_refill(self):
+        """Test de la consommation puis de la recharge d'un seau"""
+        store = ratelimit.MemoryStore()
+        with patch('time.monotonic', return_value=100.0):
+            assert [store.take('ip:1', 2, 1.0)[0] for _ in range(3)] == [True, True, False]
+        with patch('time.monotonic', return_value=101.0):
+            assert store.take('ip:1', 2, 1.0)[0] is True
+
+    def test_memory_store_bounded(self):
+        """Test de l'oubli des seaux les moins récemment utilisés"""
+        store = ratelimit.MemoryStore(max_keys=2)
+        for key in ('a', 'b', 'c'):
+            store.take(key, 5, 1.0)
+
+        assert list(store._buckets) == ['b', 'c']
+
+    def test_email_limit_case_insensitive(self, app):
+        """Test de la limite par e-mail (casse ignorée) et du code 429"""
+        with patch('flask_app.ratelimit.render_template', return_value='trop'):
+            client = app.test_client()
+            codes = [client.post('/login', data={'email': email}).status_code
+                     for email in ('A@x.fr', 'a@x.fr', 'a@x.fr')]
+            response = client.post('/login', data={'email': 'b@x.fr'})
+
+        assert codes == [200, 200, 429]
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '20'
+        limiter = app.extensions['ratelimit']
+        assert limiter.counters[('rejected', 'ip')] == 1
+        assert limiter.counters[('rejected', 'email')] == 1
+
+    def proxied_app(self, monkeypatch, hops):
+        """Application créée par init_app (2 tentatives par IP) avec hops mandataires de confiance"""
+        monkeypatch.setenv('TRUSTED_PROXY_HOPS', str(hops))
+        monkeypatch.setenv('LOGIN_RATE_LIMIT_IP', '2/60')
+        monkeypatch.delenv('RATE_LIMIT_STORE', raising=False)
+        app = Flask(__name__)
+        ratelimit.init_app(app)
+
+        @app.route('/login', methods=['POST'])
+        @ratelimit.limit_attempts()
+        def login():
+            return 'page'
+
+        return app
+
+    def post_from(self, client, forwarded_for):
+        """POST reçu du mandataire 10.0.0.1 pour le client forwarded_for"""
+        return client.post('/login', headers={'X-Forwarded-For': forwarded_for},
+                           environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code
+
+    def test_ip_limit_behind_proxy(self, monkeypatch):
+        """Test : derrière le mandataire, chaque client a son propre seau"""
+        client = self.proxied_app(monkeypatch, 1).test_client()
+
+        with patch('flask_app.ratelimit.render_template', return_value='trop'):
+            codes = [self.post_from(client, '203.0.113.5') for _ in range(3)]
+            other = self.post_from(client, '203.0.113.6')
+
+        assert codes == [200, 200, 429]
+        assert other == 200
+
+    def test_forwarded_for_ignored_without_trusted_proxy(self, monkeypatch):
+        """Test : sans mandataire de confiance, X-Forwarded-For ne contourne pas la limite"""
+        client = self.proxied_app(monkeypatch, 0).test_client()
+
+        with patch('flask_app.ratelimit.render_template', return_value='trop'):
+            codes = [self.post_from(client, f'203.0.113.{n}') for n in range(3)]
+
+        assert codes == [200, 200, 429]
+
+    def test_get_not_limited(self, app):
+        """Test des GET (affichage du formulaire) non comptés"""
+        client = app.test_client()
+        assert {client.get('/login').status_code for _ in range(5)} == {200}
+
+    def test_store_failure_falls_back(self, app):
+        """Test du repli en mémoire quand le stockage partagé échoue"""
+        limiter = ratelimit.RateLimiter(store=MagicMock(**{'take.side_effect': OSError()}),
+                                        rules={'ip': (1, 1 / 60)})
+        with app.app_context():
+            assert limiter.take('ip', '1.2.3.4') == 0
+            assert limiter.take('ip', '1.2.3.4') == 60
+
+        assert limiter.counters['store_errors'] == 2
+        assert 'login_rate_limit_store_errors_total 2' in limiter.metrics()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,141 @@
+import pytest
+import sys
+import os
+import datetime
+from unittest.mock import patch, MagicMock
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import model, snapshot
+
+
+BOOKS = [
+    (4, 'Le Petit Prince', 'Antoine de Saint-Exupéry', 'Conte', datetime.date(1943, 4, 6),
+     '9782070612758', None, '/static/petit-prince.jpeg', 12),
+    (2, 'Les Misérables', 'Victor Hugo', 'Roman historique', datetime.date(1862, 1, 1),
+     '9782070643028', 'Description', '/static/Livre.jpeg', 3),
+]
+LISTS = [(1, 'Classiques', 'Les incontournables', '/static/classiques.jpeg', 4),
+         (3, 'Vide', None, None, 7)]
+RELATIONS = [(1, 4), (1, 2), (1, 99)]
+NEIGHBOURS = [(2, 2, 99), (2, 1, 4), (4, 1, 2)]
+
+
+class TestSnapshot:
+    """Tests pour l'instantané binaire du catalogue"""
+
+    @pytest.fixture
+    def path(self, tmp_path):
+        path = str(tmp_path / 'catalog.snap')
+        snapshot.write_snapshot(path, BOOKS, LISTS, RELATIONS, db_version=5, neighbours=NEIGHBOURS)
+        return path
+
+    @pytest.fixture
+    def published(self, path, monkeypatch):
+        """Instantané publié via CATALOG_SNAPSHOT_PATH, cache des workers remis à zéro"""
+        monkeypatch.setenv('CATALOG_SNAPSHOT_PATH', path)
+        monkeypatch.setitem(snapshot._current, 'snapshot', None)
+        monkeypatch.setitem(snapshot._current, 'signature', None)
+        monkeypatch.setitem(snapshot._current, 'checked_at', float('-inf'))
+        monkeypatch.setitem(model._catalog, 'db_version', 5)
+        monkeypatch.setitem(model._catalog, 'ready', True)
+        return path
+
+    def test_get_book(self, path):
+        """Test de la relecture d'un livre, dates et NULL compris"""
+        current = snapshot.CatalogSnapshot(path)
+
+        book = current.get_book(4)
+
+        assert book == {
+            'id': 4, 'title': 'Le Petit Prince', 'author': 'Antoine de Saint-Exupéry',
+            'genre': 'Conte', 'publication_date': datetime.date(1943, 4, 6),
+            'isbn': '9782070612758', 'description': None, 'image_url': '/static/petit-prince.jpeg'
+        }
+        assert current.get_book(3) is None
+
+    def test_lists_and_members(self, path):
+        """Test des listes et de l'index des appartenances, les plus consultés d'abord (livres inconnus ignorés)"""
+        current = snapshot.CatalogSnapshot(path)
+
+        assert [book_list['id'] for book_list in current.get_lists()] == [3, 1]
+        assert [book['id'] for book in current.get_books_in_list(1)] == [4, 2]
+        assert current.get_books_in_list(3) == []
+        assert current.get_books_in_list(5) is None
+
+    def test_similar_books(self, path):
+        """Test des recommandations, dans l'ordre des rangs (livres inconnus ignorés)"""
+        current = snapshot.CatalogSnapshot(path)
+
+        assert [book['title'] for book in current.get_similar_books(2)] == ['Le Petit Prince']
+        assert [book['id'] for book in current.get_similar_books(4, limit=6)] == [2]
+        assert current.get_similar_books(4, limit=0) == []
+        assert current.get_similar_books(3) is None
+
+    def test_invalid_file(self, tmp_path):
+        """Test du refus d'un fichier qui n'est pas un instantané"""
+        path = tmp_path / 'catalog.snap'
+        path.write_bytes(b'\0' * 64)
+
+        with pytest.raises(Exception, match='Instantané du catalogue invalide'):
+            snapshot.CatalogSnapshot(str(path))
+
+    def test_hot_swap(self, published):
+        """Test de la bascule vers un instantané republié"""
+        first = snapshot.current()
+        snapshot.write_snapshot(published, BOOKS[:1], LISTS, RELATIONS)
+        snapshot._current['checked_at'] = float('-inf')
+
+        second = snapshot.current()
+
+        assert second is not first
+        assert second.get_book(2) is None
+        # L'ancien mapping reste lisible par les requêtes en cours
+        assert first.get_book(2)['title'] == 'Les Misérables'
+
+    def test_model_serves_from_snapshot(self, published):
+        """Test des lectures du modèle servies sans connexion"""
+        with patch('psycopg.connect') as mock_connect:
+            assert model.get_book(None, 2)['title'] == 'Les Misérables'
+            assert len(model.get_books_in_list(None, 1)) == 2
+            assert [book['id'] for book in model.get_similar_books(None, 4)] == [2]
+            mock_connect.assert_not_called()
+
+    def test_stale_snapshot_ignored(self, published, monkeypatch):
+        """Test de l'instantané écarté si le catalogue en base est plus récent, ou trop ancien"""
+        assert snapshot.current().db_version == 5
+        assert model.fresh_snapshot() is not None
+
+        # Changement commité après la construction (lu au chargement ou notifié)
+        monkeypatch.setitem(model._catalog, 'db_version', 6)
+        assert model.fresh_snapshot() is None
+
+        monkeypatch.setitem(model._catalog, 'db_version', 5)
+        monkeypatch.setenv('CATALOG_SNAPSHOT_MAX_AGE', '-1')
+        assert model.fresh_snapshot() is None
+
+    def test_snapshot_checked_against_database_before_listener(self, published, monkeypatch):
+        """Test : tant que le thread LISTEN n'est pas prêt, la version est relue en base"""
+        monkeypatch.setitem(model._catalog, 'ready', False)
+        monkeypatch.setitem(model._catalog, 'db_version', 0)
+        monkeypatch.setitem(model._version_check, 'checked_at', float('-inf'))
+        monkeypatch.setitem(model._version_check, 'version', None)
+        mock_conn = MagicMock()
+        mock_conn.__enter__.return_value = mock_conn
+        mock_cursor = mock_conn.cursor.return_value.__enter__.return_value
+
+        with patch('flask_app.model.connect', return_value=mock_conn) as mock_connect:
+            mock_cursor.fetchone.return_value = (6,)
+            assert model.fresh_snapshot() is None
+            # Version mise en cache : pas de nouvelle connexion
+            assert model.fresh_snapshot() is None
+            assert mock_connect.call_count == 1
+            mock_conn.__exit__.assert_called_once()
+
+            mock_cursor.fetchone.return_value = (5,)
+            model._version_check['checked_at'] = float('-inf')
+            assert model.fresh_snapshot() is not None
+
+        model._version_check['checked_at'] = float('-inf')
+        with patch('flask_app.model.connect', side_effect=OSError('connection refused')):
+            assert model.fresh_snapshot() is None
@@ -0,0 +1,40 @@
+import pytest
+import sys
+import os
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import startup
+
+IMPORTTIME_OUTPUT = '''import time: self [us] | cumulative | imported package
+import time:       120 |        120 | site
+import time:       300 |        300 |     jinja2.utils
+import time:      2000 |       2300 |   flask
+import time:       500 |        500 |     psycopg.pq
+import time:      4000 |       4500 |   flask_app.model
+import time:      1000 |       7800 | flask_app
+'''
+
+
+class TestStartup:
+    """Tests pour le rapport de démarrage"""
+
+    def test_parse_importtime(self):
+        """Test de l'analyse de la sortie de -X importtime"""
+        imports = startup.parse_importtime(IMPORTTIME_OUTPUT)
+
+        assert imports[0] == ('site', 120, 120, 0)
+        assert imports[1] == ('jinja2.utils', 300, 300, 2)
+        assert imports[-1] == ('flask_app', 1000, 7800, 0)
+
+    def test_heaviest_imports(self):
+        """Test du classement des imports directs de flask_app"""
+        imports = startup.parse_importtime(IMPORTTIME_OUTPUT)
+
+        result = startup.heaviest_imports(imports, top=1)
+
+        assert result == [('flask_app.model', 4000, 4500, 1)]
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -0,0 +1,110 @@
+import pytest
+import sys
+import os
+import struct
+from unittest.mock import patch, MagicMock
+
+# Ajouter le chemin du projet
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+from flask_app import stats
+
+np = pytest.importorskip('numpy')
+
+
+def binary_copy(rows, formats):
+    """Flux COPY ... (FORMAT BINARY) tel que l'envoie PostgreSQL"""
+    data = stats.COPY_SIGNATURE + struct.pack('>ii', 0, 0)
+    for row in rows:
+        data += struct.pack('>h', len(row))
+        for value, format in zip(row, formats):
+            field = struct.pack('>' + format, value)
+            data += struct.pack('>i', len(field)) + field
+    return data + struct.pack('>h', -1)
+
+
+BOOKS = [(1, 1940, 0, False, False), (2, 1940, 1, True, False),
+         (3, -1, 1, False, True), (4, 1860, 2, False, False)]
+AUTHORS = ['Albert Camus', 'George Orwell', 'Victor Hugo']
+RELATIONS = [(1, 1), (1, 2), (3, 4)]
+LISTS = [(1, 'Classiques'), (2, 'Vide'), (3, 'Romans')]
+
+
+class TestStats:
+    """Tests pour les statistiques du catalogue"""
+
+    @pytest.fixture
+    def arrays(self):
+        books = stats.parse_binary_copy(binary_copy(BOOKS, ['i', 'i', 'i', '?', '?']), stats.BOOKS_FIELDS)
+        relations = stats.parse_binary_copy(binary_copy(RELATIONS, ['i', 'i']), stats.RELATIONS_FIELDS)
+        return books, relations, AUTHORS, LISTS
+
+    def test_parse_binary_copy(self, arrays):
+        """Test de la lecture du flux binaire en tableau structuré"""
+        books = arrays[0]
+
+        assert books['id'].tolist() == [1, 2, 3, 4]
+        assert books['decade'].tolist() == [1940, 1940, -1, 1860]
+        assert books['missing_cover'].tolist() == [False, True, False, False]
+
+    def test_parse_rejects_null(self):
+        """Test du refus d'une valeur NULL (longueur -1) ou d'un flux tronqué"""
+        data = binary_copy([(1, 2)], ['i', 'i'])
+        null = data[:-10] + struct.pack('>i', -1) + b'\0' * 4 + data[-2:]
+
+        with pytest.raises(Exception, match='NULL'):
+            stats.parse_binary_copy(null, stats.RELATIONS_FIELDS)
+        with pytest.raises(Exception, match='invalide'):
+            stats.parse_binary_copy(data[:-3], stats.RELATIONS_FIELDS)
+
+    def test_compute_stats(self, arrays):
+        """Test des agrégats par liste, décennie, auteur et des fiches incomplètes"""
+        result = stats.compute_stats(*arrays)
+
+        assert result['total'] == 4
+        assert result['by_list'] == [('Classiques', 2), ('Vide', 0), ('Romans', 1)]
+        assert result['unlisted'] == 1
+        assert result['by_decade'] == [(1860, 1), (1940, 2)]
+        assert result['undated'] == 1
+        assert result['by_author'] == [('George Orwell', 2), ('Albert Camus', 1), ('Victor Hugo', 1)]
+        assert result['missing_covers'] == 1
+        assert result['missing_descriptions'] == 1
+
+    def test_cache_until_catalog_change(self, arrays, monkeypatch):
+        """Test du cache : réutilisé à version égale, recalculé après un changement"""
+        monkeypatch.setattr(stats, '_cache', {'stats': None, 'version': None, 'computed_at': float('-inf')})
+        with patch('flask_app.model.catalog_version', side_effect=[7, 7, 8]), \
+                patch('flask_app.stats.load_arrays', return_value=arrays) as mock_load:
+            first = stats.get_stats(object())
+            assert stats.get_stats(object()) is first
+            stats.get_stats(object())
+
+        assert mock_load.call_count == 2
+
+    def test_cache_ttl_without_feed(self, arrays, monkeypatch):
+        """Test du cache limité dans le temps sans notifications du catalogue"""
+        monkeypatch.setattr(stats, '_cache', {'stats': None, 'version': None, 'computed_at': float('-inf')})
+        with patch('flask_app.model.catalog_version', return_value=None), \
+                patch('flask_app.stats.load_arrays', return_value=arrays) as mock_load:
+            stats.get_stats(object())
+            stats.get_stats(object())
+            monkeypatch.setenv('STATS_CACHE_TTL', '0')
+            stats.get_stats(object())
+
+        assert mock_load.call_count == 2
+
+    def test_own_connection_closed(self, arrays, monkeypatch):
+        """Test : sans connexion fournie, celle ouverte pour le calcul est fermée"""
+        monkeypatch.setattr(stats, '_cache', {'stats': None, 'version': None, 'computed_at': float('-inf')})
+        mock_conn = MagicMock()
+        mock_conn.__enter__.return_value = mock_conn
+        with patch('flask_app.model.catalog_version', return_value=None), \
+                patch('flask_app.model.connect', return_value=mock_conn), \
+                patch('flask_app.stats.load_arrays', return_value=arrays) as mock_load:
+            stats.get_stats()
+
+        mock_load.assert_called_once_with(mock_conn)
+        mock_conn.__exit__.assert_called_once()
+
+
+if __name__ == '__main__':
+    pytest.main([__file__])
@@ -1,5 +1,7 @@
 -- Schéma PostgreSQL pour Library Management System
 -- Adapté depuis build.sql (SQLite) vers PostgreSQL
+-- Version 1 du schéma, appliquée par migrate.py sur une base vide : ne plus modifier,
+-- toute évolution passe par un fichier de infra/db/migrations/
 
 DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS book_list_relations CASCADE;
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Calcul des recommandations « Les lecteurs de cette liste consultent aussi »
+À exécuter périodiquement (cron) après l'initialisation de la base
+
+Les livres sont rapprochés par co-appartenance aux listes : matrice d'incidence
+creuse livres x listes B, co-occurrences B·Bᵀ normalisées (similarité cosinus),
+puis les TOP_K meilleurs voisins de chaque livre sont écrits dans book_neighbours.
+"""
+
+import os
+import sys
+import time
+import numpy as np
+import psycopg
+from scipy import sparse
+
+TOP_K = int(os.environ.get("RECOMMENDATIONS_TOP_K", "6"))
+# Les listes trop générales n'apportent pas de signal et font exploser B·Bᵀ
+MAX_LIST_SIZE = int(os.environ.get("RECOMMENDATIONS_MAX_LIST_SIZE", "5000"))
+# Nombre de livres traités par bloc (borne la mémoire de B·Bᵀ)
+BLOCK_SIZE = 10000
+
+
+def load_relations(cur):
+    """Charger les couples (book_id, list_id) distincts"""
+    print("Chargement des relations livres-listes...")
+    cur.execute("SELECT DISTINCT book_id, list_id FROM book_list_relations")
+    pairs = np.array(cur.fetchall(), dtype=np.int64).reshape(-1, 2)
+    print(f"✓ {len(pairs)} relations chargées")
+    return pairs
+
+
+def top_k_neighbours(pairs, k=TOP_K, max_list_size=MAX_LIST_SIZE, block_size=BLOCK_SIZE):
+    """Voisins les plus similaires de chaque livre
+
+    Retourne quatre tableaux alignés : book_id, rang, neighbour_id, score.
+    """
+    list_ids, list_index, list_sizes = np.unique(pairs[:, 1], return_inverse=True, return_counts=True)
+    pairs = pairs[list_sizes[list_index] <= max_list_size]
+    empty = (np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float32))
+    if len(pairs) == 0:
+        return empty
+
+    book_ids, book_index = np.unique(pairs[:, 0], return_inverse=True)
+    list_ids, list_index = np.unique(pairs[:, 1], return_inverse=True)
+    incidence = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.float32), (book_index, list_index)),
+        shape=(len(book_ids), len(list_ids)))
+    degree = np.asarray(incidence.sum(axis=1)).ravel()
+    incidence_t = incidence.T.tocsr()
+
+    results = []
+    for start in range(0, len(book_ids), block_size):
+        co_occurrences = (incidence[start:start + block_size] @ incidence_t).tocsr()
+        rows = np.repeat(np.arange(co_occurrences.shape[0]), np.diff(co_occurrences.indptr))
+        columns = co_occurrences.indices
+        # Un livre n'est pas son propre voisin
+        keep = columns != rows + start
+        rows, columns = rows[keep], columns[keep]
+        scores = co_occurrences.data[keep] / np.sqrt(degree[rows + start] * degree[columns])
+
+        # Tri par livre, score décroissant puis identifiant du voisin (résultat déterministe)
+        order = np.lexsort((book_ids[columns], -scores, rows))
+        rows, columns, scores = rows[order], columns[order], scores[order]
+        row_starts = np.searchsorted(rows, np.arange(co_occurrences.shape[0]))
+        ranks = np.arange(len(rows)) - row_starts[rows]
+        top = ranks < k
+        results.append((book_ids[rows[top] + start], ranks[top], book_ids[columns[top]], scores[top]))
+
+    if not results:
+        return empty
+    return tuple(np.concatenate(column) for column in zip(*results))
+
+
+def store_neighbours(cur, neighbours):
+    """Remplacer le contenu de book_neighbours (une seule transaction, COPY)"""
+    print("Écriture des recommandations...")
+    cur.execute("DELETE FROM book_neighbours")
+    with cur.copy("COPY book_neighbours (book_id, rank, neighbour_id, score) FROM STDIN") as copy:
+        for book_id, rank, neighbour_id, score in zip(*neighbours):
+            copy.write_row((int(book_id), int(rank), int(neighbour_id), float(score)))
+    print(f"✓ {len(neighbours[0])} recommandations écrites")
+
+
+def main():
+    """Fonction principale"""
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ Erreur: Variable d'environnement DATABASE_URL manquante")
+        sys.exit(1)
+
+    try:
+        with psycopg.connect(database_url) as conn:
+            with conn.cursor() as cur:
+                pairs = load_relations(cur)
+                start = time.perf_counter()
+                neighbours = top_k_neighbours(pairs)
+                print(f"✓ Similarités calculées en {time.perf_counter() - start:.2f} s")
+                store_neighbours(cur, neighbours)
+                conn.commit()
+                print("\n✅ Recommandations mises à jour")
+    except psycopg.Error as e:
+        print(f"❌ Erreur de base de données: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Migrations versionnées du schéma PostgreSQL
+Usage : python migrate.py [status]
+
+La version 1 est build_postgres.sql : exécutée sur une base vide, simplement enregistrée
+(baseline) si les tables existent déjà. Les versions suivantes sont les fichiers
+migrations/NNNN_description.sql, appliquées dans l'ordre et enregistrées dans schema_migrations.
+
+Par défaut un fichier est exécuté dans une seule transaction. Avec la directive
+`-- migrate: no-transaction` (obligatoire pour CREATE INDEX CONCURRENTLY), chaque instruction
+est exécutée seule : elles doivent alors être rejouables (IF NOT EXISTS...), car le fichier
+entier est relancé en cas d'échec. Chaque instruction est bornée par lock_timeout et
+statement_timeout ; un dépassement de lock_timeout est retenté avec une attente croissante.
+"""
+
+import os
+import re
+import sys
+import time
+import psycopg
+from psycopg import errors
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASE_SCHEMA = os.path.join(ROOT, 'build_postgres.sql')
+MIGRATIONS_DIR = os.path.join(ROOT, 'migrations')
+# Verrou consultatif : une seule exécution de migrate.py à la fois
+ADVISORY_LOCK_ID = 4_202_604
+LOCK_TIMEOUT = os.environ.get('MIGRATE_LOCK_TIMEOUT', '5s')
+STATEMENT_TIMEOUT = os.environ.get('MIGRATE_STATEMENT_TIMEOUT', '30min')
+RETRIES = int(os.environ.get('MIGRATE_RETRIES', '5'))
+
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+CONCURRENT_INDEX = re.compile(
+    r'CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.IGNORECASE)
+
+
+def list_migrations(directory=MIGRATIONS_DIR):
+    """[(version, nom, chemin)] triés, version 1 = build_postgres.sql"""
+    migrations = [(1, 'build_postgres', BASE_SCHEMA)]
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, filename)))
+    versions = [version for version, _, _ in migrations]
+    if len(set(versions)) != len(versions) or versions != sorted(versions):
+        raise Exception('Numéros de migration en double')
+    return migrations
+
+
+def is_transactional(sql):
+    return not re.search(r'^--\s*migrate:\s*no-transaction\s*$', sql, re.MULTILINE)
+
+
+def split_statements(sql):
+    """Découper un script en instructions (chaînes, identifiants, $$ et commentaires respectés)"""
+    statements, current, position = [], [], 0
+    while position < len(sql):
+        character = sql[position]
+        if sql.startswith('--', position):
+            end = sql.find('\n', position)
+            position = len(sql) if end == -1 else end
+            continue
+        if sql.startswith('/*', position):
+            end = sql.find('*/', position + 2)
+            position = len(sql) if end == -1 else end + 2
+            continue
+        if character in ("'", '"'):
+            end = position + 1
+            while end < len(sql):
+                if sql[end] == character:
+                    # Guillemet doublé : caractère échappé
+                    if sql[end + 1:end + 2] == character:
+                        end += 2
+                        continue
+                    break
+                end += 1
+            current.append(sql[position:end + 1])
+            position = end + 1
+            continue
+        dollar = re.match(r'\$(\w*)\$', sql[position:])
+        if dollar:
+            tag = dollar.group(0)
+            end = sql.find(tag, position + len(tag))
+            end = len(sql) if end == -1 else end + len(tag)
+            current.append(sql[position:end])
+            position = end
+            continue
+        if character == ';':
+            statement = ''.join(current).strip()
+            if statement:
+                statements.append(statement)
+            current = []
+        else:
+            current.append(character)
+        position += 1
+    statement = ''.join(current).strip()
+    if statement:
+        statements.append(statement)
+    return statements
+
+
+def ensure_version_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            name VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+            duration_ms INTEGER
+        )
+    """)
+
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+
+def record(conn, version, name, duration_ms=None):
+    conn.execute("INSERT INTO schema_migrations (version, name, duration_ms) VALUES (%s, %s, %s)",
+                 (version, name, duration_ms))
+
+
+def set_timeouts(conn, local=False):
+    scope = 'LOCAL ' if local else ''
+    conn.execute(f"SET {scope}lock_timeout = '{LOCK_TIMEOUT}'")
+    conn.execute(f"SET {scope}statement_timeout = '{STATEMENT_TIMEOUT}'")
+
+
+def drop_invalid_index(conn, name):
+    """Supprimer l'index `name` s'il est resté INVALID après un CONCURRENTLY interrompu"""
+    row = conn.execute("""
+        SELECT NOT indisvalid FROM pg_index
+        WHERE indexrelid = to_regclass(%s)
+    """, (name,)).fetchone()
+    if row and row[0]:
+        print(f"  index invalide {name} supprimé avant reconstruction")
+        conn.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}')
+
+
+def invalid_indexes(conn, names):
+    if not names:
+        return []
+    rows = conn.execute("""
+        SELECT indexrelid::regclass::text FROM pg_index
+        WHERE NOT indisvalid AND indexrelid = ANY(ARRAY(SELECT to_regclass(name) FROM unnest(%s::TEXT[]) AS name))
+    """, (names,)).fetchall()
+    return [row[0] for row in rows]
+
+
+def apply_migration(conn, version, name, path):
+    """Appliquer une migration (connexion en autocommit) et l'enregistrer"""
+    with open(path, encoding='utf-8') as file:
+        sql = file.read()
+    start = time.perf_counter()
+    if is_transactional(sql):
+        with conn.transaction():
+            set_timeouts(conn, local=True)
+            conn.execute(sql)
+            record(conn, version, name, round((time.perf_counter() - start) * 1000))
+        return
+    set_timeouts(conn)
+    indexes = []
+    for statement in split_statements(sql):
+        match = CONCURRENT_INDEX.search(statement)
+        if match:
+            indexes.append(match.group(1))
+            drop_invalid_index(conn, match.group(1))
+        conn.execute(statement)
+    invalid = invalid_indexes(conn, indexes)
+    if invalid:
+        raise Exception(f"Index invalides après la migration : {', '.join(invalid)}")
+    record(conn, version, name, round((time.perf_counter() - start) * 1000))
+
+
+def migrate(conn, migrations=None, retries=RETRIES):
+    """Appliquer les migrations manquantes (connexion en autocommit) ; retourne les versions appliquées"""
+    migrations = migrations or list_migrations()
+    conn.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_ID,))
+    try:
+        ensure_version_table(conn)
+        applied = applied_versions(conn)
+        if 1 not in applied and conn.execute("SELECT to_regclass('public.books')").fetchone()[0]:
+            # Base créée avant les migrations : build_postgres.sql ne doit surtout pas être rejoué
+            print("✓ Schéma existant enregistré comme version 1 (baseline)")
+            record(conn, 1, 'build_postgres (baseline)')
+            applied.add(1)
+        done = []
+        for version, name, path in migrations:
+            if version in applied:
+                continue
+            print(f"Migration {version:04d} {name}...")
+            for attempt in range(retries + 1):
+                try:
+                    apply_migration(conn, version, name, path)
+                    break
+                except errors.LockNotAvailable:
+                    if attempt == retries:
+                        raise
+                    delay = 2 ** attempt
+                    print(f"  verrou indisponible (lock_timeout {LOCK_TIMEOUT}), nouvel essai dans {delay} s")
+                    time.sleep(delay)
+            print(f"✓ Migration {version:04d} appliquée")
+            done.append(version)
+        return done
+    finally:
+        conn.execute("RESET lock_timeout")
+        conn.execute("RESET statement_timeout")
+        conn.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_ID,))
+
+
+def status(conn, migrations=None):
+    migrations = migrations or list_migrations()
+    ensure_version_table(conn)
+    applied = applied_versions(conn)
+    for version, name, _ in migrations:
+        print(f"  {'✓' if version in applied else '…'} {version:04d} {name}")
+
+
+def main(argv=None):
+    """Fonction principale"""
+    argv = sys.argv[1:] if argv is None else argv
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ Erreur: Variable d'environnement DATABASE_URL manquante")
+        sys.exit(1)
+    try:
+        with psycopg.connect(database_url, autocommit=True) as conn:
+            if argv[:1] == ['status']:
+                status(conn)
+                return
+            done = migrate(conn)
+            print(f"\n✅ Schéma à jour ({len(done)} migration(s) appliquée(s))")
+    except psycopg.Error as e:
+        print(f"❌ Erreur de base de données: {e}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+-- Notifications des changements du catalogue (LISTEN catalog_changes)
+-- Chaque worker web maintient un instantané en mémoire des listes et des appartenances
+CREATE OR REPLACE FUNCTION notify_catalog_change() RETURNS trigger AS $$
+BEGIN
+    IF TG_TABLE_NAME = 'book_list_relations' THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_notify('catalog_changes', json_build_object(
+                'table', TG_TABLE_NAME, 'op', 'DELETE',
+                'book_id', OLD.book_id, 'list_id', OLD.list_id)::text);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_notify('catalog_changes', json_build_object(
+                'table', TG_TABLE_NAME, 'op', 'INSERT',
+                'book_id', NEW.book_id, 'list_id', NEW.list_id)::text);
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', OLD.id)::text);
+    ELSE
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'id', NEW.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_notify_change ON books;
+CREATE TRIGGER books_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON books
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+DROP TRIGGER IF EXISTS book_lists_notify_change ON book_lists;
+CREATE TRIGGER book_lists_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON book_lists
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+DROP TRIGGER IF EXISTS book_list_relations_notify_change ON book_list_relations;
+CREATE TRIGGER book_list_relations_notify_change
+    AFTER INSERT OR UPDATE OR DELETE ON book_list_relations
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
@@ -0,0 +1,70 @@
+-- migrate: no-transaction
+-- Décennie de publication (facette de navigation) et index de la navigation paginée
+-- La décennie n'est pas stockée : une colonne générée réécrirait books sous verrou exclusif.
+-- Elle est calculée par book_decade(publication_date), indexée par expression ; les index
+-- sont construits sans bloquer les lectures ni les écritures du catalogue.
+CREATE OR REPLACE FUNCTION book_decade(publication_date DATE) RETURNS SMALLINT AS $$
+    SELECT ((EXTRACT(YEAR FROM publication_date)::INTEGER / 10) * 10)::SMALLINT
+$$ LANGUAGE sql IMMUTABLE;
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_publication_decade ON books(book_decade(publication_date));
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_title_id ON books(title, id);
+
+-- Agrégats des facettes (auteur, genre, décennie) tenus à jour par trigger :
+-- les compteurs du catalogue complet se lisent sans GROUP BY sur books
+CREATE TABLE IF NOT EXISTS book_facets (
+    facet VARCHAR(16) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    book_count INTEGER NOT NULL,
+    PRIMARY KEY (facet, value)
+);
+CREATE INDEX IF NOT EXISTS idx_book_facets_count ON book_facets(facet, book_count DESC, value);
+
+CREATE OR REPLACE FUNCTION refresh_book_facets() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+        AND OLD.author IS NOT DISTINCT FROM NEW.author
+        AND OLD.genre IS NOT DISTINCT FROM NEW.genre
+        AND book_decade(OLD.publication_date) IS NOT DISTINCT FROM book_decade(NEW.publication_date) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE book_facets SET book_count = book_count - 1
+        WHERE (facet, value) IN (('author', OLD.author), ('genre', OLD.genre),
+                                 ('decade', book_decade(OLD.publication_date)::TEXT));
+        DELETE FROM book_facets
+        WHERE book_count <= 0
+          AND (facet, value) IN (('author', OLD.author), ('genre', OLD.genre),
+                                 ('decade', book_decade(OLD.publication_date)::TEXT));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO book_facets (facet, value, book_count)
+        SELECT facet, value, 1
+        FROM (VALUES ('author', NEW.author), ('genre', NEW.genre),
+                     ('decade', book_decade(NEW.publication_date)::TEXT)) AS facets(facet, value)
+        WHERE value IS NOT NULL
+        ON CONFLICT (facet, value) DO UPDATE SET book_count = book_facets.book_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger et agrégats du catalogue existant en une seule instruction, donc une transaction :
+-- CREATE TRIGGER suspend les écritures sur books (pas les lectures) le temps du remplissage,
+-- aucune ne peut donc lui échapper
+DO $$
+BEGIN
+    DROP TRIGGER IF EXISTS books_refresh_facets ON books;
+    CREATE TRIGGER books_refresh_facets
+        AFTER INSERT OR UPDATE OR DELETE ON books
+        FOR EACH ROW EXECUTE FUNCTION refresh_book_facets();
+
+    DELETE FROM book_facets;
+    INSERT INTO book_facets (facet, value, book_count)
+    SELECT facet, value, COUNT(*)
+    FROM books
+    CROSS JOIN LATERAL (VALUES ('author', author), ('genre', genre),
+                               ('decade', book_decade(publication_date)::TEXT)) AS facets(facet, value)
+    WHERE value IS NOT NULL
+    GROUP BY facet, value;
+END
+$$;
@@ -0,0 +1,11 @@
+-- Recommandations précalculées par build_recommendations.py (voisins par co-appartenance aux listes)
+CREATE TABLE IF NOT EXISTS book_neighbours (
+    book_id INTEGER NOT NULL,
+    rank SMALLINT NOT NULL,
+    neighbour_id INTEGER NOT NULL,
+    score REAL NOT NULL,
+    PRIMARY KEY (book_id, rank),
+    FOREIGN KEY (book_id) REFERENCES books(id) ON DELETE CASCADE,
+    FOREIGN KEY (neighbour_id) REFERENCES books(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_book_neighbours_neighbour_id ON book_neighbours(neighbour_id);
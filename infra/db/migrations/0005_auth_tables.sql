@@ -0,0 +1,17 @@
+-- Jetons de réinitialisation émis par provision_users.py (seul le SHA-256 du jeton est stocké)
+CREATE TABLE IF NOT EXISTS password_reset_tokens (
+    token_hash CHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL,
+    FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_password_reset_tokens_user_id ON password_reset_tokens(user_id);
+
+-- Seaux du limiteur de tentatives de connexion partagés entre conteneurs (RATE_LIMIT_STORE=postgres)
+-- UNLOGGED : état jetable, sans écriture dans le WAL
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+    key VARCHAR(255) PRIMARY KEY,
+    tokens REAL NOT NULL,
+    allowed BOOLEAN NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL
+);
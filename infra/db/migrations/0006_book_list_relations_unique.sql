@@ -0,0 +1,15 @@
+-- migrate: no-transaction
+-- Une relation (liste, livre) n'existe qu'une fois ; l'index unique remplace aussi
+-- idx_book_list_relations_list_id, dont il couvre le préfixe
+
+-- Doublons supprimés avant la construction (la relation la plus ancienne est gardée)
+DELETE FROM book_list_relations AS duplicate
+USING book_list_relations AS original
+WHERE duplicate.list_id = original.list_id
+  AND duplicate.book_id = original.book_id
+  AND duplicate.id > original.id;
+
+CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_book_list_relations_list_book
+    ON book_list_relations(list_id, book_id);
+
+DROP INDEX CONCURRENTLY IF EXISTS idx_book_list_relations_list_id;
@@ -0,0 +1,6 @@
+-- migrate: no-transaction
+-- Index trigramme pour les recherches title ILIKE '%...%' (recherche et navigation par facettes)
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_title_trgm
+    ON books USING gin (title gin_trgm_ops);
@@ -0,0 +1,15 @@
+-- Date de dernière modification des livres
+-- Valeur par défaut stable : ajout de colonne sans réécriture de la table
+ALTER TABLE books ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS books_touch_updated_at ON books;
+CREATE TRIGGER books_touch_updated_at
+    BEFORE UPDATE ON books
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
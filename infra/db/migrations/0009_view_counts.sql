@@ -0,0 +1,29 @@
+-- Compteurs de consultations des livres et des listes, incrémentés par lots
+-- par les workers (voir flask_app/popularity.py)
+-- Valeur par défaut stable : ajout de colonne sans réécriture de la table
+ALTER TABLE books ADD COLUMN IF NOT EXISTS view_count BIGINT NOT NULL DEFAULT 0;
+ALTER TABLE book_lists ADD COLUMN IF NOT EXISTS view_count BIGINT NOT NULL DEFAULT 0;
+
+-- Un vidage des compteurs ne modifie que view_count : il ne doit ni notifier les workers,
+-- ni recalculer les facettes, ni toucher updated_at. Les triggers ne réagissent donc
+-- qu'aux colonnes du catalogue (à compléter si une colonne éditable est ajoutée).
+DROP TRIGGER IF EXISTS books_notify_change ON books;
+CREATE TRIGGER books_notify_change
+    AFTER INSERT OR DELETE
+        OR UPDATE OF title, author, genre, publication_date, isbn, description, image_url ON books
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS book_lists_notify_change ON book_lists;
+CREATE TRIGGER book_lists_notify_change
+    AFTER INSERT OR DELETE OR UPDATE OF list_name, description, image_url ON book_lists
+    FOR EACH ROW EXECUTE FUNCTION notify_catalog_change();
+
+DROP TRIGGER IF EXISTS books_refresh_facets ON books;
+CREATE TRIGGER books_refresh_facets
+    AFTER INSERT OR DELETE OR UPDATE OF author, genre, publication_date ON books
+    FOR EACH ROW EXECUTE FUNCTION refresh_book_facets();
+
+DROP TRIGGER IF EXISTS books_touch_updated_at ON books;
+CREATE TRIGGER books_touch_updated_at
+    BEFORE UPDATE OF title, author, genre, publication_date, isbn, description, image_url ON books
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at();
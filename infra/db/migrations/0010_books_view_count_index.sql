@@ -0,0 +1,3 @@
+-- migrate: no-transaction
+-- Tri par popularité (navigation « les plus consultés ») sans tri du catalogue complet
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_view_count ON books(view_count DESC, id);
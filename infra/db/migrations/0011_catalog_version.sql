@@ -0,0 +1,61 @@
+-- Version du catalogue, incrémentée par chaque instruction qui le modifie
+-- L'instantané binaire (flask_app/snapshot.py) enregistre la version lue dans sa transaction ;
+-- un worker lit la version au chargement de son instantané en mémoire puis la suit dans les
+-- notifications : un instantané binaire plus ancien est écarté, sans comparer d'horloges.
+-- La ligne unique est verrouillée jusqu'au COMMIT : les écritures du catalogue (rares,
+-- réservées à l'administration) sont sérialisées, pas les consultations.
+CREATE TABLE IF NOT EXISTS catalog_version (
+    id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO catalog_version (id, version) VALUES (TRUE, 0) ON CONFLICT (id) DO NOTHING;
+
+CREATE OR REPLACE FUNCTION bump_catalog_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE catalog_version SET version = version + 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger d'instruction BEFORE : les notifications des lignes de l'instruction (triggers
+-- AFTER ... FOR EACH ROW) voient déjà la nouvelle version. Mêmes colonnes que la migration 0009.
+DROP TRIGGER IF EXISTS books_bump_catalog_version ON books;
+CREATE TRIGGER books_bump_catalog_version
+    BEFORE INSERT OR DELETE
+        OR UPDATE OF title, author, genre, publication_date, isbn, description, image_url ON books
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+DROP TRIGGER IF EXISTS book_lists_bump_catalog_version ON book_lists;
+CREATE TRIGGER book_lists_bump_catalog_version
+    BEFORE INSERT OR DELETE OR UPDATE OF list_name, description, image_url ON book_lists
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+DROP TRIGGER IF EXISTS book_list_relations_bump_catalog_version ON book_list_relations;
+CREATE TRIGGER book_list_relations_bump_catalog_version
+    BEFORE INSERT OR UPDATE OR DELETE ON book_list_relations
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_catalog_version();
+
+-- Notifications : la version de l'instruction est ajoutée à chaque message
+CREATE OR REPLACE FUNCTION notify_catalog_change() RETURNS trigger AS $$
+DECLARE
+    current_version BIGINT := (SELECT version FROM catalog_version);
+BEGIN
+    IF TG_TABLE_NAME = 'book_list_relations' THEN
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            PERFORM pg_notify('catalog_changes', json_build_object(
+                'table', TG_TABLE_NAME, 'op', 'DELETE', 'version', current_version,
+                'book_id', OLD.book_id, 'list_id', OLD.list_id)::text);
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            PERFORM pg_notify('catalog_changes', json_build_object(
+                'table', TG_TABLE_NAME, 'op', 'INSERT', 'version', current_version,
+                'book_id', NEW.book_id, 'list_id', NEW.list_id)::text);
+        END IF;
+    ELSIF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'version', current_version, 'id', OLD.id)::text);
+    ELSE
+        PERFORM pg_notify('catalog_changes', json_build_object(
+            'table', TG_TABLE_NAME, 'op', TG_OP, 'version', current_version, 'id', NEW.id)::text);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
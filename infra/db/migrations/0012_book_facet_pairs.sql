@@ -0,0 +1,66 @@
+-- Compteurs croisés des facettes : pour chaque valeur d'une facette (ex. un auteur), nombre
+-- de livres par valeur des autres facettes (ses genres, ses décennies). La navigation filtrée
+-- sur une facette lit ses compteurs ici, sans GROUP BY sur books (voir model.get_facet_counts)
+CREATE TABLE IF NOT EXISTS book_facet_pairs (
+    facet VARCHAR(16) NOT NULL,
+    value VARCHAR(255) NOT NULL,
+    other_facet VARCHAR(16) NOT NULL,
+    other_value VARCHAR(255) NOT NULL,
+    book_count INTEGER NOT NULL,
+    PRIMARY KEY (facet, value, other_facet, other_value)
+);
+CREATE INDEX IF NOT EXISTS idx_book_facet_pairs_count
+    ON book_facet_pairs(facet, value, other_facet, book_count DESC, other_value);
+
+-- Couples (facette, valeur) x (autre facette, autre valeur) d'un livre
+CREATE OR REPLACE FUNCTION book_facet_pairs_of(author TEXT, genre TEXT, decade SMALLINT)
+RETURNS TABLE (facet TEXT, value TEXT, other_facet TEXT, other_value TEXT) AS $$
+    SELECT facets.facet, facets.value, others.facet, others.value
+    FROM (VALUES ('author', author), ('genre', genre), ('decade', decade::TEXT)) AS facets(facet, value)
+    JOIN (VALUES ('author', author), ('genre', genre), ('decade', decade::TEXT)) AS others(facet, value)
+        ON others.facet <> facets.facet
+    WHERE facets.value IS NOT NULL AND others.value IS NOT NULL
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION refresh_book_facet_pairs() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'UPDATE'
+        AND OLD.author IS NOT DISTINCT FROM NEW.author
+        AND OLD.genre IS NOT DISTINCT FROM NEW.genre
+        AND book_decade(OLD.publication_date) IS NOT DISTINCT FROM book_decade(NEW.publication_date) THEN
+        RETURN NULL;
+    END IF;
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        UPDATE book_facet_pairs SET book_count = book_count - 1
+        WHERE (facet, value, other_facet, other_value) IN (
+            SELECT * FROM book_facet_pairs_of(OLD.author, OLD.genre, book_decade(OLD.publication_date)));
+        DELETE FROM book_facet_pairs
+        WHERE book_count <= 0
+          AND (facet, value, other_facet, other_value) IN (
+            SELECT * FROM book_facet_pairs_of(OLD.author, OLD.genre, book_decade(OLD.publication_date)));
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO book_facet_pairs (facet, value, other_facet, other_value, book_count)
+        SELECT pairs.*, 1 FROM book_facet_pairs_of(NEW.author, NEW.genre, book_decade(NEW.publication_date)) AS pairs
+        ON CONFLICT (facet, value, other_facet, other_value)
+            DO UPDATE SET book_count = book_facet_pairs.book_count + 1;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Mêmes colonnes que books_refresh_facets (migration 0009) : un vidage des consultations
+-- ne recalcule rien
+DROP TRIGGER IF EXISTS books_refresh_facet_pairs ON books;
+CREATE TRIGGER books_refresh_facet_pairs
+    AFTER INSERT OR DELETE OR UPDATE OF author, genre, publication_date ON books
+    FOR EACH ROW EXECUTE FUNCTION refresh_book_facet_pairs();
+
+-- Compteurs du catalogue existant : CREATE TRIGGER bloque les écritures sur books jusqu'à la
+-- fin de la transaction, aucune ne peut donc échapper au remplissage
+DELETE FROM book_facet_pairs;
+INSERT INTO book_facet_pairs (facet, value, other_facet, other_value, book_count)
+SELECT pairs.facet, pairs.value, pairs.other_facet, pairs.other_value, COUNT(*)
+FROM books
+CROSS JOIN LATERAL book_facet_pairs_of(author, genre, book_decade(publication_date)) AS pairs
+GROUP BY pairs.facet, pairs.value, pairs.other_facet, pairs.other_value;
@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Pagination par clé du tri par popularité : (view_count, id) décroissants, comparables
+-- d'un bloc ((view_count, id) < (...)), remplacent l'ordre view_count DESC, id de la migration 0010
+CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_books_view_count_id ON books(view_count DESC, id DESC);
+DROP INDEX CONCURRENTLY IF EXISTS idx_books_view_count;
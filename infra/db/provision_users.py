@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Création en masse de comptes utilisateurs depuis un fichier CSV (colonnes name,email,password)
+
+Usage : python provision_users.py users.csv [--tokens-out tokens.csv] [--base-url URL]
+                                            [--failures-out failures.csv] [--workers N]
+
+Les mots de passe sont vérifiés (check_password_strength) puis hachés en parallèle sur tous
+les cœurs ; les comptes sont insérés par COPY dans une table temporaire puis un seul INSERT.
+Une ligne sans mot de passe reçoit un jeton de réinitialisation à usage unique (écrit dans
+--tokens-out) au lieu d'un hash scrypt. Les lignes en erreur sont signalées sans interrompre le lot.
+"""
+
+import argparse
+import csv
+import datetime
+import hashlib
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import psycopg
+
+from seed_postgres import LOCKED_PASSWORD, check_password_strength, hash_password
+
+# Comptes validés ensemble (une transaction par lot)
+BATCH_SIZE = 5000
+
+
+def read_users(path):
+    """Lire et valider le CSV : ([(ligne, name, email, password)], [(ligne, email, erreur)])"""
+    users, failures, seen = [], [], set()
+    with open(path, newline='', encoding='utf-8') as file:
+        # Ligne 1 : en-tête
+        for line, row in enumerate(csv.DictReader(file), start=2):
+            name = (row.get('name') or '').strip()
+            email = (row.get('email') or '').strip()
+            password = row.get('password') or ''
+            try:
+                if not name or len(name) > 32:
+                    raise Exception('Nom manquant ou trop long (32 caractères maximum)')
+                if '@' not in email or len(email) > 128:
+                    raise Exception('E-mail invalide')
+                if email in seen:
+                    raise Exception('E-mail en double dans le fichier')
+                if password:
+                    check_password_strength(password)
+            except Exception as exception:
+                failures.append((line, email, str(exception)))
+                continue
+            seen.add(email)
+            users.append((line, name, email, password))
+    return users, failures
+
+
+def existing_emails(cur, emails):
+    """E-mails déjà présents (écartés avant le hachage, coûteux)"""
+    cur.execute("SELECT email FROM users WHERE email = ANY(%s)", (list(emails),))
+    return {row[0] for row in cur.fetchall()}
+
+
+def hash_passwords(pool, passwords):
+    """Hacher en parallèle ; les mots de passe vides donnent LOCKED_PASSWORD"""
+    to_hash = [password for password in passwords if password]
+    hashes = iter(pool.map(hash_password, to_hash, chunksize=max(1, len(to_hash) // 256)))
+    return [next(hashes) if password else LOCKED_PASSWORD for password in passwords]
+
+
+def insert_users(cur, rows):
+    """COPY dans une table temporaire puis INSERT ... ON CONFLICT : {email: id} des comptes créés"""
+    cur.execute("""
+        CREATE TEMP TABLE users_staging (
+            line INTEGER, name VARCHAR(32), email VARCHAR(128), password_hash VARCHAR(128)
+        ) ON COMMIT DROP
+    """)
+    with cur.copy("COPY users_staging (line, name, email, password_hash) FROM STDIN") as copy:
+        for row in rows:
+            copy.write_row(row)
+    cur.execute("""
+        INSERT INTO users (name, email, password_hash)
+        SELECT name, email, password_hash FROM users_staging ORDER BY line
+        ON CONFLICT (email) DO NOTHING
+        RETURNING email, id
+    """)
+    return dict(cur.fetchall())
+
+
+def issue_reset_tokens(cur, user_ids, ttl_hours):
+    """Créer un jeton par utilisateur : {user_id: jeton} (la base ne garde que le SHA-256)"""
+    expires_at = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=ttl_hours)
+    tokens = {user_id: secrets.token_urlsafe(32) for user_id in user_ids}
+    with cur.copy("COPY password_reset_tokens (token_hash, user_id, expires_at) FROM STDIN") as copy:
+        for user_id, token in tokens.items():
+            copy.write_row((hashlib.sha256(token.encode()).hexdigest(), user_id, expires_at))
+    return tokens
+
+
+def provision(conn, users, workers=None, ttl_hours=72, batch_size=BATCH_SIZE):
+    """Créer les comptes par lots
+
+    Retourne (créés, [(email, jeton)], [(ligne, email, erreur)], (mots de passe hachés, durée)).
+    """
+    created, tokens, failures = 0, [], []
+    hashed, hashing_seconds = 0, 0.0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for start in range(0, len(users), batch_size):
+            batch = users[start:start + batch_size]
+            with conn.cursor() as cur:
+                taken = existing_emails(cur, [user[2] for user in batch])
+                failures.extend((line, email, 'E-mail déjà utilisé')
+                                for line, name, email, password in batch if email in taken)
+                batch = [user for user in batch if user[2] not in taken]
+
+                hashing_start = time.perf_counter()
+                hashes = hash_passwords(pool, [user[3] for user in batch])
+                hashing_seconds += time.perf_counter() - hashing_start
+                hashed += sum(1 for user in batch if user[3])
+
+                ids = insert_users(cur, [(line, name, email, password_hash) for (line, name, email, _),
+                                         password_hash in zip(batch, hashes)])
+                # Conflit apparu entre la vérification et l'insertion
+                failures.extend((line, email, 'E-mail déjà utilisé')
+                                for line, name, email, password in batch if email not in ids)
+                token_emails = [email for line, name, email, password in batch
+                                if not password and email in ids]
+                issued = issue_reset_tokens(cur, [ids[email] for email in token_emails], ttl_hours)
+                tokens.extend((email, issued[ids[email]]) for email in token_emails)
+            conn.commit()
+            created += len(ids)
+            print(f"  {min(start + batch_size, len(users))}/{len(users)} lignes traitées")
+    return created, tokens, failures, (hashed, hashing_seconds)
+
+
+def write_csv(path, header, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def main(argv=None):
+    """Fonction principale"""
+    parser = argparse.ArgumentParser(description="Création en masse d'utilisateurs depuis un CSV")
+    parser.add_argument('csv_path')
+    parser.add_argument('--tokens-out', default='reset_tokens.csv',
+                        help="CSV des jetons de réinitialisation (email,token[,url])")
+    parser.add_argument('--base-url', help="ex: https://bibliotheque.example.com (ajoute l'URL du lien)")
+    parser.add_argument('--failures-out', help="CSV des lignes refusées (ligne,email,erreur)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--token-ttl-hours', type=int, default=72)
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    arguments = parser.parse_args(argv)
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not database_url:
+        print("❌ Erreur: Variable d'environnement DATABASE_URL manquante")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    users, failures = read_users(arguments.csv_path)
+    print(f"✓ {len(users)} lignes valides, {len(failures)} refusées à la lecture")
+    try:
+        with psycopg.connect(database_url) as conn:
+            created, tokens, insert_failures, (hashed, hashing_seconds) = provision(
+                conn, users, arguments.workers, arguments.token_ttl_hours, arguments.batch_size)
+    except psycopg.Error as e:
+        print(f"❌ Erreur de base de données: {e}")
+        sys.exit(1)
+    failures.extend(insert_failures)
+    failures.sort()
+    elapsed = time.perf_counter() - start
+
+    if tokens:
+        rows = tokens
+        header = ['email', 'token']
+        if arguments.base_url:
+            base_url = arguments.base_url.rstrip('/')
+            rows = [(email, token, f"{base_url}/reset_password/{token}") for email, token in tokens]
+            header.append('url')
+        write_csv(arguments.tokens_out, header, rows)
+        print(f"✓ {len(tokens)} jetons de réinitialisation écrits dans {arguments.tokens_out}")
+    if arguments.failures_out:
+        write_csv(arguments.failures_out, ['line', 'email', 'error'], failures)
+    for line, email, error in failures[:20]:
+        print(f"  ligne {line} ({email}) : {error}")
+    if len(failures) > 20:
+        print(f"  ... et {len(failures) - 20} autres")
+
+    print(f"\n📊 Résumé:")
+    print(f"   - {created} comptes créés, {len(failures)} lignes refusées")
+    if hashing_seconds:
+        print(f"   - hachage : {hashed} mots de passe en {hashing_seconds:.1f} s"
+              f" ({hashed / hashing_seconds:.0f}/s sur {arguments.workers} processus)")
+    print(f"   - total : {elapsed:.1f} s ({created / elapsed:.0f} comptes/s)")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
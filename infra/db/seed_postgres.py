@@ -35,6 +35,9 @@ def check_password_strength(password):
         raise Exception('''Le mot de passe doit contenir au moins 
                     un chiffre, une minuscule, une majuscule et un caractère spécial''')
 
+# Hash des comptes sans mot de passe (même valeur que model.LOCKED_PASSWORD) : ne valide rien
+LOCKED_PASSWORD = '!'
+
 def hash_password(password):
     """Hashage du mot de passe avec scrypt"""
     check_password_strength(password)
@@ -62,6 +65,8 @@ def seed_book_lists(cur):
     """
     for book_list in book_lists():
         cur.execute(sql, book_list)
+    # Les identifiants sont fixés explicitement : recaler la séquence pour les listes créées ensuite
+    cur.execute("SELECT setval(pg_get_serial_sequence('book_lists', 'id'), MAX(id)) FROM book_lists")
     print(f"✓ {len(book_lists())} listes insérées")
 
 def seed_relations(cur):
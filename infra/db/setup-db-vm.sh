@@ -117,12 +117,15 @@ pip install -r requirements_db.txt
 log_info "Initialisation de la base de données..."
 export DATABASE_URL="postgresql://$DB_USER:$DB_PASSWORD@$DB_HOST:$DB_PORT/$DB_NAME"
 
-# Créer le schéma
-psql "$DATABASE_URL" -f build_postgres.sql
+# Créer ou mettre à jour le schéma (migrations versionnées, sans perte de données)
+python migrate.py
 
 # Insérer les données
 python seed_postgres.py
 
+# Calculer les recommandations (à relancer périodiquement, ex: cron quotidien)
+python build_recommendations.py
+
 # Vérification finale
 log_info "Vérification de l'installation..."
 psql "$DATABASE_URL" -c "\dt"
@@ -123,8 +123,8 @@ log_info "Vérification de l'état de l'application..."
 
 # Test de connectivité
 log_info "Test de connectivité..."
-if curl -f http://localhost:5000/ > /dev/null 2>&1; then
-    log_info "Application accessible sur http://localhost:5000"
+if curl -f http://localhost:5000/readyz > /dev/null 2>&1; then
+    log_info "Application accessible et prête sur http://localhost:5000"
 else
     log_warn " Application non accessible sur le port 5000"
 fi